@@ -0,0 +1,314 @@
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from . import spatial
+from .geocode_cache import normalize_address
+
+Coordinates = Tuple[float, float]
+
+# Configuration (overridable via environment variables)
+# Path of the index built by `python -m app.address_index build`; empty disables local geocoding
+ADDRESS_INDEX_PATH = os.getenv("ADDRESS_INDEX_PATH", "")
+
+# File layout (little-endian):
+#   header   magic, entry count, key blob size
+#   offsets  (count + 1) uint32: start of each key in the blob, plus the end
+#   coords   count x 2 int32: latitude, longitude in 1e-7 degrees (~1 cm)
+#   keys     UTF-8 keys, sorted bytewise, concatenated
+_MAGIC = b"SGADDR01"
+_HEADER = struct.Struct("<8sQQ")
+_COORDINATE_SCALE = 10 ** 7
+
+# Common abbreviations in street names, expanded so "Bahnhofstr. 1" finds "Bahnhofstrasse 1"
+_ABBREVIATIONS = {
+    "str": "strasse",
+    "str.": "strasse",
+    "av.": "avenue",
+    "ave": "avenue",
+    "ch.": "chemin",
+    "rte": "route",
+    "rte.": "route",
+    "pl.": "place",
+    "bd": "boulevard",
+    "bd.": "boulevard",
+}
+_STREET_SUFFIX = re.compile(r"(?<=\w)(str\.?)(?=\s|$)")
+# "<street> <number>[letter] [CH-]<postcode> [town]" after normalize_address
+_ADDRESS = re.compile(r"^(?P<street>.*?\D)\s*(?P<number>\d+\s?[a-z]?)\s+(?:ch-)?(?P<postcode>\d{4})(?:\s.*)?$")
+
+
+def normalize_street(street: str) -> str:
+    """
+    Lower-cased street name with abbreviations expanded ("Bahnhofstr." -> "bahnhofstrasse").
+    """
+    words = normalize_address(street).split(" ")
+    words = [_ABBREVIATIONS.get(word, word) for word in words]
+    return _STREET_SUFFIX.sub("strasse", " ".join(words))
+
+
+def address_key(street: str, number: str, postcode: str) -> str:
+    """
+    Index key of an address, e.g. "bahnhofstrasse 1a 8001". The town is left out:
+    within a postcode, street and number identify the address.
+    """
+    number = normalize_address(str(number)).replace(" ", "")
+    return f"{normalize_street(street)} {number} {str(postcode).strip()}"
+
+
+def parse_address(address: str) -> Optional[str]:
+    """
+    Index key of a free-form address like "Bahnhofstrasse 1, 8001 Zürich", or None
+    if it has no recognizable house number and postcode.
+    """
+    match = _ADDRESS.match(normalize_address(address))
+    if match is None:
+        return None
+    return address_key(match["street"], match["number"], match["postcode"])
+
+
+class AddressIndex:
+    """
+    Read-only, memory-mapped address -> coordinates index.
+
+    Opening only maps the file: nothing is parsed or copied, the OS pages in what
+    lookups touch, and all workers on a host share the same page cache. Lookups
+    are a binary search over the sorted keys (about 22 steps for the 3 million or
+    so Swiss building addresses); prefix search continues from there in key order.
+    """
+
+    def __init__(self, path: str):
+        started = time.perf_counter()
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, keys_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an address index")
+        if sys.byteorder != "little":
+            raise ValueError("Address indexes can only be read on little-endian hosts")
+        view = memoryview(self._mmap)
+        start = _HEADER.size
+        self._offsets = view[start:start + (self.count + 1) * 4].cast("I")
+        start += (self.count + 1) * 4
+        self._coordinates = view[start:start + self.count * 8].cast("i")
+        start += self.count * 8
+        self._keys = view[start:start + keys_size]
+        self.file_bytes = len(self._mmap)
+        self.load_seconds = time.perf_counter() - started
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        for view in (self._offsets, self._coordinates, self._keys):
+            view.release()
+        self._mmap.close()
+
+    def key(self, position: int) -> bytes:
+        return bytes(self._keys[self._offsets[position]:self._offsets[position + 1]])
+
+    def coordinates(self, position: int) -> Coordinates:
+        return (
+            self._coordinates[2 * position] / _COORDINATE_SCALE,
+            self._coordinates[2 * position + 1] / _COORDINATE_SCALE,
+        )
+
+    def _lower_bound(self, target: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, key: str) -> Optional[Coordinates]:
+        """
+        Coordinates of an exact index key (see address_key), or None.
+        """
+        target = key.encode("utf-8")
+        position = self._lower_bound(target)
+        if position < self.count and self.key(position) == target:
+            return self.coordinates(position)
+        return None
+
+    def lookup(self, address: str) -> Optional[Coordinates]:
+        """
+        Coordinates of a free-form address, or None if it is not in the index.
+        """
+        key = parse_address(address)
+        return self.get(key) if key is not None else None
+
+    def search(self, prefix: str, limit: int = 10) -> List[Tuple[str, float, float]]:
+        """
+        Up to limit (key, latitude, longitude) entries whose key starts with the
+        normalized prefix, in key order (e.g. "bahnhofstr 1" -> "bahnhofstrasse 1 8001", ...).
+        """
+        target = normalize_street(prefix).encode("utf-8")
+        matches = []
+        position = self._lower_bound(target)
+        while position < self.count and len(matches) < limit:
+            key = self.key(position)
+            if not key.startswith(target):
+                break
+            matches.append((key.decode("utf-8"), *self.coordinates(position)))
+            position += 1
+        return matches
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "entries": self.count,
+            "file_bytes": self.file_bytes,
+            "bytes_per_entry": round(self.file_bytes / self.count, 1) if self.count else 0.0,
+            "load_ms": round(self.load_seconds * 1000, 3),
+        }
+
+
+def build_index(entries: Iterable[Tuple[str, float, float]], path: str) -> int:
+    """
+    Writes an index of (key, latitude, longitude) entries. Of duplicate keys the first
+    one wins. The file is written next to path and renamed into place, so processes
+    that have the old index mapped keep reading it until they reopen. Returns the
+    number of entries.
+    """
+    unique = {}
+    for key, latitude, longitude in entries:
+        unique.setdefault(key.encode("utf-8"), (latitude, longitude))
+    keys = sorted(unique)
+    keys_size = sum(map(len, keys))
+    if keys_size >= 2 ** 32:
+        raise ValueError("Address keys exceed 4 GiB")
+
+    offsets = array("I", [0])
+    coordinates = array("i")
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+        latitude, longitude = unique[key]
+        coordinates.append(round(latitude * _COORDINATE_SCALE))
+        coordinates.append(round(longitude * _COORDINATE_SCALE))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        coordinates.byteswap()
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(keys), keys_size))
+        f.write(offsets.tobytes())
+        f.write(coordinates.tobytes())
+        for key in keys:
+            f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return len(keys)
+
+
+# Column names of the supported exports: (street, number, postcode, x, y, coordinate system).
+# The postcode column may hold "8001 Zürich"; the first four digits are used.
+SOURCE_LAYOUTS = {
+    # swisstopo "Amtliches Gebäudeadressverzeichnis" (official building address directory)
+    "swisstopo": ("STN_LABEL", "ADR_NUMBER", "ZIP_LABEL", "ADR_EASTING", "ADR_NORTHING", "lv95"),
+    # Federal register of buildings (GWR), entrances table
+    "gwr": ("STRNAME", "DEINR", "DPLZ4", "DKODE", "DKODN", "lv95"),
+    # Any CSV with WGS84 coordinates
+    "wgs84": ("street", "number", "postcode", "longitude", "latitude", "wgs84"),
+}
+_POSTCODE = re.compile(r"\d{4}")
+
+
+def read_source(lines: Iterable[str]) -> Iterator[Tuple[str, float, float]]:
+    """
+    Yields (key, latitude, longitude) from a CSV export in one of SOURCE_LAYOUTS
+    (detected from the header; delimiter ";", "," or tab). Rows without a house
+    number, postcode or coordinates are skipped.
+    """
+    lines = iter(lines)
+    header = next(lines, "").lstrip("\ufeff")
+    delimiter = max(";,\t", key=header.count)
+    columns = next(csv.reader([header], delimiter=delimiter))
+    for layout in SOURCE_LAYOUTS.values():
+        if all(column in columns for column in layout[:5]):
+            break
+    else:
+        raise ValueError(f"Unrecognized address export columns: {columns}")
+    street, number, postcode, x, y, system = layout
+    for row in csv.DictReader(lines, fieldnames=columns, delimiter=delimiter):
+        postcode_match = _POSTCODE.search(row.get(postcode) or "")
+        if not row.get(street) or not row.get(number) or postcode_match is None:
+            continue
+        try:
+            x_value, y_value = float(row[x]), float(row[y])
+        except (TypeError, ValueError):
+            continue
+        if system == "lv95":
+            latitude, longitude = spatial.lv95_to_wgs84(x_value, y_value)
+        else:
+            longitude, latitude = x_value, y_value
+        yield address_key(row[street], row[number], postcode_match.group()), latitude, longitude
+
+
+# Opened on first use, see get_address_index()
+_index: Optional[AddressIndex] = None
+
+
+def get_address_index() -> Optional[AddressIndex]:
+    """
+    The index at ADDRESS_INDEX_PATH, opened on first use, or None if it is not configured.
+    """
+    global _index
+    if _index is None and ADDRESS_INDEX_PATH and os.path.exists(ADDRESS_INDEX_PATH):
+        _index = AddressIndex(ADDRESS_INDEX_PATH)
+    return _index
+
+
+def set_address_index(index: Optional[AddressIndex]) -> None:
+    """
+    Replaces the process-wide index (e.g. after rebuilding it, or in tests).
+    """
+    global _index
+    _index = index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the offline address index.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Build an index from a CSV address export")
+    build.add_argument("source", help=f"CSV export ({', '.join(SOURCE_LAYOUTS)} layout)")
+    build.add_argument("--output", default=ADDRESS_INDEX_PATH or "address_index.bin")
+    lookup = subcommands.add_parser("lookup", help="Look up addresses, or key prefixes with --prefix")
+    lookup.add_argument("addresses", nargs="+")
+    lookup.add_argument("--index", default=ADDRESS_INDEX_PATH or "address_index.bin")
+    lookup.add_argument("--prefix", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        with open(args.source, encoding="utf-8-sig", newline="") as f:
+            count = build_index(read_source(f), args.output)
+        print(f"Indexed {count} addresses into {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.1f}s")
+        return
+
+    index = AddressIndex(args.index)
+    print(index.stats())
+    for address in args.addresses:
+        started = time.perf_counter()
+        result = index.search(address) if args.prefix else index.lookup(address)
+        print(f"{address!r}: {result} ({(time.perf_counter() - started) * 1e6:.1f} µs)")
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory):
+    #   python -m app.address_index build amtliches-gebaeudeadressverzeichnis_ch.csv --output address_index.bin
+    #   python -m app.address_index lookup "Bundesplatz 3, 3005 Bern" --index address_index.bin
+    main()
@@ -0,0 +1,316 @@
+import itertools
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import crud, distance, schemas, search, spatial
+from .money import to_centimes
+
+# Configuration (overridable via environment variables)
+# NumPy is required (app.distance builds on it); this only picks the PriceMatrix
+# implementation, and the pure-Python one gives identical results
+BASKET_USE_NUMPY = os.getenv("BASKET_USE_NUMPY", "1") == "1"
+# Only the most useful stores (by items covered, then distance) enter the search
+BASKET_MAX_CANDIDATE_STORES = int(os.getenv("BASKET_MAX_CANDIDATE_STORES", "40"))
+# Above this many store combinations only the greedy heuristic runs
+BASKET_EXACT_MAX_COMBINATIONS = int(os.getenv("BASKET_EXACT_MAX_COMBINATIONS", "100000"))
+
+# Cost of an item no chosen store carries, in centimes. It dominates any real
+# basket, so covering more items always beats a cheaper but incomplete basket.
+MISSING_ITEM_CENTIMES = 10 ** 9
+
+# How many search nodes are expanded between time budget checks
+_BUDGET_CHECK_INTERVAL = 256
+
+
+def numpy_enabled(use_numpy: Optional[bool] = None) -> bool:
+    return BASKET_USE_NUMPY if use_numpy is None else use_numpy
+
+
+class PriceMatrix:
+    """
+    Compact item x store matrix of the cheapest matching price in centimes
+    (MISSING_ITEM_CENTIMES where a store does not carry the item).
+
+    Columns are kept as NumPy int64 arrays when NumPy is enabled, and as lists of
+    ints otherwise; both give the same integer results.
+    """
+
+    def __init__(self, prices: List[List[int]], use_numpy: bool):
+        self.use_numpy = use_numpy
+        self.item_count = len(prices)
+        self.store_count = len(prices[0]) if prices else 0
+        if use_numpy:
+            matrix = np.array(prices, dtype=np.int64).reshape(self.item_count, self.store_count)
+            self.columns = [np.ascontiguousarray(matrix[:, store]) for store in range(self.store_count)]
+        else:
+            self.columns = [[row[store] for row in prices] for store in range(self.store_count)]
+
+    def empty(self):
+        if self.use_numpy:
+            return np.full(self.item_count, MISSING_ITEM_CENTIMES, dtype=np.int64)
+        return [MISSING_ITEM_CENTIMES] * self.item_count
+
+    def minimum(self, a, b):
+        if self.use_numpy:
+            return np.minimum(a, b)
+        return [x if x <= y else y for x, y in zip(a, b)]
+
+    def combine(self, best, store: int):
+        """
+        Cheapest price per item when store is added to a basket whose per-item prices are best.
+        """
+        return self.minimum(best, self.columns[store])
+
+    def total(self, best) -> int:
+        if self.use_numpy:
+            return int(best.sum())
+        return sum(best)
+
+    def suffix_minimums(self) -> list:
+        """
+        suffix[j] holds the cheapest price per item over stores j..n-1, used as a
+        lower bound on what adding any of those stores can still achieve.
+        """
+        suffix = [self.empty()]
+        for store in reversed(range(self.store_count)):
+            suffix.append(self.combine(suffix[-1], store))
+        suffix.reverse()
+        return suffix
+
+
+class TravelCosts:
+    """
+    Travel cost in centimes of the shortest round trip from the user's location
+    through a set of stores (exact over all visiting orders; sets have at most a
+    handful of stores). Results are memoized per set.
+
+    distances, if given, is the (n + 1) x (n + 1) matrix of metres between the
+    origin (index 0) and the locations, e.g. from DistanceService.travel_matrix;
+    otherwise straight-line distances are used.
+    """
+
+    def __init__(
+        self,
+        origin: Tuple[float, float],
+        locations: Sequence[Tuple[float, float]],
+        centimes_per_km: float,
+        distances: Optional[Sequence[Sequence[float]]] = None,
+    ):
+        if distances is None:
+            points = [origin, *locations]
+            distances = [
+                [spatial.haversine_m(*a, *b) for b in points] for a in points
+            ]
+        self._distance = distances
+        self.centimes_per_km = centimes_per_km
+        self._memo: Dict[Tuple[int, ...], Tuple[int, float]] = {(): (0, 0.0)}
+
+    def cost(self, stores: Tuple[int, ...]) -> Tuple[int, float]:
+        """
+        Returns (travel cost in centimes, round trip length in metres).
+        """
+        key = tuple(sorted(stores))
+        if key not in self._memo:
+            shortest = math.inf
+            for order in itertools.permutations(store + 1 for store in key):
+                route = (0, *order, 0)
+                length = sum(self._distance[a][b] for a, b in zip(route, route[1:]))
+                shortest = min(shortest, length)
+            self._memo[key] = (round(shortest / 1000 * self.centimes_per_km), shortest)
+        return self._memo[key]
+
+
+def _greedy(matrix: PriceMatrix, travel: TravelCosts, max_stores: int) -> Tuple[int, Tuple[int, ...]]:
+    """
+    Adds the store that lowers the total cost the most, until max_stores or no improvement.
+    """
+    chosen: Tuple[int, ...] = ()
+    best = matrix.empty()
+    cost = matrix.total(best)
+    while len(chosen) < max_stores:
+        step = None
+        for store in range(matrix.store_count):
+            if store in chosen:
+                continue
+            candidate = tuple(sorted(chosen + (store,)))
+            total = matrix.total(matrix.combine(best, store)) + travel.cost(candidate)[0]
+            if step is None or (total, candidate) < step[:2]:
+                step = (total, candidate, store)
+        if step is None or (chosen and step[0] >= cost):
+            break
+        cost, chosen = step[0], step[1]
+        best = matrix.combine(best, step[2])
+    return cost, chosen
+
+
+def _branch_and_bound(
+    matrix: PriceMatrix,
+    travel: TravelCosts,
+    max_stores: int,
+    incumbent: Tuple[int, Tuple[int, ...]],
+    deadline: float,
+) -> Tuple[Tuple[int, Tuple[int, ...]], bool]:
+    """
+    Exact search over all store sets of size 1..max_stores, pruned with a lower bound:
+    the cheapest price per item over the chosen and all later stores, plus the travel
+    cost of the chosen stores (a round trip only gets longer when stops are added).
+    Returns the best (cost, stores) and whether the search completed within the deadline.
+    """
+    suffix = matrix.suffix_minimums()
+    best = incumbent
+    expanded = 0
+
+    def visit(chosen: Tuple[int, ...], prices, start: int) -> bool:
+        nonlocal best, expanded
+        for store in range(start, matrix.store_count):
+            expanded += 1
+            if expanded % _BUDGET_CHECK_INTERVAL == 0 and time.perf_counter() > deadline:
+                return False
+            stores = chosen + (store,)
+            combined = matrix.combine(prices, store)
+            travel_cost = travel.cost(stores)[0]
+            total = matrix.total(combined) + travel_cost
+            if (total, stores) < best:
+                best = (total, stores)
+            if len(stores) < max_stores:
+                bound = matrix.total(matrix.minimum(combined, suffix[store + 1])) + travel_cost
+                # Extensions of stores sort after it, so on a tie they only win if stores does
+                if bound < best[0] or (bound == best[0] and stores < best[1]):
+                    if not visit(stores, combined, store + 1):
+                        return False
+        return True
+
+    completed = visit((), matrix.empty(), 0)
+    return best, completed
+
+
+def combinations_count(stores: int, max_stores: int) -> int:
+    return sum(math.comb(stores, size) for size in range(1, min(stores, max_stores) + 1))
+
+
+def optimize_basket(
+    db: Session,
+    request: schemas.BasketRequest,
+    use_numpy: Optional[bool] = None,
+) -> schemas.BasketResult:
+    """
+    Finds the store, or set of up to request.max_stores stores, that minimizes the
+    price of the basket plus travel (a round trip from the user's location).
+
+    Candidate prices come from one query (crud.get_basket_candidates). Each item
+    is matched by its normalized name against Promotion.product_key, and the
+    cheapest matching promotion per store wins. A greedy pass always runs first.
+    If the number of store combinations is small enough, an exact branch-and-bound
+    search follows within request.time_budget_ms. The result reports whether it is
+    proven optimal. Travel uses road distances where ROAD_DISTANCES_PATH provides
+    them (see app.distance).
+    """
+    started = time.perf_counter()
+    deadline = started + request.time_budget_ms / 1000
+    use_numpy = numpy_enabled(use_numpy)
+
+    item_keys = [search.normalize_product_name(item) for item in request.items]
+    rows = crud.get_basket_candidates(
+        db, [key for key in set(item_keys) if key], request.latitude, request.longitude, request.radius_m
+    )
+
+    # Cheapest matching promotion per (item, store)
+    offers: Dict[Tuple[int, int], tuple] = {}
+    stores: Dict[int, tuple] = {}
+    for row in rows:
+        stores[row.store_id] = row
+        price = to_centimes(row.sale_price)
+        for item, key in enumerate(item_keys):
+            if key and key in row.product_key:
+                current = offers.get((item, row.store_id))
+                if current is None or (price, row.promotion_id) < (current[0], current[1].promotion_id):
+                    offers[(item, row.store_id)] = (price, row)
+
+    available = sorted({item for item, _ in offers})
+    coverage = {store_id: sum(1 for item, s in offers if s == store_id) for store_id in stores}
+    candidates = sorted(stores, key=lambda store_id: (-coverage[store_id], stores[store_id].distance_m, store_id))
+    candidates = candidates[:BASKET_MAX_CANDIDATE_STORES]
+    # Stores carrying none of the items can only add travel, so leaving them out
+    # keeps the search exact; leaving out any other store does not
+    truncated = sum(1 for store_id in stores if coverage[store_id]) > len(candidates)
+
+    matrix = PriceMatrix(
+        [
+            [offers[(item, store_id)][0] if (item, store_id) in offers else MISSING_ITEM_CENTIMES for store_id in candidates]
+            for item in available
+        ],
+        use_numpy,
+    )
+    origin = (request.latitude, request.longitude)
+    locations = [(stores[store_id].latitude, stores[store_id].longitude) for store_id in candidates]
+    travel = TravelCosts(
+        origin,
+        locations,
+        request.cost_per_km * 100,
+        # Road distances where the table has them, computed in one vectorized step
+        distances=distance.distance_service.travel_matrix(
+            origin, [(store_id, *location) for store_id, location in zip(candidates, locations)]
+        ),
+    )
+
+    chosen: Tuple[int, ...] = ()
+    method, exact = "none", True
+    if candidates and available:
+        best = _greedy(matrix, travel, request.max_stores)
+        method, exact = "greedy", False
+        if combinations_count(len(candidates), request.max_stores) <= BASKET_EXACT_MAX_COMBINATIONS:
+            best, exact = _branch_and_bound(matrix, travel, request.max_stores, best, deadline)
+            method = "exact" if exact else "exact_timeout"
+        # The search is only exact over the candidate stores
+        exact = exact and not truncated
+        chosen = best[1]
+
+    # Assemble the basket: each item from the cheapest chosen store (lowest store ID on ties)
+    chosen_ids = [candidates[store] for store in chosen]
+    items: List[schemas.BasketItem] = []
+    items_centimes = 0
+    for item, name in enumerate(request.items):
+        choices = sorted(
+            (offers[(item, store_id)][0], store_id) for store_id in chosen_ids if (item, store_id) in offers
+        )
+        if not choices:
+            items.append(schemas.BasketItem(item=name))
+            continue
+        price, store_id = choices[0]
+        offer = offers[(item, store_id)][1]
+        items_centimes += price
+        items.append(schemas.BasketItem(
+            item=name,
+            promotion_id=offer.promotion_id,
+            product_name=offer.product_name,
+            store_id=store_id,
+            sale_price=price / 100,
+        ))
+
+    travel_centimes, travel_m = travel.cost(chosen)
+    return schemas.BasketResult(
+        stores=[
+            schemas.BasketStore(
+                store_id=store_id,
+                name=stores[store_id].store_name,
+                chain_name=stores[store_id].chain_name,
+                distance_m=round(stores[store_id].distance_m, 1),
+            )
+            for store_id in chosen_ids
+        ],
+        items=items,
+        missing_items=[item.item for item in items if item.store_id is None],
+        items_total=items_centimes / 100,
+        travel_cost=travel_centimes / 100,
+        travel_distance_m=round(travel_m, 1),
+        total_cost=(items_centimes + travel_centimes) / 100,
+        method=method,
+        exact=exact,
+        candidate_stores=len(candidates),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+    )
@@ -0,0 +1,302 @@
+import argparse
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.orm import Session
+
+from . import crud, models, search, spatial
+
+# Keys (product_key, cell) recomputed per query
+BEST_PRICE_REFRESH_CHUNK_SIZE = 500
+
+Key = Tuple[str, str]
+
+
+def _winners(db: Session, keys: List[Key], today: Optional[date]) -> Dict[Key, tuple]:
+    """
+    Cheapest active promotion for each key, ties broken by lowest promotion ID.
+    """
+    wanted = set(keys)
+    rows = (
+        db.query(
+            models.Promotion.id,
+            models.Promotion.store_id,
+            models.Promotion.product_key,
+            models.Promotion.sale_price,
+            models.Promotion.valid_until,
+            models.Store.cell,
+        )
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .filter(models.Promotion.product_key.in_({product_key for product_key, _ in wanted}))
+        .filter(models.Store.cell.in_({cell for _, cell in wanted}))
+        .filter(crud.active_promotion_filter(today))
+    )
+    winners: Dict[Key, tuple] = {}
+    for row in rows:
+        key = (row.product_key, row.cell)
+        if key not in wanted:
+            continue
+        current = winners.get(key)
+        if current is None or (row.sale_price, row.id) < (current.sale_price, current.id):
+            winners[key] = row
+    return winners
+
+
+def refresh_keys(db: Session, keys: Iterable[Key], today: Optional[date] = None) -> int:
+    """
+    Recomputes the best price of the given (product_key, cell) keys from the live
+    promotions. Only the promotions of those products in those cells are read.
+    Does not commit. Returns the number of keys that have a best price afterwards.
+
+    Winners are upserted rather than deleted and re-inserted, so transactions
+    refreshing the same keys concurrently do not fail on the primary key.
+    """
+    insert = crud.dialect_insert(db)
+    written = 0
+    for chunk in crud.chunked(sorted(set(keys)), BEST_PRICE_REFRESH_CHUNK_SIZE):
+        winners = _winners(db, chunk, today)
+        gone = [key for key in chunk if key not in winners]
+        if gone:
+            db.query(models.BestPrice).filter(
+                tuple_(models.BestPrice.product_key, models.BestPrice.cell).in_(gone)
+            ).delete(synchronize_session=False)
+        if winners:
+            stmt = insert(models.BestPrice).values([
+                {
+                    "ProductKey": product_key,
+                    "GeoCell": cell,
+                    "PromotionID": row.id,
+                    "StoreID": row.store_id,
+                    "SalePrice": row.sale_price,
+                    "ValidUntil": row.valid_until,
+                }
+                for (product_key, cell), row in winners.items()
+            ])
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[models.BestPrice.product_key, models.BestPrice.cell],
+                set_=crud.excluded_values(
+                    stmt,
+                    models.BestPrice.promotion_id,
+                    models.BestPrice.store_id,
+                    models.BestPrice.sale_price,
+                    models.BestPrice.valid_until,
+                ),
+            ))
+        written += len(winners)
+    return written
+
+
+def refresh_for_promotions(db: Session, promotions: Iterable) -> int:
+    """
+    Updates the best prices affected by inserted or changed promotions, e.g. the
+    rows returned by crud.upsert_promotions (anything with store_id and product_key).
+    """
+    promotions = list(promotions)
+    if not promotions:
+        return 0
+    cells = crud.store_cells(db, (promotion.store_id for promotion in promotions))
+    keys = {
+        (promotion.product_key, cells[promotion.store_id])
+        for promotion in promotions
+        if promotion.product_key and cells.get(promotion.store_id)
+    }
+    return refresh_keys(db, keys)
+
+
+def refresh_for_stores(db: Session, store_ids: Iterable[int]) -> int:
+    """
+    Updates the best prices affected by inserted or moved stores: their products in
+    their current cells, plus every key they were winning before (their old cells).
+    """
+    store_ids = set(store_ids)
+    if not store_ids:
+        return 0
+    keys: Set[Key] = set()
+    for ids in crud.chunked(sorted(store_ids), BEST_PRICE_REFRESH_CHUNK_SIZE):
+        keys.update(
+            db.query(models.Promotion.product_key, models.Store.cell)
+            .join(models.Store, models.Promotion.store_id == models.Store.id)
+            .filter(models.Promotion.store_id.in_(ids))
+            .filter(models.Promotion.product_key.isnot(None), models.Store.cell.isnot(None))
+            .distinct()
+        )
+        keys.update(
+            db.query(models.BestPrice.product_key, models.BestPrice.cell)
+            .filter(models.BestPrice.store_id.in_(ids))
+        )
+    return refresh_keys(db, keys)
+
+
+def expire(db: Session, today: Optional[date] = None, cells: Optional[Iterable[str]] = None) -> int:
+    """
+    Recomputes keys whose current best price has expired, optionally only in some cells.
+    Returns the number of keys recomputed. Run by the lifecycle job (app.lifecycle);
+    reads work around expired rows until then (see nearby_best_prices).
+    """
+    today = today or date.today()
+    query = db.query(models.BestPrice.product_key, models.BestPrice.cell).filter(
+        models.BestPrice.valid_until < today
+    )
+    if cells is not None:
+        query = query.filter(models.BestPrice.cell.in_(set(cells)))
+    keys = [tuple(key) for key in query]
+    if keys:
+        refresh_keys(db, keys, today)
+    return len(keys)
+
+
+def live_best_prices(db: Session, today: Optional[date] = None) -> Dict[Key, float]:
+    """
+    The best price per key computed from scratch with a GROUP BY over promotions
+    joined to stores, i.e. what the best_prices table is supposed to contain.
+    """
+    rows = (
+        db.query(models.Promotion.product_key, models.Store.cell, func.min(models.Promotion.sale_price))
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .filter(crud.active_promotion_filter(today))
+        .filter(models.Promotion.product_key.isnot(None), models.Store.cell.isnot(None))
+        .group_by(models.Promotion.product_key, models.Store.cell)
+    )
+    return {(product_key, cell): float(price) for product_key, cell, price in rows}
+
+
+def rebuild(db: Session, today: Optional[date] = None) -> int:
+    """
+    Recomputes the whole table (initial backfill or repair). Does not commit.
+    """
+    db.query(models.BestPrice).delete(synchronize_session=False)
+    return refresh_keys(db, live_best_prices(db, today).keys(), today)
+
+
+def check_consistency(db: Session, today: Optional[date] = None) -> Dict[str, List[Key]]:
+    """
+    Compares the best_prices table against the live join.
+
+    Returns the keys that are missing from the table, present but not expected
+    (e.g. expired), and present with a different price. All lists are empty when
+    the table is consistent.
+    """
+    expected = live_best_prices(db, today)
+    actual = {
+        (product_key, cell): float(price)
+        for product_key, cell, price in db.query(
+            models.BestPrice.product_key, models.BestPrice.cell, models.BestPrice.sale_price
+        )
+    }
+    return {
+        "missing": sorted(expected.keys() - actual.keys()),
+        "unexpected": sorted(actual.keys() - expected.keys()),
+        "wrong_price": sorted(key for key in expected.keys() & actual.keys() if expected[key] != actual[key]),
+    }
+
+
+def _replacements(db: Session, keys: List[Key], today: date) -> List[tuple]:
+    """
+    Live (best_price, promotion, store) rows for keys whose stored winner expired.
+    The BestPrice objects are transient and never added to the session.
+    """
+    winners = _winners(db, keys, today) if keys else {}
+    if not winners:
+        return []
+    loaded = {
+        promotion.id: (promotion, store)
+        for promotion, store in db.query(models.Promotion, models.Store)
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .filter(models.Promotion.id.in_({row.id for row in winners.values()}))
+    }
+    return [
+        (
+            models.BestPrice(
+                product_key=product_key, cell=cell, promotion_id=row.id, store_id=row.store_id,
+                sale_price=row.sale_price, valid_until=row.valid_until,
+            ),
+            *loaded[row.id],
+        )
+        for (product_key, cell), row in winners.items()
+        if row.id in loaded
+    ]
+
+
+def nearby_best_prices(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_m: float,
+    query: Optional[str] = None,
+    limit: int = 100,
+) -> List[Tuple[models.BestPrice, models.Promotion, models.Store, float]]:
+    """
+    Lowest price of each product in the geohash cells covering the radius.
+
+    Only the best_prices rows of the touched cells are read, so the cost depends on
+    the number of cells and products there, not on the size of the promotions table.
+    Because results are cell-granular, stores slightly outside radius_m (but in a
+    touched cell) can appear; distance_m is returned for each result.
+    Returns (best_price, promotion, store, distance_m) tuples ordered by product.
+
+    Read-only: rows whose winner has expired since the lifecycle job last ran are
+    skipped, and those keys are recomputed from the live promotions for this
+    response without writing them back.
+    """
+    today = date.today()
+    cells = spatial.geohash_cells_for_radius(latitude, longitude, radius_m, models.STORE_CELL_PRECISION)
+    product_filter = (
+        models.BestPrice.product_key.contains(search.normalize_product_name(query), autoescape=True) if query else None
+    )
+
+    rows = (
+        db.query(models.BestPrice, models.Promotion, models.Store)
+        .join(models.Promotion, models.BestPrice.promotion_id == models.Promotion.id)
+        .join(models.Store, models.BestPrice.store_id == models.Store.id)
+        .filter(models.BestPrice.cell.in_(cells))
+        .filter(or_(models.BestPrice.valid_until.is_(None), models.BestPrice.valid_until >= today))
+    )
+    expired = db.query(models.BestPrice.product_key, models.BestPrice.cell).filter(
+        models.BestPrice.cell.in_(cells), models.BestPrice.valid_until < today
+    )
+    if product_filter is not None:
+        rows = rows.filter(product_filter)
+        expired = expired.filter(product_filter)
+    rows = rows.all()
+    rows.extend(_replacements(db, [tuple(key) for key in expired], today))
+
+    best: Dict[str, tuple] = {}
+    for best_price, promotion, store in rows:
+        distance = spatial.haversine_m(latitude, longitude, store.latitude, store.longitude)
+        current = best.get(best_price.product_key)
+        if current is None or (best_price.sale_price, distance) < (current[0].sale_price, current[3]):
+            best[best_price.product_key] = (best_price, promotion, store, distance)
+    return [best[product_key] for product_key in sorted(best)[:limit]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the best_prices table.")
+    parser.add_argument("command", choices=("check", "rebuild", "expire"))
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {rebuild(db)} best prices")
+            db.commit()
+        elif args.command == "expire":
+            print(f"Recomputed {expire(db)} expired best prices")
+            db.commit()
+        else:
+            problems = check_consistency(db)
+            for kind, keys in problems.items():
+                print(f"{kind}: {len(keys)}")
+                for product_key, cell in keys[:20]:
+                    print(f"  {product_key!r} in {cell}")
+            if any(problems.values()):
+                raise SystemExit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory): python -m app.best_price check
+    main()
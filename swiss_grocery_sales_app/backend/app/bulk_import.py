@@ -0,0 +1,92 @@
+import argparse
+import csv
+import time
+from typing import Iterable, List
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from . import best_price, crud, schemas
+from .response_cache import response_cache
+
+# Rows per INSERT statement; large enough to amortize round-trips,
+# small enough to stay below driver parameter limits (SQLite: 32766 parameters)
+STORE_IMPORT_CHUNK_SIZE = 1000
+
+CSV_COLUMNS = ("name", "address", "latitude", "longitude", "chain_name")
+
+_store_list_adapter = TypeAdapter(List[schemas.StoreCreate])
+
+
+def parse_stores_json(data: bytes) -> List[schemas.StoreCreate]:
+    """
+    Parses and validates a JSON array of store objects.
+    Raises pydantic.ValidationError for invalid input.
+    """
+    return _store_list_adapter.validate_json(data)
+
+
+def parse_stores_csv(lines: Iterable[str]) -> List[schemas.StoreCreate]:
+    """
+    Parses and validates CSV with a header row containing the CSV_COLUMNS
+    (chain_name is optional). Raises pydantic.ValidationError for invalid rows.
+    """
+    rows = [
+        {key: value for key, value in row.items() if key in CSV_COLUMNS and value != ""}
+        for row in csv.DictReader(lines)
+    ]
+    return _store_list_adapter.validate_python(rows)
+
+
+def import_stores(db: Session, stores: List[schemas.StoreCreate], chunk_size: int = STORE_IMPORT_CHUNK_SIZE) -> schemas.BulkImportResult:
+    """
+    Upserts the stores in chunks, refreshes the best prices and cached responses
+    of new or moved stores and reports throughput.
+
+    Each chunk is committed together with its best prices, so a failure leaves no
+    stores whose best prices were not refreshed.
+    """
+    started = time.perf_counter()
+    store_ids: List[int] = []
+    for chunk in crud.chunked(stores, chunk_size):
+        chunk_ids = crud.bulk_upsert_stores(db, chunk, chunk_size=chunk_size)
+        best_price.refresh_for_stores(db, chunk_ids)
+        db.commit()
+        response_cache.invalidate_stores(chunk_ids, crud.store_cells(db, chunk_ids).values())
+        store_ids.extend(chunk_ids)
+    seconds = time.perf_counter() - started
+    return schemas.BulkImportResult(
+        received=len(stores),
+        written=len(store_ids),
+        seconds=round(seconds, 6),
+        rows_per_second=round(len(stores) / seconds, 1) if seconds > 0 else 0.0,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import stores from a JSON or CSV file.")
+    parser.add_argument("path", help="File with stores (.json array or .csv with a header row)")
+    parser.add_argument("--chunk-size", type=int, default=STORE_IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.path.endswith(".json"):
+        with open(args.path, "rb") as f:
+            stores = parse_stores_json(f.read())
+    else:
+        with open(args.path, newline="", encoding="utf-8") as f:
+            stores = parse_stores_csv(f)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        result = import_stores(db, stores, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    print(f"Imported {result.received} stores ({result.written} rows written) "
+          f"in {result.seconds:.2f}s: {result.rows_per_second:.0f} rows/s")
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory): python -m app.bulk_import stores.csv
+    main()
@@ -1,18 +1,110 @@
-from sqlalchemy.orm import Session
-from typing import Optional
+from sqlalchemy import cast, func, literal, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from collections import namedtuple
+from datetime import date
+from geoalchemy2 import Geography
 
+from . import database
+from . import distance
 from . import models
 from . import schemas
+from . import search
+from . import serialization
+from . import spatial
+
+CandidateRow = namedtuple(
+    "CandidateRow",
+    "promotion_id product_key product_name sale_price store_id store_name chain_name latitude longitude distance_m",
+)
 
 # For creating WKT Point for GeoAlchemy2
 # from geoalchemy2.shape import from_shape # If using shapely
 # from shapely.geometry import Point # If using shapely
 
-def get_store(db: Session, store_id: int) -> Optional[models.Store]:
+# Eager-loading strategies for Store.promotions
+PROMOTION_LOADERS = {
+    "joined": joinedload,     # one query with a LEFT OUTER JOIN; best for a single store
+    "selectin": selectinload, # one extra "WHERE StoreID IN (...)" query; best for lists
+}
+
+def promotions_loader(strategy: str = "joined", active_only: bool = False):
+    """
+    Loader option that eagerly loads Store.promotions with the given strategy,
+    optionally restricted in SQL to promotions that have not expired.
+    """
+    relationship = models.Store.promotions
+    if active_only:
+        relationship = relationship.and_(active_promotion_filter())
+    return PROMOTION_LOADERS[strategy](relationship)
+
+def get_store(
+    db: Session,
+    store_id: int,
+    active_only: bool = False,
+    promotions_limit: Optional[int] = None,
+    promotions_offset: int = 0,
+    load_strategy: str = "joined",
+) -> Optional[models.Store]:
+    """
+    Retrieves a store by its ID, with its promotions loaded eagerly.
+
+    Without promotions_limit, promotions are loaded in the same query (load_strategy).
+    With promotions_limit, only that page of promotions (ordered by ID) is fetched in
+    a second, bounded query, so stores with thousands of promotions stay cheap.
+    """
+    query = db.query(models.Store).filter(models.Store.id == store_id)
+    if promotions_limit is None:
+        return query.options(promotions_loader(load_strategy, active_only)).first()
+
+    db_store = query.options(noload(models.Store.promotions)).first()
+    if db_store is not None:
+        promotions = db.query(models.Promotion).filter(models.Promotion.store_id == store_id)
+        if active_only:
+            promotions = promotions.filter(active_promotion_filter())
+        page = (
+            promotions.order_by(models.Promotion.id)
+            .offset(promotions_offset)
+            .limit(promotions_limit)
+            .all()
+        )
+        set_committed_value(db_store, "promotions", page)
+    return db_store
+
+def store_promotions_query(store_id: int, active_only: bool = False, limit: Optional[int] = None, offset: int = 0):
     """
-    Retrieves a store by its ID.
+    SELECT of one store's promotions as plain rows, in serialization.PROMOTION_READ_FIELDS order.
     """
-    return db.query(models.Store).filter(models.Store.id == store_id).first()
+    stmt = select(*(getattr(models.Promotion, field) for field in serialization.PROMOTION_READ_FIELDS))
+    stmt = stmt.where(models.Promotion.store_id == store_id)
+    if active_only:
+        stmt = stmt.where(active_promotion_filter())
+    return stmt.order_by(models.Promotion.id).offset(offset).limit(limit)
+
+def get_store_rows(
+    db: Session,
+    store_id: int,
+    active_only: bool = False,
+    promotions_limit: Optional[int] = None,
+    promotions_offset: int = 0,
+) -> Optional[Tuple[tuple, list]]:
+    """
+    Like get_store, but selects only the columns of schemas.StoreRead as plain rows
+    (no ORM objects), for serialization.store_read_json.
+    Returns (store_row, promotion_rows), or None if the store does not exist.
+    """
+    store_row = db.execute(
+        select(*(getattr(models.Store, field) for field in serialization.STORE_READ_FIELDS))
+        .where(models.Store.id == store_id)
+    ).first()
+    if store_row is None:
+        return None
+    promotion_rows = db.execute(
+        store_promotions_query(store_id, active_only, promotions_limit, promotions_offset)
+    ).all()
+    return store_row, promotion_rows
 
 def create_store(db: Session, store: schemas.StoreCreate) -> models.Store:
     """
@@ -20,35 +112,386 @@ def create_store(db: Session, store: schemas.StoreCreate) -> models.Store:
     The 'geom' field is populated from latitude and longitude.
     """
 
-    # Construct WKT for the POINT geometry. SRID is handled by the column definition.
-    # Ensure longitude comes first, then latitude in POINT constructor.
-    point_wkt = f"POINT({store.longitude} {store.latitude})"
-
     db_store = models.Store(
         name=store.name,
         address=store.address,
         latitude=store.latitude,
         longitude=store.longitude,
         chain_name=store.chain_name,
-        geom=point_wkt # Pass the WKT string directly
+        geom=point_wkt(store.latitude, store.longitude) # Pass the WKT string directly
     )
     db.add(db_store)
     db.commit()
     db.refresh(db_store)
+    # A new store has no promotions; avoid a lazy load when the response is serialized
+    set_committed_value(db_store, "promotions", [])
     return db_store
 
-# Placeholder for other CRUD functions to be added later
-# def get_stores(db: Session, skip: int = 0, limit: int = 100):
-#     pass
+def point_wkt(latitude: float, longitude: float) -> str:
+    """
+    Constructs WKT for the POINT geometry. SRID is handled by the column definition.
+    Longitude comes first, then latitude in the POINT constructor.
+    """
+    return f"POINT({longitude} {latitude})"
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Splits an iterable into lists of at most `size` items without materializing it.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def dialect_insert(db: Session):
+    """
+    Returns the dialect-specific insert() construct, which supports ON CONFLICT upserts.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Upserts are not supported on the '{dialect}' dialect")
+
+def excluded_values(stmt, *attributes) -> dict:
+    """
+    Builds the SET clause of an ON CONFLICT DO UPDATE that copies the given model
+    attributes from the rejected (EXCLUDED) row.
+    """
+    return {attribute.expression.name: stmt.excluded[attribute.expression.name] for attribute in attributes}
+
+def bulk_upsert_stores(db: Session, stores: Iterable[schemas.StoreCreate], chunk_size: int = 1000) -> List[int]:
+    """
+    Inserts many stores with one multi-row INSERT per chunk. Does not commit.
 
+    Stores are matched on (name, address): an existing store gets its coordinates
+    and chain updated instead of being duplicated. Returns the IDs of the rows written.
+    """
+    insert = dialect_insert(db)
+    written: List[int] = []
+    for chunk in chunked(stores, chunk_size):
+        # ON CONFLICT cannot touch the same row twice in one statement, so the last
+        # occurrence of a (name, address) pair within a chunk wins.
+        rows = {
+            (store.name, store.address): {
+                "name": store.name,
+                "address": store.address,
+                "latitude": store.latitude,
+                "longitude": store.longitude,
+                "chain_name": store.chain_name,
+                "cell": spatial.geohash(store.latitude, store.longitude, models.STORE_CELL_PRECISION),
+                "geom": point_wkt(store.latitude, store.longitude),
+            }
+            for store in chunk
+        }
+        stmt = insert(models.Store).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Store.name, models.Store.address],
+            set_=excluded_values(
+                stmt,
+                models.Store.latitude,
+                models.Store.longitude,
+                models.Store.chain_name,
+                models.Store.cell,
+                models.Store.geom,
+            ),
+        ).returning(models.Store.id)
+        written.extend(db.execute(stmt).scalars())
+    # Core statements bypass the ORM flush: reload store locations on commit all the same
+    database.mark_written(db, models.Store)
+    return written
+
+def store_cells(db: Session, store_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Maps store IDs to their geohash cells.
+    """
+    cells: Dict[int, str] = {}
+    for ids in chunked(sorted(set(store_ids)), 1000):
+        cells.update(db.query(models.Store.id, models.Store.cell).filter(models.Store.id.in_(ids)))
+    return cells
+
+def upsert_promotions(db: Session, promotions: Sequence[schemas.PromotionCreate]) -> list:
+    """
+    Inserts or updates promotions in one INSERT ... ON CONFLICT statement, keyed on
+    (store_id, product_name, valid_until), where promotions without valid_until share
+    one key per store and product. Does not commit.
+
+    Existing rows are only rewritten (and LastUpdated only bumped) when one of the
+    price or text columns actually changed, so re-ingesting an unchanged feed costs
+    no writes. Returns (id, store_id, product_name, product_key, sale_price) rows
+    for the promotions that were inserted or changed.
+    """
+    if not promotions:
+        return []
+    # ON CONFLICT cannot touch the same row twice in one statement: last one wins
+    rows = {
+        (promotion.store_id, promotion.product_name, promotion.valid_until): {
+            **promotion.model_dump(),
+            "product_key": search.normalize_product_name(promotion.product_name),
+        }
+        for promotion in promotions
+    }
+    insert = dialect_insert(db)
+    stmt = insert(models.Promotion).values(list(rows.values()))
+    tracked = (
+        models.Promotion.sale_price,
+        models.Promotion.original_price,
+        models.Promotion.description,
+        models.Promotion.image_url,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(models.promotion_natural_key()),
+        set_={
+            **excluded_values(stmt, *tracked),
+            models.Promotion.last_updated.expression.name: func.now(),
+        },
+        where=or_(*[
+            attribute.is_distinct_from(stmt.excluded[attribute.expression.name]) for attribute in tracked
+        ]),
+    ).returning(
+        models.Promotion.id,
+        models.Promotion.store_id,
+        models.Promotion.product_name,
+        models.Promotion.product_key,
+        models.Promotion.sale_price,
+    )
+    return db.execute(stmt).all()
+
+def active_promotion_filter(today: Optional[date] = None):
+    """
+    SQL condition for promotions that have not expired yet.
+    Promotions without a valid_until date are considered open-ended.
+    """
+    today = today or date.today()
+    return or_(models.Promotion.valid_until.is_(None), models.Promotion.valid_until >= today)
+
+def get_nearby_promotions(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_m: float,
+    query: Optional[str] = None,
+    limit: int = 50,
+) -> List[Tuple[models.Promotion, models.Store, float]]:
+    """
+    Finds the cheapest active promotions at stores within radius_m of a point.
+
+    Returns (promotion, store, distance_m) tuples ordered by sale price, then distance.
+    On PostgreSQL this is a single ST_DWithin query over the geography GiST index,
+    unless NEARBY_USE_DISTANCE_INDEX is set; otherwise the stores in range come from
+    the in-memory store locations (app.distance) and only their promotions are queried.
+    """
+    if db.get_bind().dialect.name == "postgresql" and not distance.NEARBY_USE_DISTANCE_INDEX:
+        return _get_nearby_promotions_postgis(db, latitude, longitude, radius_m, query, limit)
+    return _get_nearby_promotions_indexed(db, latitude, longitude, radius_m, query, limit)
+
+def _get_nearby_promotions_postgis(db, latitude, longitude, radius_m, query, limit):
+    user_point = func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326)
+    user_geography = cast(user_point, Geography(srid=4326))
+    store_geography = models.store_geography()
+    distance = func.ST_Distance(store_geography, user_geography)
+
+    db_query = (
+        db.query(models.Promotion, models.Store, distance.label("distance_m"))
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .filter(func.ST_DWithin(store_geography, user_geography, radius_m))
+        .filter(active_promotion_filter())
+    )
+    if query:
+        db_query = db_query.filter(models.Promotion.product_name.icontains(query, autoescape=True))
+    rows = db_query.order_by(models.Promotion.sale_price, distance).limit(limit).all()
+    return [(promotion, store, float(distance_m)) for promotion, store, distance_m in rows]
+
+def _get_nearby_promotions_indexed(db, latitude, longitude, radius_m, query, limit):
+    distances = dict(distance.distance_service.locations(db).within(latitude, longitude, radius_m))
+    if not distances:
+        return []
+
+    db_query = (
+        db.query(models.Promotion, models.Store)
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .filter(models.Promotion.store_id.in_(distances.keys()))
+        .filter(active_promotion_filter())
+    )
+    if query:
+        db_query = db_query.filter(models.Promotion.product_name.icontains(query, autoescape=True))
+    rows = db_query.order_by(models.Promotion.sale_price, models.Promotion.id).limit(limit).all()
+    if len(rows) == limit:
+        # Distance breaks price ties, and SQL does not know it: fetch every promotion
+        # at the last price so the closest ones are kept
+        last_price = rows[-1][0].sale_price
+        rows = [row for row in rows if row[0].sale_price < last_price]
+        rows.extend(db_query.filter(models.Promotion.sale_price == last_price))
+    rows = [(promotion, store, distances[store.id]) for promotion, store in rows]
+    rows.sort(key=lambda row: (row[0].sale_price, row[2]))
+    return rows[:limit]
+
+def get_basket_candidates(
+    db: Session,
+    product_keys: Sequence[str],
+    latitude: float,
+    longitude: float,
+    radius_m: float,
+) -> List[CandidateRow]:
+    """
+    Active promotions whose product key contains one of product_keys, at stores within
+    radius_m, in a single query. Returns rows with promotion_id, product_key,
+    product_name, sale_price, store_id, store_name, chain_name, latitude, longitude
+    and distance_m.
+    """
+    if not product_keys:
+        return []
+    columns = [
+        models.Promotion.id.label("promotion_id"),
+        models.Promotion.product_key,
+        models.Promotion.product_name,
+        models.Promotion.sale_price,
+        models.Store.id.label("store_id"),
+        models.Store.name.label("store_name"),
+        models.Store.chain_name,
+        models.Store.latitude,
+        models.Store.longitude,
+    ]
+    stmt = (
+        select(*columns)
+        .join(models.Store, models.Promotion.store_id == models.Store.id)
+        .where(active_promotion_filter())
+        .where(or_(*(models.Promotion.product_key.contains(key, autoescape=True) for key in product_keys)))
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        user_geography = cast(func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326), Geography(srid=4326))
+        stmt = stmt.where(func.ST_DWithin(models.store_geography(), user_geography, radius_m))
+    else:
+        min_lat, min_lon, max_lat, max_lon = spatial.bounding_box(latitude, longitude, radius_m)
+        stmt = stmt.where(
+            models.Store.latitude.between(min_lat, max_lat),
+            models.Store.longitude.between(min_lon, max_lon),
+        )
+
+    rows = []
+    for row in db.execute(stmt):
+        distance = spatial.haversine_m(latitude, longitude, row.latitude, row.longitude)
+        if distance <= radius_m:
+            rows.append(CandidateRow(*row, distance))
+    return rows
+
+def get_stores(
+    db: Session,
+    chain_name: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    include_promotions: bool = False,
+) -> List[models.Store]:
+    """
+    Lists stores ordered by ID using keyset pagination: pass the last ID of the
+    previous page as after_id. Deep pages cost the same as the first one, since the
+    query seeks into the (ChainName, StoreID) / StoreID index instead of skipping rows.
+    With include_promotions, active promotions are loaded with one extra SELECT ... IN query.
+    """
+    query = db.query(models.Store)
+    if chain_name is not None:
+        query = query.filter(models.Store.chain_name == chain_name)
+    if after_id is not None:
+        query = query.filter(models.Store.id > after_id)
+    if include_promotions:
+        query = query.options(promotions_loader("selectin", active_only=True))
+    else:
+        query = query.options(noload(models.Store.promotions))
+    return query.order_by(models.Store.id).limit(limit).all()
+
+def get_promotions(
+    db: Session,
+    product: Optional[str] = None,
+    chain_name: Optional[str] = None,
+    after: Optional[Tuple[float, int]] = None,
+    limit: int = 50,
+) -> List[models.Promotion]:
+    """
+    Lists active promotions cheapest first, ordered by (sale_price, id) with keyset
+    pagination: pass the (sale_price, id) of the last item of the previous page as after.
+    """
+    query = db.query(models.Promotion).filter(active_promotion_filter())
+    if product:
+        query = query.filter(models.Promotion.product_name.icontains(product, autoescape=True))
+    if chain_name is not None:
+        query = query.join(models.Store, models.Promotion.store_id == models.Store.id).filter(
+            models.Store.chain_name == chain_name
+        )
+    if after is not None:
+        query = query.filter(tuple_(models.Promotion.sale_price, models.Promotion.id) > tuple_(*after))
+    return query.order_by(models.Promotion.sale_price, models.Promotion.id).limit(limit).all()
+
+def search_promotions(
+    db: Session,
+    query: str,
+    limit: int = 50,
+    threshold: float = search.SEARCH_SIMILARITY_THRESHOLD,
+) -> List[Tuple[models.Promotion, float]]:
+    """
+    Fuzzy search over active promotions' product names and descriptions.
+
+    Returns (promotion, score) pairs ranked by similarity, then by price. PostgreSQL
+    uses the pg_trgm GIN indexes; other databases use an in-memory trigram index.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_promotions_trgm(db, query, limit, threshold)
+    return _search_promotions_inverted_index(db, query, limit, threshold)
+
+def _search_promotions_trgm(db, query, limit, threshold):
+    # The <% operator (index-accelerated) compares against this per-transaction threshold
+    db.execute(select(func.set_config("pg_trgm.word_similarity_threshold", str(threshold), True)))
+    score = func.greatest(
+        func.word_similarity(query, models.Promotion.product_name),
+        search.DESCRIPTION_WEIGHT * func.word_similarity(query, func.coalesce(models.Promotion.description, "")),
+    )
+    rows = (
+        db.query(models.Promotion, score.label("score"))
+        .filter(or_(
+            literal(query).op("<%")(models.Promotion.product_name),
+            literal(query).op("<%")(models.Promotion.description),
+        ))
+        .filter(score >= threshold)
+        .filter(active_promotion_filter())
+        .order_by(score.desc(), models.Promotion.sale_price, models.Promotion.id)
+        .limit(limit)
+        .all()
+    )
+    return [(promotion, float(score)) for promotion, score in rows]
+
+# ORM writes to promotions rebuild the search index once committed; Core upserts
+# invalidate it themselves after their commit (ingest.ingest_promotions)
+database.after_commit_of(models.Promotion, search.promotion_index.invalidate)
+
+def _search_promotions_inverted_index(db, query, limit, threshold):
+    index = search.promotion_index.get(
+        db.get_bind(),
+        lambda: db.query(models.Promotion.id, models.Promotion.product_name, models.Promotion.description)
+        .filter(active_promotion_filter()),
+    )
+    scores = dict(index.search(query, threshold))
+    if not scores:
+        return []
+    # Filtered again: promotions may have expired or been archived since the index was built
+    promotions = (
+        db.query(models.Promotion)
+        .filter(models.Promotion.id.in_(scores.keys()))
+        .filter(active_promotion_filter())
+        .all()
+    )
+    promotions.sort(key=lambda promotion: (-scores[promotion.id], promotion.sale_price, promotion.id))
+    return [(promotion, scores[promotion.id]) for promotion in promotions[:limit]]
+
+# Placeholder for other CRUD functions to be added later
 # def update_store(db: Session, store_id: int, store_update: schemas.StoreUpdate):
 #     pass
 
 # def delete_store(db: Session, store_id: int):
 #     pass
 
-# def create_promotion(db: Session, promotion: schemas.PromotionCreate):
-#     pass
-
 # def get_promotions_for_store(db: Session, store_id: int, skip: int = 0, limit: int = 100):
 #     pass
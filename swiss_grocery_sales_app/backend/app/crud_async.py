@@ -0,0 +1,129 @@
+# Async counterparts of the request-path functions in app.crud, for use with
+# database.get_async_db when DB_ASYNC is enabled. They mirror the synchronous
+# versions query for query.
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import noload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import models
+from . import schemas
+from . import serialization
+from .crud import active_promotion_filter, point_wkt, promotions_loader, store_promotions_query
+
+
+async def get_store(
+    db: AsyncSession,
+    store_id: int,
+    active_only: bool = False,
+    promotions_limit: Optional[int] = None,
+    promotions_offset: int = 0,
+    load_strategy: str = "joined",
+) -> Optional[models.Store]:
+    """
+    Retrieves a store by its ID, with its promotions loaded eagerly (see crud.get_store).
+    """
+    stmt = select(models.Store).where(models.Store.id == store_id)
+    if promotions_limit is None:
+        result = await db.execute(stmt.options(promotions_loader(load_strategy, active_only)))
+        return result.unique().scalars().first()
+
+    db_store = (await db.execute(stmt.options(noload(models.Store.promotions)))).scalars().first()
+    if db_store is not None:
+        promotions = select(models.Promotion).where(models.Promotion.store_id == store_id)
+        if active_only:
+            promotions = promotions.where(active_promotion_filter())
+        page = await db.execute(
+            promotions.order_by(models.Promotion.id).offset(promotions_offset).limit(promotions_limit)
+        )
+        set_committed_value(db_store, "promotions", list(page.scalars()))
+    return db_store
+
+
+async def get_store_rows(
+    db: AsyncSession,
+    store_id: int,
+    active_only: bool = False,
+    promotions_limit: Optional[int] = None,
+    promotions_offset: int = 0,
+) -> Optional[Tuple[tuple, list]]:
+    """
+    Selects a store and a page of its promotions as plain rows (see crud.get_store_rows).
+    """
+    store_row = (await db.execute(
+        select(*(getattr(models.Store, field) for field in serialization.STORE_READ_FIELDS))
+        .where(models.Store.id == store_id)
+    )).first()
+    if store_row is None:
+        return None
+    promotion_rows = (await db.execute(
+        store_promotions_query(store_id, active_only, promotions_limit, promotions_offset)
+    )).all()
+    return store_row, promotion_rows
+
+
+async def create_store(db: AsyncSession, store: schemas.StoreCreate) -> models.Store:
+    """
+    Creates a new store in the database (see crud.create_store).
+    """
+    db_store = models.Store(
+        name=store.name,
+        address=store.address,
+        latitude=store.latitude,
+        longitude=store.longitude,
+        chain_name=store.chain_name,
+        geom=point_wkt(store.latitude, store.longitude),
+    )
+    db.add(db_store)
+    await db.commit()
+    await db.refresh(db_store)
+    set_committed_value(db_store, "promotions", [])
+    return db_store
+
+
+async def get_stores(
+    db: AsyncSession,
+    chain_name: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    include_promotions: bool = False,
+) -> List[models.Store]:
+    """
+    Lists stores ordered by ID with keyset pagination (see crud.get_stores).
+    """
+    stmt = select(models.Store)
+    if chain_name is not None:
+        stmt = stmt.where(models.Store.chain_name == chain_name)
+    if after_id is not None:
+        stmt = stmt.where(models.Store.id > after_id)
+    if include_promotions:
+        stmt = stmt.options(promotions_loader("selectin", active_only=True))
+    else:
+        stmt = stmt.options(noload(models.Store.promotions))
+    result = await db.execute(stmt.order_by(models.Store.id).limit(limit))
+    return list(result.scalars())
+
+
+async def get_promotions(
+    db: AsyncSession,
+    product: Optional[str] = None,
+    chain_name: Optional[str] = None,
+    after: Optional[Tuple[float, int]] = None,
+    limit: int = 50,
+) -> List[models.Promotion]:
+    """
+    Lists active promotions cheapest first with keyset pagination (see crud.get_promotions).
+    """
+    stmt = select(models.Promotion).where(active_promotion_filter())
+    if product:
+        stmt = stmt.where(models.Promotion.product_name.icontains(product, autoescape=True))
+    if chain_name is not None:
+        stmt = stmt.join(models.Store, models.Promotion.store_id == models.Store.id).where(
+            models.Store.chain_name == chain_name
+        )
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Promotion.sale_price, models.Promotion.id) > tuple_(*after))
+    result = await db.execute(stmt.order_by(models.Promotion.sale_price, models.Promotion.id).limit(limit))
+    return list(result.scalars())
@@ -0,0 +1,497 @@
+import argparse
+import csv
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import database, models, spatial
+
+logger = logging.getLogger(__name__)
+
+# Configuration (overridable via environment variables)
+# Store locations are reloaded this often at the latest, so writes made by other
+# worker processes show up; writes in this process reload them right away
+DISTANCE_INDEX_TTL_S = float(os.getenv("DISTANCE_INDEX_TTL_S", "60"))
+# Below this many stores a vectorized scan over all of them beats walking the tree
+DISTANCE_TREE_MIN_STORES = int(os.getenv("DISTANCE_TREE_MIN_STORES", "2000"))
+# Road distance table built by `python -m app.distance build-roads`; empty disables it
+ROAD_DISTANCES_PATH = os.getenv("ROAD_DISTANCES_PATH", "")
+# Straight-line distances are multiplied by this when mixed with road distances,
+# so pairs missing from the table are not favoured (Swiss road networks average about 1.3)
+ROAD_DETOUR_FACTOR = float(os.getenv("ROAD_DETOUR_FACTOR", "1.3"))
+# Serve GET /api/v1/promotions/nearby from the in-memory index on PostgreSQL too,
+# instead of ST_DWithin/ST_Distance (other databases always use it)
+NEARBY_USE_DISTANCE_INDEX = os.getenv("NEARBY_USE_DISTANCE_INDEX", "0") == "1"
+
+# Points per KD-tree leaf; leaves are scanned with one vectorized distance computation
+_LEAF_SIZE = 32
+
+
+def haversine_m_array(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in metres from one point to arrays of points (see spatial.haversine_m).
+    """
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(latitudes)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(longitudes - longitude)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * spatial.EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def haversine_matrix_m(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Pairwise great-circle distances in metres between points, as an n x n array.
+    """
+    phi = np.radians(latitudes)
+    lam = np.radians(longitudes)
+    d_phi = phi[None, :] - phi[:, None]
+    d_lambda = lam[None, :] - lam[:, None]
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi)[:, None] * np.cos(phi)[None, :] * np.sin(d_lambda / 2) ** 2
+    return 2 * spatial.EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def unit_vectors(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Points on the unit sphere (n x 3). The straight-line (chord) distance between two
+    of them grows with the great-circle distance, so nearest neighbours in 3D are the
+    nearest stores on Earth, without the distortion of treating degrees as planar.
+    """
+    phi = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lam = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)))
+
+
+def chord_for_distance(distance_m: float) -> float:
+    """
+    Chord length on the unit sphere of a great-circle distance.
+    """
+    return 2 * math.sin(min(distance_m / spatial.EARTH_RADIUS_M, math.pi) / 2)
+
+
+class KDTree:
+    """
+    Static k-d tree over 3D points, stored in flat arrays.
+
+    Points are reordered so every node covers a contiguous slice; a node keeps the
+    bounding box of its points, and queries skip nodes whose box is farther than
+    the current bound. Leaves are compared in one vectorized step.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = _LEAF_SIZE):
+        self.leaf_size = leaf_size
+        order = np.arange(len(points))
+        # Per node: slice bounds, children (-1 for leaves) and bounding box
+        self._bounds: List[Tuple[int, int]] = []
+        self._children: List[Tuple[int, int]] = []
+        self._boxes: List[Tuple[Tuple[float, ...], Tuple[float, ...]]] = []
+        if len(points):
+            self._build(points, order, 0, len(points))
+        self.order = order
+        self.points = np.ascontiguousarray(points[order])
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _build(self, points: np.ndarray, order: np.ndarray, start: int, end: int) -> int:
+        node = len(self._bounds)
+        block = points[order[start:end]]
+        low, high = block.min(axis=0), block.max(axis=0)
+        self._bounds.append((start, end))
+        self._children.append((-1, -1))
+        self._boxes.append((tuple(low.tolist()), tuple(high.tolist())))
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(high - low))
+            middle = (end - start) // 2
+            order[start:end] = order[start:end][np.argpartition(block[:, axis], middle)]
+            left = self._build(points, order, start, start + middle)
+            right = self._build(points, order, start + middle, end)
+            self._children[node] = (left, right)
+        return node
+
+    def _min_distance2(self, node: int, point: Tuple[float, float, float]) -> float:
+        low, high = self._boxes[node]
+        total = 0.0
+        for value, lo, hi in zip(point, low, high):
+            if value < lo:
+                total += (lo - value) ** 2
+            elif value > hi:
+                total += (value - hi) ** 2
+        return total
+
+    def nearest(self, point: Sequence[float], k: int, max_chord: float = math.inf) -> np.ndarray:
+        """
+        Positions (into the original points) of up to k points nearest to point,
+        within max_chord, nearest first.
+        """
+        if not self._bounds or k <= 0:
+            return np.empty(0, dtype=np.int64)
+        point = tuple(float(value) for value in point)
+        query = np.array(point)
+        bound2 = max_chord ** 2
+        best_d2 = np.empty(0)
+        best = np.empty(0, dtype=np.int64)
+        heap = [(self._min_distance2(0, point), 0)]
+        while heap:
+            min_d2, node = heapq.heappop(heap)
+            if min_d2 > bound2:
+                break
+            left, right = self._children[node]
+            if left >= 0:
+                for child in (left, right):
+                    child_d2 = self._min_distance2(child, point)
+                    if child_d2 <= bound2:
+                        heapq.heappush(heap, (child_d2, child))
+                continue
+            start, end = self._bounds[node]
+            d2 = ((self.points[start:end] - query) ** 2).sum(axis=1)
+            keep = d2 <= bound2
+            best_d2 = np.concatenate((best_d2, d2[keep]))
+            best = np.concatenate((best, np.arange(start, end)[keep]))
+            if len(best) >= k:
+                top = np.argpartition(best_d2, k - 1)[:k]
+                best_d2, best = best_d2[top], best[top]
+                bound2 = min(bound2, float(best_d2.max()))
+        return self.order[best[np.argsort(best_d2, kind="stable")]]
+
+    def within(self, point: Sequence[float], max_chord: float) -> np.ndarray:
+        """
+        Positions (into the original points) of all points within max_chord, in no particular order.
+        """
+        if not self._bounds:
+            return np.empty(0, dtype=np.int64)
+        point = tuple(float(value) for value in point)
+        query = np.array(point)
+        bound2 = max_chord ** 2
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._min_distance2(node, point) > bound2:
+                continue
+            left, right = self._children[node]
+            if left >= 0:
+                stack.extend((left, right))
+                continue
+            start, end = self._bounds[node]
+            d2 = ((self.points[start:end] - query) ** 2).sum(axis=1)
+            found.append(np.arange(start, end)[d2 <= bound2])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return self.order[np.concatenate(found)]
+
+
+class StoreLocations:
+    """
+    Snapshot of all store coordinates as NumPy arrays, with nearest-store and
+    radius queries. Distances are haversine metres, like spatial.haversine_m.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, float, float]], tree_min_stores: int = DISTANCE_TREE_MIN_STORES):
+        rows = list(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.latitudes = np.array([row[1] for row in rows], dtype=np.float64)
+        self.longitudes = np.array([row[2] for row in rows], dtype=np.float64)
+        self._positions: Dict[int, int] = {store_id: position for position, store_id in enumerate(self.ids.tolist())}
+        self.tree = KDTree(unit_vectors(self.latitudes, self.longitudes)) if len(rows) >= tree_min_stores else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, store_id: int) -> bool:
+        return store_id in self._positions
+
+    def _results(self, latitude: float, longitude: float, positions: np.ndarray, radius_m: float) -> List[Tuple[int, float]]:
+        distances = haversine_m_array(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        keep = distances <= radius_m
+        positions, distances = positions[keep], distances[keep]
+        order = np.lexsort((self.ids[positions], distances))
+        return list(zip(self.ids[positions][order].tolist(), distances[order].tolist()))
+
+    def distances(self, latitude: float, longitude: float) -> np.ndarray:
+        """
+        Distance in metres from the point to every store, in the order of self.ids.
+        """
+        return haversine_m_array(latitude, longitude, self.latitudes, self.longitudes)
+
+    def within(self, latitude: float, longitude: float, radius_m: float) -> List[Tuple[int, float]]:
+        """
+        (store_id, distance_m) of every store within radius_m, nearest first.
+        """
+        if self.tree is None:
+            positions = np.arange(len(self.ids))
+        else:
+            # A hair of slack so float rounding in the chord never drops a store on the circle
+            point = unit_vectors([latitude], [longitude])[0]
+            positions = self.tree.within(point, chord_for_distance(radius_m) * (1 + 1e-9))
+        return self._results(latitude, longitude, positions, radius_m)
+
+    def nearest(self, latitude: float, longitude: float, k: int, radius_m: float = math.inf) -> List[Tuple[int, float]]:
+        """
+        (store_id, distance_m) of the k stores nearest to the point (optionally within radius_m), nearest first.
+        """
+        if k <= 0 or not len(self.ids):
+            return []
+        if self.tree is None:
+            distances = self.distances(latitude, longitude)
+            positions = np.arange(len(self.ids))
+            if k < len(positions):
+                positions = np.argpartition(distances, k - 1)[:k]
+        else:
+            point = unit_vectors([latitude], [longitude])[0]
+            positions = self.tree.nearest(point, k, chord_for_distance(radius_m) * (1 + 1e-9))
+        return self._results(latitude, longitude, positions, radius_m)
+
+
+class RoadDistances:
+    """
+    Precomputed road distances in metres from a local .npz file: between stores, and
+    from the centre of a user's geohash cell to stores. Unknown pairs are NaN.
+    Built offline from a routing engine's distance table with `build-roads`.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.store_ids = data["store_ids"]
+            self.store_m = data["store_m"]
+            self.cells = data["cells"]
+            self.cell_m = data["cell_m"]
+            self.cell_precision = int(data["cell_precision"])
+        self.path = path
+        self._stores = {store_id: position for position, store_id in enumerate(self.store_ids.tolist())}
+        self._cells = {cell: position for position, cell in enumerate(self.cells.tolist())}
+
+    def matrix(self, origin: Tuple[float, float], store_ids: Sequence[int]) -> np.ndarray:
+        """
+        (n + 1) x (n + 1) road distances between the origin (row and column 0) and
+        the stores; NaN where the table has no value.
+        """
+        n = len(store_ids)
+        result = np.full((n + 1, n + 1), np.nan)
+        positions = np.array([self._stores.get(store_id, -1) for store_id in store_ids], dtype=np.int64)
+        known = np.flatnonzero(positions >= 0)
+        if len(known):
+            result[np.ix_(known + 1, known + 1)] = self.store_m[np.ix_(positions[known], positions[known])]
+        cell = self._cells.get(spatial.geohash(*origin, precision=self.cell_precision))
+        if cell is not None and len(known):
+            # The table holds one direction; the way back is assumed to be as long
+            result[0, known + 1] = self.cell_m[cell, positions[known]]
+            result[known + 1, 0] = self.cell_m[cell, positions[known]]
+        result[0, 0] = 0.0
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "stores": len(self.store_ids),
+            "cells": len(self.cells),
+            "cell_precision": self.cell_precision,
+            "known_store_pairs": int(np.count_nonzero(~np.isnan(self.store_m))),
+            "known_cell_pairs": int(np.count_nonzero(~np.isnan(self.cell_m))),
+        }
+
+
+def build_road_distances(rows: Iterable[Tuple[str, int, float]], path: str, cell_precision: int = 6) -> dict:
+    """
+    Writes a road distance file from (origin, store_id, distance_m) rows, where origin
+    is "store:<id>" or "cell:<geohash>" (the tags used by the response cache).
+    Returns the stats of the written table.
+    """
+    store_pairs: Dict[Tuple[int, int], float] = {}
+    cell_pairs: Dict[Tuple[str, int], float] = {}
+    for origin, store_id, distance_m in rows:
+        kind, _, value = origin.partition(":")
+        if kind == "store":
+            store_pairs[(int(value), int(store_id))] = float(distance_m)
+        elif kind == "cell" and len(value) == cell_precision:
+            cell_pairs[(value, int(store_id))] = float(distance_m)
+        else:
+            raise ValueError(f"Unsupported origin {origin!r}: expected store:<id> or cell:<{cell_precision}-character geohash>")
+
+    store_ids = sorted({store_id for pair in store_pairs for store_id in pair} | {store_id for _, store_id in cell_pairs})
+    stores = {store_id: position for position, store_id in enumerate(store_ids)}
+    cells = sorted({cell for cell, _ in cell_pairs})
+    cell_positions = {cell: position for position, cell in enumerate(cells)}
+
+    store_m = np.full((len(store_ids), len(store_ids)), np.nan, dtype=np.float32)
+    np.fill_diagonal(store_m, 0.0)
+    for (origin, target), distance_m in store_pairs.items():
+        store_m[stores[origin], stores[target]] = distance_m
+    cell_m = np.full((len(cells), len(store_ids)), np.nan, dtype=np.float32)
+    for (cell, store_id), distance_m in cell_pairs.items():
+        cell_m[cell_positions[cell], stores[store_id]] = distance_m
+
+    # np.savez would append ".npz" to a name without it; write to an open file instead
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        np.savez(
+            f,
+            store_ids=np.array(store_ids, dtype=np.int64),
+            store_m=store_m,
+            cells=np.array(cells, dtype="U12"),
+            cell_m=cell_m,
+            cell_precision=np.int64(cell_precision),
+        )
+    os.replace(temporary, path)
+    return RoadDistances(path).stats()
+
+
+class DistanceService:
+    """
+    Process-wide store locations and distance tables.
+
+    Store coordinates are loaded from the database on first use and kept as arrays;
+    they are reloaded after store writes in this process (see invalidate()), after
+    ttl_s for writes made elsewhere, and whenever a different database is queried.
+    """
+
+    def __init__(
+        self,
+        ttl_s: float = 60,
+        road_distances_path: str = "",
+        detour_factor: float = 1.3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_s = ttl_s
+        self.road_distances_path = road_distances_path
+        self.detour_factor = detour_factor
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._locations: Optional[StoreLocations] = None
+        self._bind = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._road_distances: Optional[RoadDistances] = None
+        self._counters: Dict[str, int] = dict.fromkeys(("loads", "invalidations"), 0)
+        self.last_load_seconds = 0.0
+
+    def invalidate(self) -> None:
+        """
+        Marks the store locations as outdated; they are reloaded on next use.
+        """
+        self._stale = True
+        self._counters["invalidations"] += 1
+
+    def locations(self, db: Session) -> StoreLocations:
+        """
+        The current store locations of db's database.
+        """
+        bind = db.get_bind()
+        locations = self._locations
+        if locations is not None and not self._stale and self._bind is bind and self._clock() - self._loaded_at < self.ttl_s:
+            return locations
+        with self._lock:
+            if self._locations is None or self._stale or self._bind is not bind or self._clock() - self._loaded_at >= self.ttl_s:
+                # Cleared before reading, so a write committed during the load marks it stale again
+                self._stale = False
+                started = time.perf_counter()
+                self._locations = StoreLocations(db.query(models.Store.id, models.Store.latitude, models.Store.longitude))
+                self.last_load_seconds = time.perf_counter() - started
+                self._bind = bind
+                self._loaded_at = self._clock()
+                self._counters["loads"] += 1
+                logger.debug("Loaded %d store locations in %.1f ms", len(self._locations), self.last_load_seconds * 1000)
+            return self._locations
+
+    def road_distances(self) -> Optional[RoadDistances]:
+        """
+        The road distance table at road_distances_path, loaded on first use, or None.
+        """
+        if self._road_distances is None and self.road_distances_path and os.path.exists(self.road_distances_path):
+            self._road_distances = RoadDistances(self.road_distances_path)
+            logger.info("Road distances loaded: %s", self._road_distances.stats())
+        return self._road_distances
+
+    def set_road_distances(self, road_distances: Optional[RoadDistances]) -> None:
+        self._road_distances = road_distances
+
+    def travel_matrix(self, origin: Tuple[float, float], stores: Sequence[Tuple[int, float, float]]) -> List[List[float]]:
+        """
+        Travel distances in metres between the origin (index 0) and the given
+        (store_id, latitude, longitude) stores (indexes 1..n), as nested lists for
+        fast scalar access. Road distances are used where the table has them; other
+        pairs get the straight-line distance, times detour_factor if a table is loaded.
+        """
+        latitudes = np.array([origin[0], *(store[1] for store in stores)], dtype=np.float64)
+        longitudes = np.array([origin[1], *(store[2] for store in stores)], dtype=np.float64)
+        matrix = haversine_matrix_m(latitudes, longitudes)
+        roads = self.road_distances()
+        if roads is not None:
+            road = roads.matrix(origin, [store[0] for store in stores])
+            matrix = np.where(np.isnan(road), matrix * self.detour_factor, road)
+        return matrix.tolist()
+
+    def stats(self) -> dict:
+        roads = self.road_distances()
+        return {
+            "stores": len(self._locations) if self._locations is not None else 0,
+            "tree": self._locations is not None and self._locations.tree is not None,
+            "last_load_ms": round(self.last_load_seconds * 1000, 3),
+            **self._counters,
+            "road_distances": roads.stats() if roads is not None else None,
+        }
+
+
+distance_service = DistanceService(
+    ttl_s=DISTANCE_INDEX_TTL_S,
+    road_distances_path=ROAD_DISTANCES_PATH,
+    detour_factor=ROAD_DETOUR_FACTOR,
+)
+
+
+# Writes to stores (ORM ones, including rows added directly to a session, and
+# Core bulk upserts marked with database.mark_written) reload the locations once committed
+database.after_commit_of(models.Store, distance_service.invalidate)
+
+
+def _read_road_rows(lines: Iterable[str]) -> Iterable[Tuple[str, int, float]]:
+    for row in csv.DictReader(lines):
+        yield row["origin"], int(row["store_id"]), float(row["distance_m"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect distance tables.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build-roads", help="Build a road distance table from a CSV")
+    build.add_argument("source", help="CSV with origin (store:<id> or cell:<geohash>), store_id, distance_m columns")
+    build.add_argument("--output", default=ROAD_DISTANCES_PATH or "road_distances.npz")
+    build.add_argument("--cell-precision", type=int, default=6)
+    nearest = subcommands.add_parser("nearest", help="Print the stores nearest to a point")
+    nearest.add_argument("latitude", type=float)
+    nearest.add_argument("longitude", type=float)
+    nearest.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "build-roads":
+        with open(args.source, encoding="utf-8-sig", newline="") as f:
+            print(build_road_distances(_read_road_rows(f), args.output, args.cell_precision))
+        return
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        locations = distance_service.locations(db)
+        started = time.perf_counter()
+        result = locations.nearest(args.latitude, args.longitude, args.k)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+    finally:
+        db.close()
+    print(distance_service.stats())
+    for store_id, distance_m in result:
+        print(f"{store_id}: {distance_m:.0f} m")
+    print(f"({elapsed_us:.1f} µs)")
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory):
+    #   python -m app.distance build-roads osrm_table.csv --output road_distances.npz
+    #   python -m app.distance nearest 46.948 7.444 -k 5
+    main()
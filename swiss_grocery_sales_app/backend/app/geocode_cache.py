@@ -0,0 +1,279 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[float, float]
+
+# Configuration (overridable via environment variables)
+# Set GEOCODE_CACHE_PATH to an empty string to keep the cache in memory only.
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", "geocode_cache.sqlite3")
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "10000"))
+GEOCODE_CACHE_TTL_S = float(os.getenv("GEOCODE_CACHE_TTL_S", str(30 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL_S = float(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL_S", str(3600)))
+# How long a lookup waits for another worker's write lock before treating the entry as a miss
+GEOCODE_CACHE_BUSY_TIMEOUT_S = float(os.getenv("GEOCODE_CACHE_BUSY_TIMEOUT_S", "0.5"))
+
+# Returned by GeocodeCache.get() when nothing usable is cached.
+# (None is a valid cached value: it means "address not found".)
+MISS = object()
+
+_PUNCTUATION = re.compile(r"[,;]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalizes an address string into a cache key.
+
+    "Bundesplatz 1,  3011 Bern" and "bundesplatz 1 3011 BERN" map to the same key.
+    """
+    key = unicodedata.normalize("NFKC", address).casefold()
+    key = _PUNCTUATION.sub(" ", key)
+    return _WHITESPACE.sub(" ", key).strip()
+
+
+class GeocodeCache:
+    """
+    Two-tier cache for geocoding results.
+
+    The first tier is an in-process LRU bounded by max_entries. The second tier is
+    an SQLite file (in WAL mode) that survives restarts and is shared by all
+    workers on a host. Both tiers store "not found" results too, with the shorter
+    negative_ttl_s. Errors of the SQLite tier, such as a lock held by another
+    worker for longer than busy_timeout_s, are logged and treated as misses.
+
+    Async callers use get_async() and set_async(), which only leave the event
+    loop for the SQLite tier.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 10000,
+        ttl_s: float = 30 * 24 * 3600,
+        negative_ttl_s: float = 3600,
+        clock: Callable[[], float] = time.time,
+        busy_timeout_s: float = 0.5,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.busy_timeout_s = busy_timeout_s
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[Optional[Coordinates], float]]" = OrderedDict()
+        # _lock guards the in-process tier and the counters and is never held
+        # during file I/O; _db_lock serializes use of the shared SQLite connection
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counters: Dict[str, int] = dict.fromkeys(
+            ("hits", "persistent_hits", "negative_hits", "misses", "evictions", "expirations", "errors"), 0
+        )
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # Opened lazily so importing the module never touches the filesystem.
+        # Called with _db_lock held.
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_s, check_same_thread=False)
+            try:
+                # WAL lets readers in other workers proceed while one of them writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode_cache ("
+                    " address_key TEXT PRIMARY KEY,"
+                    " latitude REAL,"
+                    " longitude REAL,"
+                    " expires_at REAL NOT NULL)"
+                )
+                conn.commit()
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def _failed(self, action: str, error: sqlite3.Error) -> None:
+        logger.warning("Geocode cache %s failed, continuing without it: %s", action, error)
+        with self._lock:
+            self._counters["errors"] += 1
+
+    def open(self) -> None:
+        """
+        Opens the persistent tier now rather than on the first lookup.
+        """
+        with self._db_lock:
+            try:
+                self._connection()
+            except sqlite3.Error as e:
+                self._failed("open", e)
+
+    def get(self, address: str):
+        """
+        Returns the cached coordinates (or None for a cached "not found"),
+        or MISS if the address is not cached or its entry has expired.
+        """
+        key = normalize_address(address)
+        now = self._clock()
+        value = self._get_entry(key, now)
+        if value is MISS:
+            value = self._get_persistent(key, now)
+        return value
+
+    async def get_async(self, address: str):
+        """
+        Like get(), but reads the SQLite tier in the threadpool.
+        """
+        key = normalize_address(address)
+        now = self._clock()
+        value = self._get_entry(key, now)
+        if value is MISS:
+            if self.path:
+                value = await run_in_threadpool(self._get_persistent, key, now)
+            else:
+                value = self._get_persistent(key, now)
+        return value
+
+    def _get_entry(self, key: str, now: float):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            if value is None:
+                self._counters["negative_hits"] += 1
+            return value
+
+    def _get_persistent(self, key: str, now: float):
+        row = None
+        if self.path:
+            try:
+                with self._db_lock:
+                    conn = self._connection()
+                    row = conn.execute(
+                        "SELECT latitude, longitude, expires_at FROM geocode_cache WHERE address_key = ?",
+                        (key,),
+                    ).fetchone()
+            except sqlite3.Error as e:
+                self._failed("lookup", e)
+        with self._lock:
+            if row is not None and row[2] > now:
+                value = (row[0], row[1]) if row[0] is not None else None
+                self._remember(key, value, row[2])
+                self._counters["persistent_hits"] += 1
+                if value is None:
+                    self._counters["negative_hits"] += 1
+                return value
+            self._counters["misses"] += 1
+            return MISS
+
+    def set(self, address: str, coordinates: Optional[Coordinates]) -> None:
+        """
+        Caches a geocoding result. Pass None to cache a "not found" result.
+        """
+        key, expires_at = self._set_entry(address, coordinates)
+        self._set_persistent(key, coordinates, expires_at)
+
+    async def set_async(self, address: str, coordinates: Optional[Coordinates]) -> None:
+        """
+        Like set(), but writes the SQLite tier in the threadpool.
+        """
+        key, expires_at = self._set_entry(address, coordinates)
+        if self.path:
+            await run_in_threadpool(self._set_persistent, key, coordinates, expires_at)
+
+    def _set_entry(self, address: str, coordinates: Optional[Coordinates]) -> Tuple[str, float]:
+        key = normalize_address(address)
+        ttl = self.ttl_s if coordinates is not None else self.negative_ttl_s
+        expires_at = self._clock() + ttl
+        with self._lock:
+            self._remember(key, coordinates, expires_at)
+        return key, expires_at
+
+    def _set_persistent(self, key: str, coordinates: Optional[Coordinates], expires_at: float) -> None:
+        if not self.path:
+            return
+        latitude, longitude = coordinates if coordinates is not None else (None, None)
+        try:
+            with self._db_lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO geocode_cache (address_key, latitude, longitude, expires_at)"
+                        " VALUES (?, ?, ?, ?)",
+                        (key, latitude, longitude, expires_at),
+                    )
+        except sqlite3.Error as e:
+            self._failed("write", e)
+
+    def _remember(self, key: str, value: Optional[Coordinates], expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def purge_expired(self) -> int:
+        """
+        Deletes expired entries from both tiers. Returns the number of persistent rows removed.
+        """
+        now = self._clock()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+                self._counters["expirations"] += 1
+        if not self.path:
+            return 0
+        try:
+            with self._db_lock:
+                conn = self._connection()
+                with conn:
+                    return conn.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (now,)).rowcount
+        except sqlite3.Error as e:
+            self._failed("purge", e)
+            return 0
+
+    def clear(self) -> None:
+        """
+        Empties the in-process tier and resets the counters (the persistent tier is kept).
+        """
+        with self._lock:
+            self._entries.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+        lookups = stats["hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Application-wide cache used by app.geocoding
+geocode_cache = GeocodeCache(
+    path=GEOCODE_CACHE_PATH or None,
+    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+    ttl_s=GEOCODE_CACHE_TTL_S,
+    negative_ttl_s=GEOCODE_CACHE_NEGATIVE_TTL_S,
+    busy_timeout_s=GEOCODE_CACHE_BUSY_TIMEOUT_S,
+)
@@ -1,18 +1,164 @@
-import httpx
-from typing import Tuple, Optional
+import asyncio
+import importlib.util
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Sequence, Tuple, Optional
+
+from . import address_index, metrics
+from .geocode_cache import MISS, geocode_cache, normalize_address
+
+if TYPE_CHECKING:
+    # Imported on first use: processes that never call GeoAdmin (or answer from the
+    # offline address index) do not pay for loading httpx and h2
+    import httpx
+
+logger = logging.getLogger(__name__)
 
 GEOADMIN_API_URL = "https://api3.geo.admin.ch/rest/services/api/SearchServer"
 
+# HTTP client configuration (overridable via environment variables)
+GEOADMIN_TIMEOUT_S = float(os.getenv("GEOADMIN_TIMEOUT_S", "5.0"))
+GEOADMIN_CONNECT_TIMEOUT_S = float(os.getenv("GEOADMIN_CONNECT_TIMEOUT_S", "2.0"))
+GEOADMIN_MAX_CONNECTIONS = int(os.getenv("GEOADMIN_MAX_CONNECTIONS", "20"))
+GEOADMIN_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEOADMIN_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GEOADMIN_KEEPALIVE_EXPIRY_S = float(os.getenv("GEOADMIN_KEEPALIVE_EXPIRY_S", "30.0"))
+GEOADMIN_HTTP2 = os.getenv("GEOADMIN_HTTP2", "1") == "1"
+
+# Upstream requests in flight per batch; keep below the GeoAdmin rate limit
+GEOCODE_BATCH_CONCURRENCY = int(os.getenv("GEOCODE_BATCH_CONCURRENCY", "8"))
+GEOCODE_BATCH_MAX_CONCURRENCY = int(os.getenv("GEOCODE_BATCH_MAX_CONCURRENCY", "32"))
+
+class GeocodingError(Exception):
+    """Raised when the GeoAdmin API could not be queried (as opposed to "address not found")."""
+
+# Application-lifetime client, see start_http_client()/close_http_client()
+_client: Optional["httpx.AsyncClient"] = None
+
+# Upstream lookups currently running, keyed on normalized address (single-flight)
+_inflight: Dict[str, "asyncio.Task"] = {}
+
+def create_http_client(transport: Optional["httpx.AsyncBaseTransport"] = None) -> "httpx.AsyncClient":
+    """
+    Builds the pooled client used for GeoAdmin requests.
+    HTTP/2 is enabled when requested and the optional 'h2' package is installed.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(GEOADMIN_TIMEOUT_S, connect=GEOADMIN_CONNECT_TIMEOUT_S),
+        limits=httpx.Limits(
+            max_connections=GEOADMIN_MAX_CONNECTIONS,
+            max_keepalive_connections=GEOADMIN_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GEOADMIN_KEEPALIVE_EXPIRY_S,
+        ),
+        http2=GEOADMIN_HTTP2 and importlib.util.find_spec("h2") is not None,
+        transport=transport,
+    )
+
+async def start_http_client(transport: Optional["httpx.AsyncBaseTransport"] = None) -> "httpx.AsyncClient":
+    """
+    Creates the shared client, replacing any existing one.
+    """
+    global _client
+    await close_http_client()
+    _client = create_http_client(transport)
+    return _client
+
+async def close_http_client() -> None:
+    """
+    Closes the shared client and its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+def get_http_client() -> "httpx.AsyncClient":
+    """
+    Returns the shared client, creating it on first use. It lives until
+    close_http_client() (called from the FastAPI lifespan hook in app.main on shutdown).
+    """
+    global _client
+    if _client is None:
+        _client = create_http_client()
+    return _client
+
 async def fetch_coordinates_from_geo_admin(address: str) -> Optional[Tuple[float, float]]:
     """
     Fetches latitude and longitude for a given Swiss address using the GeoAdmin API.
 
+    Addresses in the offline index (app.address_index) are answered locally. Other
+    results (including "not found") are served from app.geocode_cache when possible;
+    upstream errors are not cached so the next call retries.
+
     Args:
         address: The Swiss address string to geocode.
 
     Returns:
         A tuple (latitude, longitude) if successful, None otherwise.
     """
+    try:
+        return await lookup_coordinates(address)
+    except GeocodingError as e:
+        logger.warning("%s", e)
+        return None
+
+async def lookup_coordinates(address: str) -> Optional[Tuple[float, float]]:
+    """
+    Like fetch_coordinates_from_geo_admin(), but raises GeocodingError on upstream
+    failures instead of returning None, so callers can tell them apart from "not found".
+    """
+    index = address_index.get_address_index()
+    if index is not None:
+        local = index.lookup(address)
+        metrics.ADDRESS_INDEX_LOOKUPS.inc(result="hit" if local is not None else "miss")
+        if local is not None:
+            return local
+
+    cached = await geocode_cache.get_async(address)
+    if cached is not MISS:
+        return cached
+
+    # Coalesce concurrent lookups of the same address into one upstream request.
+    # The shared task is shielded so a cancelled caller does not cancel the others.
+    key = normalize_address(address)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_cache(address))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+async def _fetch_and_cache(address: str) -> Optional[Tuple[float, float]]:
+    started = time.perf_counter()
+    try:
+        coordinates = await _query_geo_admin(address)
+    except Exception as e:
+        import httpx
+
+        metrics.GEOADMIN_REQUEST_DURATION.observe(time.perf_counter() - started, outcome="error")
+        metrics.GEOADMIN_ERRORS.inc(error=type(e).__name__)
+        if isinstance(e, httpx.RequestError):
+            raise GeocodingError(f"HTTPX RequestError while fetching coordinates for '{address}': {e}") from e
+        if isinstance(e, httpx.HTTPStatusError):
+            raise GeocodingError(f"HTTPX HTTPStatusError while fetching coordinates for '{address}': {e}") from e
+        raise GeocodingError(f"An unexpected error occurred while fetching coordinates for '{address}': {e}") from e
+    metrics.GEOADMIN_REQUEST_DURATION.observe(
+        time.perf_counter() - started, outcome="found" if coordinates is not None else "not_found"
+    )
+
+    if coordinates is None:
+        logger.info("No features or coordinates found for address: %s", address)
+    await geocode_cache.set_async(address, coordinates)
+    return coordinates
+
+async def _query_geo_admin(address: str) -> Optional[Tuple[float, float]]:
+    """
+    Performs the GeoAdmin SearchServer request.
+
+    Returns None if the address was not found; raises on transport or HTTP errors.
+    """
     params = {
         "searchText": address,
         "type": "locations",
@@ -21,37 +167,65 @@ async def fetch_coordinates_from_geo_admin(address: str) -> Optional[Tuple[float
         "limit": "1",
         "geometryFormat": "geojson"
     }
+    response = await get_http_client().get(GEOADMIN_API_URL, params=params)
+    response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+
+    data = response.json()
+
+    if data.get("features") and len(data["features"]) > 0:
+        feature = data["features"][0]
+        if feature.get("geometry") and feature["geometry"].get("type") == "Point":
+            coordinates = feature["geometry"].get("coordinates")
+            if coordinates and len(coordinates) == 2:
+                # GeoJSON coordinates are [longitude, latitude]
+                longitude, latitude = coordinates
+                return float(latitude), float(longitude)
+    return None
+
+async def geocode_many(
+    addresses: Sequence[str], concurrency: Optional[int] = None
+) -> AsyncIterator[Tuple[List[int], Optional[Tuple[float, float]], Optional[str]]]:
+    """
+    Geocodes many addresses with at most `concurrency` lookups in flight.
+
+    Addresses are deduplicated on their normalized form, so each distinct address is
+    looked up once. Results are yielded in completion order as
+    (indexes, coordinates, error), where indexes lists the positions in `addresses`
+    the result applies to and error is set only when the lookup failed. A failed
+    lookup never ends the stream for the other addresses.
+
+    Args:
+        addresses: The Swiss address strings to geocode.
+        concurrency: Maximum parallel lookups (defaults to GEOCODE_BATCH_CONCURRENCY).
+    """
+    concurrency = max(1, min(concurrency or GEOCODE_BATCH_CONCURRENCY, GEOCODE_BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    positions: Dict[str, List[int]] = {}
+    for index, address in enumerate(addresses):
+        positions.setdefault(normalize_address(address), []).append(index)
+
+    async def worker(key: str, indexes: List[int]):
+        async with semaphore:
+            try:
+                return indexes, await lookup_coordinates(addresses[indexes[0]]), None
+            except GeocodingError as e:
+                return indexes, None, str(e)
+            except Exception as e:  # e.g. a transport error or an undecodable response
+                logger.exception("Geocoding %r failed", addresses[indexes[0]])
+                return indexes, None, f"Geocoding failed: {type(e).__name__}"
+
+    tasks = [asyncio.ensure_future(worker(key, indexes)) for key, indexes in positions.items()]
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(GEOADMIN_API_URL, params=params)
-            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-
-            data = response.json()
-
-            if data.get("features") and len(data["features"]) > 0:
-                feature = data["features"][0]
-                if feature.get("geometry") and feature["geometry"].get("type") == "Point":
-                    coordinates = feature["geometry"].get("coordinates")
-                    if coordinates and len(coordinates) == 2:
-                        # GeoJSON coordinates are [longitude, latitude]
-                        longitude, latitude = coordinates
-                        return float(latitude), float(longitude)
-            print(f"No features or coordinates found for address: {address}")
-            return None
-    except httpx.RequestError as e:
-        print(f"HTTPX RequestError while fetching coordinates for '{address}': {e}")
-        return None
-    except httpx.HTTPStatusError as e:
-        print(f"HTTPX HTTPStatusError while fetching coordinates for '{address}': {e}")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred while fetching coordinates for '{address}': {e}")
-        return None
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Stop outstanding lookups if the consumer goes away (e.g. client disconnect)
+        for task in tasks:
+            task.cancel()
 
 if __name__ == '__main__':
-    # Example usage for testing the function directly
-    import asyncio
-
+    # Example usage for testing the function directly (python -m app.geocoding)
     async def main():
         test_address = "Bundesplatz 1, 3011 Bern"
         coordinates = await fetch_coordinates_from_geo_admin(test_address)
@@ -67,4 +241,6 @@ if __name__ == '__main__':
         else:
             print(f"Could not fetch coordinates for '{test_address_invalid}'.")
 
+        await close_http_client()
+
     asyncio.run(main())
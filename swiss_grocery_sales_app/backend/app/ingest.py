@@ -0,0 +1,178 @@
+import argparse
+import csv
+import json
+import time
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.orm import Session
+
+from . import best_price, crud, models, price_history, schemas, search, subscriptions
+from .response_cache import response_cache
+
+# Rows validated and upserted per statement/transaction
+PROMOTION_INGEST_BATCH_SIZE = 1000
+
+# How many invalid rows are reported back in detail
+MAX_REPORTED_ERRORS = 50
+
+CSV_COLUMNS = (
+    "store_id", "product_name", "sale_price", "original_price",
+    "valid_until", "description", "image_url",
+)
+
+_promotion_list_adapter = TypeAdapter(List[schemas.PromotionCreate])
+
+
+def iter_feed_records(stream: TextIO, fmt: str = "csv") -> Iterator[Tuple[int, dict]]:
+    """
+    Lazily parses a promotion feed into (line_number, record) pairs.
+
+    Supported formats are "csv" (header row with CSV_COLUMNS) and "ndjson"
+    (one JSON object per line). Only one row is held in memory at a time.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            # Empty cells mean "not provided", so optional fields fall back to None
+            yield reader.line_num, {
+                key: value for key, value in record.items() if key in CSV_COLUMNS and value not in ("", None)
+            }
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {"_error": f"Invalid JSON: {e.msg}"}
+                    continue
+                yield line_number, record if isinstance(record, dict) else {"_error": "Expected a JSON object"}
+    else:
+        raise ValueError(f"Unsupported feed format: {fmt}")
+
+
+def validate_batch(
+    batch: List[Tuple[int, dict]],
+) -> Tuple[List[Tuple[int, schemas.PromotionCreate]], List[dict]]:
+    """
+    Validates a batch of records against schemas.PromotionCreate and returns the
+    valid ones as (line_number, promotion) pairs, plus the errors.
+
+    The whole batch is validated in one call; only if that fails are the rows
+    validated one by one to separate the good ones from the bad ones.
+    """
+    records = [record for _, record in batch]
+    try:
+        promotions = _promotion_list_adapter.validate_python(records)
+        return [(line_number, promotion) for (line_number, _), promotion in zip(batch, promotions)], []
+    except ValidationError:
+        pass
+
+    valid, errors = [], []
+    for line_number, record in batch:
+        if "_error" in record:
+            errors.append({"line": line_number, "error": record["_error"]})
+            continue
+        try:
+            valid.append((line_number, schemas.PromotionCreate.model_validate(record)))
+        except ValidationError as e:
+            first = e.errors(include_url=False)[0]
+            errors.append({
+                "line": line_number,
+                "field": ".".join(str(part) for part in first["loc"]),
+                "error": first["msg"],
+            })
+    return valid, errors
+
+
+def ingest_promotions(
+    db: Session,
+    records: Iterable[Tuple[int, dict]],
+    batch_size: int = PROMOTION_INGEST_BATCH_SIZE,
+) -> schemas.PromotionIngestResult:
+    """
+    Streams feed records into the promotions table in batches.
+
+    Each batch is validated, checked against existing stores, upserted with
+    crud.upsert_promotions and committed together with the best prices it affects
+    and the new prices' history observations;
+    cached responses showing the changed stores and the search index are then
+    invalidated, and the changes are published to price alert subscribers.
+    Unchanged rows are not rewritten.
+    """
+    started = time.perf_counter()
+    counts: Dict[str, int] = {"received": 0, "written": 0, "unchanged": 0, "invalid": 0}
+    errors: List[dict] = []
+    written_store_ids = set()
+
+    for batch in crud.chunked(records, batch_size):
+        counts["received"] += len(batch)
+        validated, batch_errors = validate_batch(batch)
+
+        # Reject rows for unknown stores here instead of failing the batch on the foreign key
+        store_ids = {promotion.store_id for _, promotion in validated}
+        known = {
+            store_id for (store_id,) in
+            db.query(models.Store.id).filter(models.Store.id.in_(store_ids))
+        } if store_ids else set()
+        for line_number, promotion in validated:
+            if promotion.store_id not in known:
+                batch_errors.append({
+                    "line": line_number,
+                    "field": "store_id",
+                    "error": f"Unknown store_id {promotion.store_id} for '{promotion.product_name}'",
+                })
+        batch_errors.sort(key=lambda error: error["line"])
+        promotions = [promotion for _, promotion in validated if promotion.store_id in known]
+
+        changed = crud.upsert_promotions(db, promotions)
+        best_price.refresh_for_promotions(db, changed)
+        price_history.record_promotions(db, changed)
+        db.commit()
+        if changed:
+            search.promotion_index.invalidate()
+            changed_store_ids = {row.store_id for row in changed}
+            response_cache.invalidate_stores(changed_store_ids, crud.store_cells(db, changed_store_ids).values())
+            subscriptions.publish(db, changed)
+
+        counts["written"] += len(changed)
+        counts["unchanged"] += len(promotions) - len(changed)
+        counts["invalid"] += len(batch_errors)
+        written_store_ids.update(row.store_id for row in changed)
+        errors.extend(batch_errors[:max(0, MAX_REPORTED_ERRORS - len(errors))])
+
+    seconds = time.perf_counter() - started
+    return schemas.PromotionIngestResult(
+        **counts,
+        seconds=round(seconds, 6),
+        rows_per_second=round(counts["received"] / seconds, 1) if seconds > 0 else 0.0,
+        store_ids=sorted(written_store_ids),
+        errors=errors,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest a promotion feed (CSV or NDJSON).")
+    parser.add_argument("path", help="Feed file (.csv with a header row, or .ndjson/.jsonl)")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="Defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=PROMOTION_INGEST_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        with open(args.path, newline="", encoding="utf-8-sig") as f:
+            result = ingest_promotions(db, iter_feed_records(f, fmt), batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Received {result.received} rows in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s): "
+          f"{result.written} written, {result.unchanged} unchanged, {result.invalid} invalid")
+    for error in result.errors:
+        print(f"  {error}")
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory): python -m app.ingest flyer.csv
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import best_price, crud, database, models, serialization
+from .geocode_cache import geocode_cache
+from .response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Configuration (overridable via environment variables)
+PROMOTION_ARCHIVE_DIR = os.getenv("PROMOTION_ARCHIVE_DIR", "promotion_archive")
+# Expired promotions stay in the table this many days before being archived
+PROMOTION_RETENTION_DAYS = int(os.getenv("PROMOTION_RETENTION_DAYS", "7"))
+PROMOTION_ARCHIVE_BATCH_SIZE = int(os.getenv("PROMOTION_ARCHIVE_BATCH_SIZE", "5000"))
+# Seconds between runs of the background job started by the app; 0 disables it
+LIFECYCLE_INTERVAL_S = float(os.getenv("LIFECYCLE_INTERVAL_S", "3600"))
+
+# The partial index on active promotions is recreated weekly under this name prefix
+ACTIVE_INDEX_PREFIX = "ix_promotions_active_"
+
+# Arbitrary key for the advisory lock that lets only one worker run the job at a time
+_LIFECYCLE_LOCK_KEY = 0x5072_6F6D  # "Prom"
+
+ARCHIVED_COLUMNS = (
+    "id", "store_id", "product_name", "product_key", "sale_price", "original_price",
+    "valid_until", "description", "image_url", "last_updated",
+)
+
+
+def week_start(day: date) -> date:
+    """
+    Monday of the ISO week containing day.
+    """
+    return day - timedelta(days=day.weekday())
+
+
+def archive_path(directory: str, day: date) -> str:
+    """
+    Archive file of the ISO week containing day, e.g. promotions-2024-W18.ndjson.gz.
+    """
+    year, week, _ = day.isocalendar()
+    return os.path.join(directory, f"promotions-{year}-W{week:02d}.ndjson.gz")
+
+
+def _archive_record(row) -> dict:
+    record = dict(zip(ARCHIVED_COLUMNS, row))
+    for field in ("sale_price", "original_price"):
+        if record[field] is not None:
+            record[field] = str(record[field])
+    return record
+
+
+def archive_expired_promotions(
+    db: Session,
+    before: date,
+    directory: str = PROMOTION_ARCHIVE_DIR,
+    batch_size: int = PROMOTION_ARCHIVE_BATCH_SIZE,
+) -> Dict[str, object]:
+    """
+    Moves promotions that expired before the given date into gzip-compressed NDJSON
+    files, one per ISO week of valid_until, and deletes them from the table.
+
+    Each batch is appended to the archives and flushed to disk before its rows are
+    deleted and committed. A crash in between can leave duplicates in the archive,
+    but no promotion is ever lost. Cached responses of the stores are invalidated
+    after each commit.
+    """
+    archived = 0
+    files = set()
+    os.makedirs(directory, exist_ok=True)
+    columns = [getattr(models.Promotion, column) for column in ARCHIVED_COLUMNS]
+    while True:
+        rows = (
+            db.query(*columns)
+            .filter(models.Promotion.valid_until < before)
+            .order_by(models.Promotion.valid_until, models.Promotion.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+
+        by_week: Dict[str, List[dict]] = defaultdict(list)
+        for row in rows:
+            by_week[archive_path(directory, row.valid_until)].append(_archive_record(row))
+        for path, records in by_week.items():
+            # Appending adds a gzip member; readers see one concatenated stream
+            with gzip.open(path, "ab") as f:
+                for record in records:
+                    f.write(serialization.dumps(record) + b"\n")
+                f.flush()
+                os.fsync(f.fileobj.fileno())
+            files.add(path)
+
+        ids = [row.id for row in rows]
+        # Also done by ON DELETE CASCADE, but SQLite only enforces that with PRAGMA foreign_keys
+        db.query(models.BestPrice).filter(models.BestPrice.promotion_id.in_(ids)).delete(synchronize_session=False)
+        db.query(models.Promotion).filter(models.Promotion.id.in_(ids)).delete(synchronize_session=False)
+        # Bulk deletes bypass the ORM flush: reload the search index on commit all the same
+        database.mark_written(db, models.Promotion)
+        db.commit()
+        store_ids = {row.store_id for row in rows}
+        response_cache.invalidate_stores(store_ids, crud.store_cells(db, store_ids).values())
+        archived += len(rows)
+
+    return {"archived": archived, "files": sorted(files)}
+
+
+def read_archive(path: str) -> List[dict]:
+    """
+    Reads back the promotions of an archive file.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _autocommit(engine: Engine) -> Connection:
+    # Outside a transaction: needed by CREATE/DROP INDEX CONCURRENTLY, and keeps a
+    # connection that only holds an advisory lock from sitting idle in transaction
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def rotate_active_index(db: Session, today: Optional[date] = None) -> Optional[str]:
+    """
+    PostgreSQL only: keeps a partial index over promotions valid this week or later.
+
+    Index predicates must be immutable, so the index cannot refer to CURRENT_DATE.
+    Instead it is rebuilt each week with the Monday as a constant cutoff. The active
+    filter (crud.active_promotion_filter) implies the predicate for any date in that
+    week, so the planner can use it. Indexes are built and dropped CONCURRENTLY, so
+    ingestion keeps writing to promotions meanwhile. Returns the current index name,
+    or None on other databases.
+    """
+    engine = db.get_bind().engine
+    if engine.dialect.name != "postgresql":
+        return None
+    cutoff = week_start(today or date.today())
+    name = f"{ACTIVE_INDEX_PREFIX}{cutoff:%Y%m%d}"
+    with _autocommit(engine) as conn:
+        # A failed concurrent build leaves an invalid index behind, which
+        # IF NOT EXISTS would keep forever; drop it so it is rebuilt
+        valid = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+        if valid is False:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON promotions ("SalePrice", "PromotionID") '
+            f"WHERE \"ValidUntil\" IS NULL OR \"ValidUntil\" >= DATE '{cutoff.isoformat()}'"
+        ))
+        stale = conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = 'promotions' AND indexname LIKE :prefix"),
+            {"prefix": ACTIVE_INDEX_PREFIX + "%"},
+        ).scalars().all()
+        for index in stale:
+            if index != name:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+    return name
+
+
+@contextmanager
+def advisory_lock(engine: Engine, key: int) -> Iterator[bool]:
+    """
+    Tries to take a PostgreSQL session-level advisory lock and yields whether it did.
+
+    The lock is held by a dedicated connection for the whole block, so it spans any
+    number of commits made through other connections, and is released on the same
+    connection that took it. Other databases always get True.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    conn = _autocommit(engine)
+    try:
+        acquired = conn.execute(select(func.pg_try_advisory_lock(key))).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                try:
+                    conn.execute(select(func.pg_advisory_unlock(key)))
+                except Exception:
+                    # Discarding the connection ends its server session, which releases the lock
+                    logger.exception("Releasing advisory lock %d failed", key)
+                    conn.invalidate()
+    finally:
+        conn.close()
+
+
+def run_lifecycle(
+    db: Session,
+    today: Optional[date] = None,
+    directory: str = PROMOTION_ARCHIVE_DIR,
+    retention_days: int = PROMOTION_RETENTION_DAYS,
+) -> Dict[str, object]:
+    """
+    One run of the promotion lifecycle: recompute best prices whose winner expired,
+    archive promotions expired for more than retention_days, and rotate the active
+    index. On PostgreSQL an advisory lock makes concurrent runs (one per worker) skip.
+    """
+    today = today or date.today()
+    with advisory_lock(db.get_bind().engine, _LIFECYCLE_LOCK_KEY) as acquired:
+        if not acquired:
+            return {"skipped": True}
+        try:
+            expired_best_prices = best_price.expire(db, today)
+            db.commit()
+            archive = archive_expired_promotions(db, today - timedelta(days=retention_days), directory)
+            index = rotate_active_index(db, today)
+        except Exception:
+            db.rollback()
+            raise
+    return {"skipped": False, "expired_best_prices": expired_best_prices, **archive, "active_index": index}
+
+
+async def lifecycle_loop(session_factory, interval_s: float = LIFECYCLE_INTERVAL_S):
+    """
+    Background task started by the app's lifespan: runs run_lifecycle and purges
+    expired geocode cache entries every interval_s in the threadpool. Failures are
+    reported and retried on the next run.
+    """
+    def run_once():
+        # Not under the advisory lock: each worker has its own in-process geocode tier
+        geocode_cache.purge_expired()
+        db = session_factory()
+        try:
+            return run_lifecycle(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await run_in_threadpool(run_once)
+        except Exception:
+            logger.exception("Promotion lifecycle run failed")
+        await asyncio.sleep(interval_s)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive expired promotions and rotate the active index.")
+    parser.add_argument("--archive-dir", default=PROMOTION_ARCHIVE_DIR)
+    parser.add_argument("--retention-days", type=int, default=PROMOTION_RETENTION_DAYS)
+    parser.add_argument("--today", type=date.fromisoformat, help="Run as of this date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        result = run_lifecycle(db, args.today, args.archive_dir, args.retention_days)
+    finally:
+        db.close()
+    result["geocode_cache_purged"] = geocode_cache.purge_expired()
+    print(result)
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory): python -m app.lifecycle
+    main()
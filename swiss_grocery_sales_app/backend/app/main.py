@@ -1,28 +1,167 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import functools
+import io
+import logging
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from decimal import Decimal
+from typing import Iterable, List, Optional
 from sqlalchemy.orm import Session
+import orjson
 
 # Relative imports for modules within the 'app' package
-from . import crud, models, schemas # Ensure models is imported if Base.metadata.create_all is called here
+from . import address_index, basket, best_price, bulk_import, crud, crud_async, database, geocoding, ingest, lifecycle, metrics, models, pagination, price_history, schemas, serialization, server, spatial, subscriptions, warmup # Ensure models is imported if Base.metadata.create_all is called here
 from .database import SessionLocal, engine, get_db # Assuming get_db is defined in database.py
 from .geocoding import fetch_coordinates_from_geo_admin
+from .geocode_cache import geocode_cache
+from .response_cache import RESPONSE_CACHE_CHANNEL, cache_key, cell_tag, etag_matches, response_cache, store_tag
 
 # If you plan to use Alembic for migrations, you might not call create_all here.
 # For now, if you want to ensure tables are created when the app starts (for dev):
 # models.Base.metadata.create_all(bind=engine)
 # However, it's better to manage table creation explicitly (e.g. via models.py script or Alembic)
 
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect the pool, compile the hot queries and open the caches before serving,
+    # so the first requests of each worker are not the slowest ones
+    if warmup.WARMUP_ENABLED:
+        await run_in_threadpool(warmup.warm_up, engine, SessionLocal)
+    metrics.mark_ready()
+    # Archives expired promotions and keeps best prices and the active index current
+    lifecycle_task = None
+    if lifecycle.LIFECYCLE_INTERVAL_S > 0:
+        lifecycle_task = asyncio.create_task(lifecycle.lifecycle_loop(SessionLocal))
+    # Price events and response cache invalidations of any worker reach this one via LISTEN
+    workers = server.worker_count()
+    listener_task = subscriptions.start(
+        engine, workers, {RESPONSE_CACHE_CHANNEL: response_cache.apply_notification}
+    )
+    response_cache.share_with_workers(
+        workers,
+        functools.partial(subscriptions.notify, engine, RESPONSE_CACHE_CHANNEL) if listener_task is not None else None,
+    )
+    try:
+        yield
+    finally:
+        if lifecycle_task is not None:
+            lifecycle_task.cancel()
+        if listener_task is not None:
+            listener_task.cancel()
+        # The pooled GeoAdmin client is created on the first upstream lookup
+        await geocoding.close_http_client()
+
 app = FastAPI(
     title="Swiss Grocery Sales Aggregator API",
     description="API for finding grocery sales and promotions in Switzerland.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Records latency and SQL query count/time per route, adds a Server-Timing header,
+    and, when PROFILING_ENABLED is set, profiles requests sent with an X-Profile header.
+    """
+    if metrics.mark_first_request():
+        logger.info(
+            "First request %.1f ms after process start (ready after %.1f ms), RSS %.1f MB",
+            metrics.startup_timings()["first_request"] * 1000,
+            metrics.startup_timings().get("ready", 0.0) * 1000,
+            (metrics.resident_memory_bytes() or 0) / 1e6,
+        )
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    sampler = None
+    if metrics.PROFILING_ENABLED and request.headers.get(metrics.PROFILING_HEADER):
+        sampler = metrics.StackSampler().start()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.current_request.reset(token)
+        route = metrics.route_label(request.scope)
+        metrics.observe_request(request.method, route, status, elapsed, stats)
+        if sampler is not None:
+            sampler.stop()
+    response.headers["Server-Timing"] = metrics.server_timing(stats, elapsed)
+    if sampler is not None:
+        path = await run_in_threadpool(sampler.dump, metrics.PROFILE_DIR, f"{request.method} {route}")
+        response.headers["X-Profile-Path"] = path
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    """
+    Request, database and GeoAdmin metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Schemas for Geocoding are now in schemas.py
 
+_nearby_promotions_adapter = TypeAdapter(List[schemas.NearbyPromotionRead])
+_best_prices_adapter = TypeAdapter(List[schemas.BestPriceRead])
+
+# Session dependency for the store and listing endpoints: an AsyncSession when
+# DB_ASYNC is enabled, otherwise the regular synchronous Session.
+get_session = database.get_async_db if database.DB_ASYNC else get_db
+
+async def run_crud(name: str, **kwargs):
+    """
+    Calls crud_async.<name> when DB_ASYNC is enabled; otherwise runs the synchronous
+    crud.<name> in the threadpool so it does not block the event loop.
+    """
+    if database.DB_ASYNC:
+        return await getattr(crud_async, name)(**kwargs)
+    return await run_in_threadpool(getattr(crud, name), **kwargs)
+
+def cached_response(request: Request) -> Optional[Response]:
+    """
+    Returns the cached response for this route and query string (a 304 if the client's
+    If-None-Match matches its ETag), or None on a cache miss.
+    """
+    entry = response_cache.get(cache_key(request.url.path, request.query_params.multi_items()))
+    if entry is None:
+        return None
+    not_modified = etag_matches(request.headers.get("if-none-match"), entry.etag)
+    response_cache.record_served(entry, not_modified)
+    if not_modified:
+        return Response(status_code=304, headers={"ETag": entry.etag, "X-Cache": "HIT"})
+    return serialization.ORJSONResponse(entry.body, headers={"ETag": entry.etag, "X-Cache": "HIT"})
+
+def cache_and_respond(request: Request, body: bytes, tags: Iterable[str]) -> Response:
+    """
+    Caches a freshly serialized JSON body under this route and query string,
+    tagged for invalidation (see response_cache.ResponseCache.invalidate_stores).
+    """
+    entry = response_cache.set(cache_key(request.url.path, request.query_params.multi_items()), body, tags)
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers={"ETag": entry.etag, "X-Cache": "MISS"})
+    return serialization.ORJSONResponse(body, headers={"ETag": entry.etag, "X-Cache": "MISS"})
+
+def nearby_tags(lat: float, lon: float, radius_m: float, stores: Iterable[models.Store]) -> List[str]:
+    # A nearby result changes when anything in the covered cells changes, or when one
+    # of the listed stores moves away
+    cells = spatial.geohash_cells_for_radius(lat, lon, radius_m, models.STORE_CELL_PRECISION)
+    return [cell_tag(cell) for cell in cells] + [store_tag(store.id) for store in stores]
+
 @app.post("/api/v1/geocode", response_model=schemas.GeocodeResponse, tags=["Geocoding"])
 async def geocode_address(request: schemas.AddressRequest):
     """
-    Geocodes a Swiss address using the GeoAdmin API and returns its latitude and longitude.
+    Geocodes a Swiss address and returns its latitude and longitude, from the offline
+    address index if configured, otherwise using the GeoAdmin API.
     """
     coordinates = await fetch_coordinates_from_geo_admin(request.address)
 
@@ -35,10 +174,84 @@ async def geocode_address(request: schemas.AddressRequest):
             detail=f"Address not found or could not be geocoded: {request.address}"
         )
 
+@app.post("/api/v1/geocode/batch", tags=["Geocoding"], response_class=StreamingResponse)
+async def geocode_address_batch(request: schemas.BatchGeocodeRequest):
+    """
+    Geocodes a list of Swiss addresses with bounded concurrency.
+
+    Results are streamed back as NDJSON (one schemas.BatchGeocodeResult per input
+    address) in completion order. Failures are reported per item.
+    """
+    async def results():
+        async for indexes, coordinates, error in geocoding.geocode_many(
+            request.addresses, concurrency=request.concurrency
+        ):
+            for index in indexes:
+                if error is not None:
+                    result = schemas.BatchGeocodeResult(
+                        index=index, address=request.addresses[index], status="error", error=error
+                    )
+                elif coordinates is None:
+                    result = schemas.BatchGeocodeResult(
+                        index=index, address=request.addresses[index], status="not_found"
+                    )
+                else:
+                    result = schemas.BatchGeocodeResult(
+                        index=index,
+                        address=request.addresses[index],
+                        status="ok",
+                        latitude=coordinates[0],
+                        longitude=coordinates[1],
+                    )
+                yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/api/v1/geocode/suggest", response_model=List[schemas.AddressSuggestion], tags=["Geocoding"])
+def suggest_addresses(
+    q: str = Query(..., min_length=2, max_length=200, description="Start of an address, e.g. 'Bahnhofstr 1'"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Addresses from the offline address index whose normalized key
+    ("<street> <number> <postcode>") starts with q.
+    """
+    index = address_index.get_address_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="No offline address index is configured")
+    return [
+        schemas.AddressSuggestion(address_key=key, latitude=latitude, longitude=longitude)
+        for key, latitude, longitude in index.search(q, limit)
+    ]
+
+@app.get("/api/v1/geocode/index/stats", response_model=schemas.AddressIndexStats, tags=["Geocoding"])
+def read_address_index_stats():
+    """
+    Returns size, memory-mapped bytes and load time of the offline address index.
+    """
+    index = address_index.get_address_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="No offline address index is configured")
+    return index.stats()
+
+@app.get("/api/v1/geocode/cache/stats", response_model=schemas.GeocodeCacheStats, tags=["Geocoding"])
+def read_geocode_cache_stats():
+    """
+    Returns hit/miss/eviction counters of the geocoding cache, for sizing it.
+    """
+    return geocode_cache.stats()
+
+@app.get("/api/v1/cache/stats", response_model=schemas.ResponseCacheStats, tags=["Cache"])
+def read_response_cache_stats():
+    """
+    Returns hit ratio, bytes saved and size of the response cache of the read endpoints.
+    """
+    return response_cache.stats()
+
 # --- Store Endpoints ---
 
 @app.post("/api/v1/stores", response_model=schemas.StoreRead, status_code=201, tags=["Stores"])
-def create_new_store(store: schemas.StoreCreate, db: Session = Depends(get_db)):
+async def create_new_store(store: schemas.StoreCreate, db=Depends(get_session)):
     """
     Creates a new grocery store.
     The latitude and longitude provided will be used to generate the store's geometry.
@@ -48,19 +261,350 @@ def create_new_store(store: schemas.StoreCreate, db: Session = Depends(get_db)):
     # if db_store_existing:
     #     raise HTTPException(status_code=400, detail="Store with this name and address already exists")
 
-    created_store = crud.create_store(db=db, store=store)
+    created_store = await run_crud("create_store", db=db, store=store)
+    # Blocks on the NOTIFY to the other workers, if any
+    await run_in_threadpool(response_cache.invalidate_stores, [created_store.id], [created_store.cell])
     return created_store
 
+@app.get("/api/v1/stores", response_model=schemas.StorePage, tags=["Stores"])
+async def list_stores(
+    chain_name: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    include_promotions: bool = Query(False, description="Include each store's active promotions"),
+    db=Depends(get_session),
+):
+    """
+    Lists stores ordered by ID, optionally filtered by chain.
+    Uses keyset (cursor) pagination: pass next_cursor to get the following page.
+    """
+    after_id = None
+    if cursor is not None:
+        try:
+            (after_id,) = pagination.decode_cursor("stores", cursor, 1)
+            after_id = int(after_id)
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except (ValueError, TypeError, ArithmeticError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Fetch one extra row to know whether there is a next page
+    stores = await run_crud(
+        "get_stores",
+        db=db, chain_name=chain_name, after_id=after_id, limit=limit + 1, include_promotions=include_promotions
+    )
+    next_cursor = None
+    if len(stores) > limit:
+        stores = stores[:limit]
+        next_cursor = pagination.encode_cursor("stores", [stores[-1].id])
+    return schemas.StorePage(items=stores, next_cursor=next_cursor)
+
+@app.post("/api/v1/stores/bulk", response_model=schemas.BulkImportResult, tags=["Stores"])
+async def bulk_import_stores(
+    request: Request,
+    chunk_size: int = Query(bulk_import.STORE_IMPORT_CHUNK_SIZE, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """
+    Creates or updates many stores at once from a JSON array (application/json)
+    or CSV with a header row (text/csv).
+    Stores are matched on (name, address); existing ones are updated in place.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            stores = bulk_import.parse_stores_csv(io.StringIO(body.decode("utf-8-sig")))
+        else:
+            stores = bulk_import.parse_stores_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV body must be UTF-8 encoded")
+
+    # The database work is synchronous; keep it off the event loop
+    return await run_in_threadpool(bulk_import.import_stores, db, stores, chunk_size)
+
 @app.get("/api/v1/stores/{store_id}", response_model=schemas.StoreRead, tags=["Stores"])
-def read_store(store_id: int, db: Session = Depends(get_db)):
+async def read_store(
+    request: Request,
+    store_id: int,
+    active_only: bool = Query(False, description="Only include promotions that have not expired"),
+    promotions_limit: int = Query(100, ge=1, le=1000),
+    promotions_offset: int = Query(0, ge=0),
+    db=Depends(get_session),
+):
     """
     Retrieves a specific grocery store by its ID.
-    Includes a list of its current promotions.
+    Includes a page of its promotions (ordered by ID), optionally only the active ones.
+    Responses are cached until the store or its promotions change, and carry an ETag.
     """
-    db_store = crud.get_store(db=db, store_id=store_id)
-    if db_store is None:
+    cached = cached_response(request)
+    if cached is not None:
+        return cached
+    store = await run_crud(
+        "get_store_rows",
+        db=db,
+        store_id=store_id,
+        active_only=active_only,
+        promotions_limit=promotions_limit,
+        promotions_offset=promotions_offset,
+    )
+    if store is None:
         raise HTTPException(status_code=404, detail=f"Store with ID {store_id} not found")
-    return db_store
+    # Rows straight to JSON: same bytes as schemas.StoreRead, without per-object validation
+    body = serialization.store_read_json(*store)
+    return cache_and_respond(request, body, [store_tag(store_id)])
+
+# --- Promotion Endpoints ---
+
+@app.get("/api/v1/promotions", response_model=schemas.PromotionPage, tags=["Promotions"])
+async def list_promotions(
+    q: Optional[str] = Query(None, min_length=1, description="Product name to filter on"),
+    chain_name: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db=Depends(get_session),
+):
+    """
+    Lists active promotions cheapest first, optionally filtered by product name and chain.
+    Uses keyset (cursor) pagination: pass next_cursor to get the following page.
+    """
+    after = None
+    if cursor is not None:
+        try:
+            price, promotion_id = pagination.decode_cursor("promotions", cursor, 2)
+            after = (Decimal(price), int(promotion_id))
+            if not after[0].is_finite():  # Decimal accepts "NaN" and "Infinity"
+                raise ValueError(price)
+        except pagination.InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except (ValueError, TypeError, ArithmeticError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    promotions = await run_crud(
+        "get_promotions", db=db, product=q, chain_name=chain_name, after=after, limit=limit + 1
+    )
+    next_cursor = None
+    if len(promotions) > limit:
+        promotions = promotions[:limit]
+        last = promotions[-1]
+        next_cursor = pagination.encode_cursor("promotions", [str(last.sale_price), last.id])
+    return schemas.PromotionPage(items=promotions, next_cursor=next_cursor)
+
+@app.get("/api/v1/promotions/search", response_model=List[schemas.PromotionSearchResult], tags=["Promotions"])
+def search_promotions(
+    q: str = Query(..., min_length=2, max_length=100, description="Product to search for, e.g. 'Vollmilch 1L'"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """
+    Fuzzy search over active promotions by product name and description,
+    ranked by similarity and then by price.
+    """
+    return [
+        schemas.PromotionSearchResult(**schemas.PromotionRead.model_validate(promotion).model_dump(), score=round(score, 4))
+        for promotion, score in crud.search_promotions(db=db, query=q, limit=limit)
+    ]
+
+@app.get("/api/v1/promotions/nearby", response_model=List[schemas.NearbyPromotionRead], tags=["Promotions"])
+def read_nearby_promotions(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(3000, gt=0, le=50000),
+    q: Optional[str] = Query(None, min_length=1, description="Product name to search for"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the cheapest active promotions at stores within radius_m metres of (lat, lon),
+    ordered by sale price and then by distance.
+    """
+    cached = cached_response(request)
+    if cached is not None:
+        return cached
+    rows = crud.get_nearby_promotions(
+        db=db, latitude=lat, longitude=lon, radius_m=radius_m, query=q, limit=limit
+    )
+    results = [
+        schemas.NearbyPromotionRead(
+            **schemas.PromotionRead.model_validate(promotion).model_dump(),
+            store_name=store.name,
+            chain_name=store.chain_name,
+            distance_m=distance_m,
+        )
+        for promotion, store, distance_m in rows
+    ]
+    body = _nearby_promotions_adapter.dump_json(results)
+    return cache_and_respond(request, body, nearby_tags(lat, lon, radius_m, (store for _, store, _ in rows)))
+
+@app.get("/api/v1/best-prices", response_model=List[schemas.BestPriceRead], tags=["Promotions"])
+def read_best_prices(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(3000, gt=0, le=50000),
+    q: Optional[str] = Query(None, min_length=1, description="Product name to filter on"),
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    """
+    Returns the lowest current price of each product around (lat, lon), read from the
+    precomputed best_prices table. Coverage is by geohash cell, so stores slightly
+    beyond radius_m can be included; distance_m tells how far each one is.
+    """
+    cached = cached_response(request)
+    if cached is not None:
+        return cached
+    rows = best_price.nearby_best_prices(
+        db=db, latitude=lat, longitude=lon, radius_m=radius_m, query=q, limit=limit
+    )
+    results = [
+        schemas.BestPriceRead(
+            **schemas.PromotionRead.model_validate(promotion).model_dump(),
+            store_name=store.name,
+            chain_name=store.chain_name,
+            distance_m=distance_m,
+            product_key=row.product_key,
+            cell=row.cell,
+        )
+        for row, promotion, store, distance_m in rows
+    ]
+    body = _best_prices_adapter.dump_json(results)
+    return cache_and_respond(request, body, nearby_tags(lat, lon, radius_m, (store for _, _, store, _ in rows)))
+
+@app.post("/api/v1/promotions/ingest", response_model=schemas.PromotionIngestResult, tags=["Promotions"])
+async def ingest_promotion_feed(
+    request: Request,
+    batch_size: int = Query(ingest.PROMOTION_INGEST_BATCH_SIZE, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """
+    Ingests a promotion feed sent as CSV (text/csv) or NDJSON (any other content type).
+
+    Rows are upserted on (store_id, product_name, valid_until); unchanged rows are not
+    rewritten. Invalid rows are skipped and reported instead of failing the feed.
+    """
+    fmt = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "ndjson"
+    # Spool the upload (to disk past 8 MB) so memory stays bounded for large flyers
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    feed = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    try:
+        return await run_in_threadpool(
+            ingest.ingest_promotions, db, ingest.iter_feed_records(feed, fmt), batch_size
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Feed must be UTF-8 encoded")
+    finally:
+        feed.close()
+
+@app.get("/api/v1/price-history/stats", response_model=schemas.PriceStats, tags=["Promotions"])
+def read_price_stats(
+    product: str = Query(..., min_length=1, description="Product name, e.g. 'Vollmilch 1L'"),
+    days: int = Query(365, ge=1, le=3650),
+    store_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Min, median and max observed price of a product over the last `days` days,
+    to tell whether a current promotion is actually a good deal.
+    """
+    stats = price_history.price_stats(db, product, days=days, store_id=store_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No price history for '{product}'")
+    return stats
+
+# --- Basket Endpoints ---
+
+@app.post("/api/v1/basket/optimize", response_model=schemas.BasketResult, tags=["Basket"])
+def optimize_basket(request: schemas.BasketRequest, db: Session = Depends(get_db)):
+    """
+    Finds the store, or combination of up to max_stores stores, where the shopping list
+    costs least, counting travel (a round trip from the given location) at cost_per_km.
+    Small inputs are solved exactly within time_budget_ms; "exact" tells whether the
+    result is proven optimal.
+    """
+    return basket.optimize_basket(db, request)
+
+# --- Price Alert Endpoints ---
+
+@app.get("/api/v1/price-alerts/stream", tags=["Price Alerts"], response_class=StreamingResponse)
+async def stream_price_alerts(
+    q: str = Query(..., min_length=3, max_length=100, description="Product name to watch"),
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(3000, gt=0, le=20000),
+    max_price: float = Query(..., gt=0),
+):
+    """
+    Server-sent events: a "price_alert" (schemas.PriceAlert) whenever a promotion for
+    the product at or below max_price is written at a store within radius_m of (lat, lon).
+    The subscription lasts as long as the connection.
+    """
+    request = schemas.PriceAlertSubscription(q=q, latitude=lat, longitude=lon, radius_m=radius_m, max_price=max_price)
+    connection = subscriptions.broker.connect()
+    try:
+        subscription = subscriptions.broker.subscribe(connection, request)
+    except ValueError as e:
+        subscriptions.broker.disconnect(connection)
+        raise HTTPException(status_code=422, detail=str(e))
+    return StreamingResponse(
+        subscriptions.sse_stream(connection, subscription),
+        media_type="text/event-stream",
+        # Stop proxies (e.g. nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/api/v1/price-alerts/ws")
+async def price_alerts_websocket(websocket: WebSocket):
+    """
+    Price alerts over a WebSocket. Send {"action": "subscribe", ...PriceAlertSubscription}
+    (answered with {"type": "subscribed", "subscription_id": ...}) or
+    {"action": "unsubscribe", "subscription_id": ...}; alerts arrive as
+    {"type": "price_alert", ...PriceAlert}. Subscriptions end with the connection.
+    """
+    await websocket.accept()
+    connection = subscriptions.broker.connect()
+
+    async def send_alerts():
+        while True:
+            await websocket.send_text((await connection.next_alert()).decode())
+
+    sender = asyncio.create_task(send_alerts())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = orjson.loads(text)
+                action = message.pop("action", None) if isinstance(message, dict) else None
+                if action == "subscribe":
+                    request = schemas.PriceAlertSubscription.model_validate(message)
+                    subscription = subscriptions.broker.subscribe(connection, request)
+                    await websocket.send_json({"type": "subscribed", "subscription_id": subscription.id})
+                elif action == "unsubscribe":
+                    removed = subscriptions.broker.unsubscribe(connection, int(message.get("subscription_id", 0)))
+                    await websocket.send_json({"type": "unsubscribed", "subscription_id": message.get("subscription_id"), "found": removed})
+                else:
+                    await websocket.send_json({"type": "error", "detail": "action must be 'subscribe' or 'unsubscribe'"})
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors(include_url=False, include_context=False)})
+            except (TypeError, ValueError) as e:  # Including malformed JSON
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        subscriptions.broker.disconnect(connection)
+
+@app.get("/api/v1/price-alerts/stats", response_model=schemas.PriceAlertStats, tags=["Price Alerts"])
+def read_price_alert_stats():
+    """
+    Connections and subscriptions of this worker process, and alerts sent so far.
+    """
+    return subscriptions.broker.stats()
 
 # To allow running with uvicorn main:app --reload from the 'backend' directory
 if __name__ == "__main__":
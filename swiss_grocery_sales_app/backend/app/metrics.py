@@ -0,0 +1,434 @@
+import bisect
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# Configuration (overridable via environment variables)
+# Header-triggered profiling is off unless PROFILING_ENABLED=1 (never enable it on a public endpoint)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_HEADER = "X-Profile"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL_S = float(os.getenv("PROFILE_SAMPLE_INTERVAL_S", "0.001"))
+
+# Latency buckets in seconds (Prometheus client defaults, extended for slow requests)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _pid() -> str:
+    return str(os.getpid())
+
+
+def _sample_labels(metric, key: LabelValues) -> Tuple[Tuple[str, ...], LabelValues]:
+    # Each worker counts on its own and a scrape reaches one of them: per-process
+    # metrics carry its pid so every worker is a separate series (sum without (pid))
+    if metric.per_process:
+        return ("pid",) + metric.labelnames, (_pid(),) + key
+    return metric.labelnames, key
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """
+    Monotonic counter with labels, rendered in the Prometheus text format.
+    Per-process counters are rendered with a pid label.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), per_process: bool = False):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.per_process = per_process
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(*_sample_labels(self, key))} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels, rendered in the Prometheus text format.
+    Per-process histograms are rendered with a pid label.
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        per_process: bool = False,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.per_process = per_process
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            names, key = _sample_labels(self, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(names, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from a callback at scrape time, rendered in the Prometheus text format.
+    The callback returns {label values: value}, or a single value if there are no labels.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def clear(self) -> None:
+        pass
+
+    def samples(self) -> List[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+            if value is not None
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self) -> None:
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status"), per_process=True
+))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"), per_process=True
+))
+DB_QUERIES_PER_REQUEST = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request.", ("route",), QUERY_COUNT_BUCKETS, per_process=True
+))
+DB_QUERY_SECONDS_PER_REQUEST = registry.register(Histogram(
+    "db_query_seconds_per_request", "Time spent executing SQL per HTTP request.", ("route",), per_process=True
+))
+DB_QUERY_DURATION = registry.register(Histogram(
+    "db_query_duration_seconds", "Latency of individual SQL statements.", per_process=True
+))
+DB_POOL_WAIT = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool.", per_process=True
+))
+GEOADMIN_REQUEST_DURATION = registry.register(Histogram(
+    "geoadmin_request_duration_seconds", "Latency of upstream GeoAdmin requests by outcome.", ("outcome",), per_process=True
+))
+GEOADMIN_ERRORS = registry.register(Counter(
+    "geoadmin_errors_total", "Failed upstream GeoAdmin requests by error type.", ("error",), per_process=True
+))
+
+
+def process_start_time() -> float:
+    """
+    Unix time the current process started (from /proc on Linux; elsewhere the time
+    this module was imported, which is shortly after).
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, which may contain spaces; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _IMPORTED_AT
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """
+    Current resident set size of this process (peak RSS where /proc is unavailable).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+_IMPORTED_AT = time.time()
+PROCESS_STARTED_AT = process_start_time()
+# Set by the warm-up and the first request of this worker, see startup_timings()
+_startup: Dict[str, float] = {}
+
+
+def mark_ready() -> None:
+    _startup.setdefault("ready", time.time())
+
+
+def mark_first_request() -> bool:
+    """
+    Records the first request of this process; returns True the first time only.
+    """
+    if "first_request" in _startup:
+        return False
+    _startup["first_request"] = time.time()
+    return True
+
+
+def startup_timings() -> Dict[str, float]:
+    """
+    Seconds from process start until the app was ready (lifespan done) and until its
+    first request, for the phases that happened.
+    """
+    return {phase: at - PROCESS_STARTED_AT for phase, at in _startup.items()}
+
+
+PROCESS_RESIDENT_MEMORY = registry.register(Gauge(
+    "process_resident_memory_bytes", "Resident memory of this worker process.",
+    lambda: {(_pid(),): resident_memory_bytes()}, ("pid",)
+))
+PROCESS_START_TIME = registry.register(Gauge(
+    "process_start_time_seconds", "Start time of this worker process since the Unix epoch.",
+    lambda: {(_pid(),): PROCESS_STARTED_AT}, ("pid",)
+))
+APP_STARTUP = registry.register(Gauge(
+    "app_startup_seconds", "Seconds from process start until the app was ready and until its first request.",
+    lambda: {(_pid(), phase): seconds for phase, seconds in startup_timings().items()}, ("pid", "phase")
+))
+ADDRESS_INDEX_LOOKUPS = registry.register(Counter(
+    "address_index_lookups_total", "Lookups in the offline address index by result.", ("result",), per_process=True
+))
+PRICE_ALERTS = registry.register(Counter(
+    "price_alerts_total", "Price alerts sent to subscribers, or dropped because a client fell behind.", ("outcome",),
+    per_process=True,
+))
+
+
+class RequestStats:
+    """
+    Per-request counters, shared with threadpool workers through a context variable.
+    """
+    __slots__ = ("queries", "query_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+def instrument_engine(engine) -> None:
+    """
+    Counts and times every SQL statement executed on the engine, globally and for
+    the current request. Works for sync engines and the sync_engine of async engines.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a free connection.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            DB_POOL_WAIT.observe(waited)
+            stats = current_request.get()
+            if stats is not None:
+                stats.pool_wait_seconds += waited
+
+
+class StackSampler:
+    """
+    Sampling profiler for one request: every interval it records the Python stack of
+    every other thread, so work in the event loop and in threadpool workers is both
+    captured (cProfile only sees the thread it was enabled in). Output is in the
+    collapsed-stack format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval_s: float = PROFILE_SAMPLE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks: _Counter = _Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop.wait(self.interval_s)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def dump(self, directory: str, label: str) -> str:
+        """
+        Writes the collapsed stacks to a new file in directory and returns its path.
+        """
+        os.makedirs(directory, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        path = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9:09d}-{safe_label}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return path
+
+
+def route_label(scope: dict) -> str:
+    """
+    Route template of a handled request (e.g. /api/v1/stores/{store_id}), so labels
+    stay bounded; unmatched paths are grouped under "unmatched".
+    """
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def server_timing(stats: RequestStats, total_s: float) -> str:
+    """
+    Server-Timing header value, shown by browser dev tools.
+    """
+    return (
+        f'db;dur={stats.query_seconds * 1000:.2f};desc="{stats.queries} queries", '
+        f"pool;dur={stats.pool_wait_seconds * 1000:.2f}, "
+        f"total;dur={total_s * 1000:.2f}"
+    )
+
+
+def observe_request(method: str, route: str, status: int, elapsed_s: float, stats: RequestStats) -> None:
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+    HTTP_REQUEST_DURATION.observe(elapsed_s, method=method, route=route)
+    DB_QUERIES_PER_REQUEST.observe(stats.queries, route=route)
+    DB_QUERY_SECONDS_PER_REQUEST.observe(stats.query_seconds, route=route)
@@ -1,11 +1,27 @@
-from sqlalchemy import Column, Integer, String, Float, Text, Date, DateTime, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, Date, DateTime, Numeric, ForeignKey, Index, PrimaryKeyConstraint, UniqueConstraint, DDL, cast, event, literal_column
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func # For server-side default timestamp
-from geoalchemy2 import Geometry # For PostGIS geometry types
+from geoalchemy2 import Geometry, Geography # For PostGIS geometry types
 
 # Import Base and engine from database.py
 # The '.' indicates a relative import from the current package 'app'
 from .database import Base, engine
+from .search import normalize_product_name
+from .spatial import geohash
+
+# Geohash precision of Store.cell (about 4.9 x 3.3 km cells in Switzerland)
+STORE_CELL_PRECISION = 5
+
+def _store_cell(context):
+    params = context.get_current_parameters()
+    return geohash(params["Latitude"], params["Longitude"], STORE_CELL_PRECISION)
+
+# Stands in for a NULL ValidUntil in the promotions natural key, so open-ended
+# promotions conflict with each other on every database (NULLs never compare equal)
+OPEN_ENDED_VALID_UNTIL = literal_column("'9999-12-31'")
+
+def _product_key(context):
+    return normalize_product_name(context.get_current_parameters()["ProductName"])
 
 class Store(Base):
     __tablename__ = "stores"
@@ -16,19 +32,49 @@ class Store(Base):
     latitude = Column("Latitude", Float, nullable=False)
     longitude = Column("Longitude", Float, nullable=False)
     chain_name = Column("ChainName", String(100))
+    # Geohash cell of the store, derived from latitude/longitude on insert
+    # (bulk upserts set it explicitly, see crud.bulk_upsert_stores)
+    cell = Column("GeoCell", String(12), index=True, default=_store_cell)
 
     # PostGIS geometry column for geospatial queries
     # SRID 4326 is for WGS84 (latitude/longitude)
-    geom = Column("geom", Geometry(geometry_type='POINT', srid=4326), nullable=True)
+    # On other databases (e.g. SQLite in tests) the WKT is stored as plain text
+    # and radius queries use the in-memory store locations of app.distance.
+    geom = Column("geom", Text().with_variant(Geometry(geometry_type='POINT', srid=4326), "postgresql"), nullable=True)
 
     promotions = relationship("Promotion", back_populates="store")
 
+    __table_args__ = (
+        # Keyset pagination of GET /api/v1/stores filtered by chain
+        Index("ix_stores_chain_name_id", "ChainName", "StoreID"),
+        # Natural key used by bulk imports to upsert instead of duplicating stores
+        UniqueConstraint("Name", "Address", name="uq_stores_name_address"),
+        # Plain geometry index for bounding-box queries
+        Index("idx_stores_geom", geom, postgresql_using="gist").ddl_if(dialect="postgresql"),
+        # Geography-cast index so ST_DWithin can filter by metres. Queries must use
+        # the exact same expression (see store_geography()) for it to be picked up.
+        Index(
+            "idx_stores_geom_geography",
+            cast(geom, Geography(srid=4326)),
+            postgresql_using="gist",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+def store_geography():
+    """
+    SQL expression for Store.geom cast to geography, matching idx_stores_geom_geography.
+    """
+    return cast(Store.geom, Geography(srid=4326))
+
 class Promotion(Base):
     __tablename__ = "promotions"
 
     id = Column("PromotionID", Integer, primary_key=True, index=True, autoincrement=True)
     store_id = Column("StoreID", Integer, ForeignKey("stores.StoreID"), nullable=False)
     product_name = Column("ProductName", String(255), nullable=False)
+    # Normalized product name (see search.normalize_product_name), derived on insert
+    product_key = Column("ProductKey", String(255), index=True, default=_product_key)
     sale_price = Column("SalePrice", Numeric(10, 2), nullable=False)
     original_price = Column("OriginalPrice", Numeric(10, 2), nullable=True)
     valid_until = Column("ValidUntil", Date, nullable=True)
@@ -46,6 +92,102 @@ class Promotion(Base):
 
     store = relationship("Store", back_populates="promotions")
 
+    __table_args__ = (
+        # Natural key of a flyer row, used by feed ingestion to upsert. Upserts must
+        # use the exact same expressions (see promotion_natural_key()).
+        Index(
+            "uq_promotions_store_product_valid_until",
+            "StoreID", "ProductName", func.coalesce(valid_until, OPEN_ENDED_VALID_UNTIL),
+            unique=True,
+        ),
+        # Paging through a store's promotions in ID order
+        Index("ix_promotions_store_id_id", "StoreID", "PromotionID"),
+        # Keyset pagination of GET /api/v1/promotions (cheapest first)
+        Index("ix_promotions_sale_price_id", "SalePrice", "PromotionID"),
+        # Trigram indexes for fuzzy product search ("Milch", "milk", "Vollmilch 1L")
+        Index(
+            "ix_promotions_product_name_trgm", "ProductName",
+            postgresql_using="gin", postgresql_ops={"ProductName": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_promotions_description_trgm", "Description",
+            postgresql_using="gin", postgresql_ops={"Description": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+def promotion_natural_key():
+    """
+    SQL expressions of the promotions natural key, matching uq_promotions_store_product_valid_until.
+    """
+    return (
+        Promotion.store_id,
+        Promotion.product_name,
+        func.coalesce(Promotion.valid_until, OPEN_ENDED_VALID_UNTIL),
+    )
+
+class BestPrice(Base):
+    """
+    Precomputed cheapest active promotion per (normalized product, store cell).
+    Maintained incrementally by app.best_price.
+    """
+    __tablename__ = "best_prices"
+
+    product_key = Column("ProductKey", String(255), primary_key=True)
+    cell = Column("GeoCell", String(12), primary_key=True, index=True)
+    promotion_id = Column("PromotionID", Integer, ForeignKey("promotions.PromotionID", ondelete="CASCADE"), nullable=False)
+    store_id = Column("StoreID", Integer, ForeignKey("stores.StoreID", ondelete="CASCADE"), nullable=False)
+    sale_price = Column("SalePrice", Numeric(10, 2), nullable=False)
+    valid_until = Column("ValidUntil", Date, nullable=True, index=True)
+
+    promotion = relationship("Promotion")
+    store = relationship("Store")
+
+class PriceHistoryProduct(Base):
+    """
+    Dictionary of the normalized product names in price_history, so each observation
+    stores a 4-byte ProductID instead of the name.
+    """
+    __tablename__ = "price_history_products"
+
+    id = Column("ProductID", Integer, primary_key=True, autoincrement=True)
+    product_key = Column("ProductKey", String(255), nullable=False, unique=True)
+
+class PriceObservation(Base):
+    """
+    Append-only price history: one row per (product, store, time) a price was seen.
+
+    Storage per observation on PostgreSQL is about 85 bytes:
+    - the heap tuple takes about 48 bytes: a 24-byte header, 4+4+4+8 bytes of
+      data and a 4-byte line pointer;
+    - the primary key B-tree entry takes about 36 bytes. It includes PriceCents,
+      so per-product time range queries are index-only scans;
+    - the BRIN index on ObservedAt adds only a few bytes per 128 pages.
+    Prices are stored as integer centimes. On SQLite the table is clustered on the
+    primary key (WITHOUT ROWID), which gives about 40 bytes per observation and the
+    same contiguous range scans.
+    """
+    __tablename__ = "price_history"
+
+    product_id = Column("ProductID", Integer, ForeignKey("price_history_products.ProductID"), nullable=False)
+    observed_at = Column("ObservedAt", DateTime(timezone=True), nullable=False)
+    store_id = Column("StoreID", Integer, ForeignKey("stores.StoreID", ondelete="CASCADE"), nullable=False)
+    price_cents = Column("PriceCents", Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("ProductID", "ObservedAt", "StoreID", postgresql_include=["PriceCents"]),
+        # Rows are appended in time order, so a BRIN index on time stays tiny and
+        # still lets time-window scans (e.g. retention) skip old blocks
+        Index("brin_price_history_observed_at", "ObservedAt", postgresql_using="brin").ddl_if(dialect="postgresql"),
+        {"sqlite_with_rowid": False},
+    )
+
+# The trigram indexes need the pg_trgm extension
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
 # Function to create tables in the database
 # This can be called from main.py or a separate script
 def create_db_tables():
@@ -0,0 +1,9 @@
+from decimal import Decimal
+
+
+def to_centimes(price) -> int:
+    """
+    Converts a price in francs (Decimal or float) to integer centimes, rounding
+    half to even. Integer centimes add up exactly, unlike floats.
+    """
+    return int((Decimal(str(price)) * 100).to_integral_value())
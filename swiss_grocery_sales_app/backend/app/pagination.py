@@ -0,0 +1,34 @@
+import base64
+import json
+from typing import Any, List
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded or belongs to another listing."""
+
+
+def encode_cursor(kind: str, values: List[Any]) -> str:
+    """
+    Encodes the sort key of the last item of a page into an opaque, URL-safe token.
+    `kind` names the listing so a cursor cannot be replayed against another one.
+    """
+    payload = json.dumps({"k": kind, "v": values}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(kind: str, token: str, size: int) -> List[Any]:
+    """
+    Decodes a token produced by encode_cursor() for the same listing.
+    Raises InvalidCursor if it is malformed, truncated or for another listing.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not isinstance(payload, dict) or payload.get("k") != kind:
+        raise InvalidCursor("Cursor does not belong to this listing")
+    values = payload.get("v")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Malformed cursor")
+    return values
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import crud, models, search
+from .money import to_centimes
+
+# (product_key, store_id, sale_price, observed_at)
+Observation = Tuple[str, int, object, datetime]
+
+# Observations inserted per statement
+PRICE_HISTORY_CHUNK_SIZE = 1000
+
+
+def product_ids(db: Session, product_keys: Iterable[str]) -> Dict[str, int]:
+    """
+    Returns the ProductID of each product key, adding missing keys to the dictionary table.
+    """
+    keys = sorted(set(product_keys))
+    if not keys:
+        return {}
+    insert = crud.dialect_insert(db)
+    for chunk in crud.chunked(keys, PRICE_HISTORY_CHUNK_SIZE):
+        db.execute(
+            insert(models.PriceHistoryProduct)
+            .values([{"product_key": key} for key in chunk])
+            .on_conflict_do_nothing(index_elements=[models.PriceHistoryProduct.product_key])
+        )
+    ids: Dict[str, int] = {}
+    for chunk in crud.chunked(keys, PRICE_HISTORY_CHUNK_SIZE):
+        ids.update(
+            db.query(models.PriceHistoryProduct.product_key, models.PriceHistoryProduct.id)
+            .filter(models.PriceHistoryProduct.product_key.in_(chunk))
+        )
+    return ids
+
+
+def record_observations(db: Session, observations: Iterable[Observation]) -> int:
+    """
+    Appends price observations. An observation repeating an existing
+    (product, time, store) is ignored. Does not commit. Returns the number of rows written.
+    """
+    observations = [observation for observation in observations if observation[0]]
+    if not observations:
+        return 0
+    ids = product_ids(db, (product_key for product_key, _, _, _ in observations))
+    rows = {
+        (ids[product_key], observed_at, store_id): {
+            "product_id": ids[product_key],
+            "observed_at": observed_at,
+            "store_id": store_id,
+            "price_cents": to_centimes(price),
+        }
+        for product_key, store_id, price, observed_at in observations
+    }
+    insert = crud.dialect_insert(db)
+    written = 0
+    for chunk in crud.chunked(rows.values(), PRICE_HISTORY_CHUNK_SIZE):
+        written += db.execute(
+            insert(models.PriceObservation).values(chunk).on_conflict_do_nothing()
+        ).rowcount
+    return written
+
+
+def record_promotions(db: Session, promotions: Iterable, observed_at: Optional[datetime] = None) -> int:
+    """
+    Records the prices of inserted or changed promotions, e.g. the rows returned by
+    crud.upsert_promotions (anything with product_key, store_id and sale_price).
+    """
+    observed_at = observed_at or datetime.now(timezone.utc)
+    return record_observations(
+        db,
+        ((promotion.product_key, promotion.store_id, promotion.sale_price, observed_at) for promotion in promotions),
+    )
+
+
+def price_stats(
+    db: Session,
+    product: str,
+    days: int = 365,
+    store_id: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> Optional[dict]:
+    """
+    Min, median and max price (in francs) of a product over the last `days` days,
+    optionally at one store. Returns None if the product has no history.
+
+    Reads one primary-key range (ProductID, ObservedAt): a year of history for one
+    product is a few thousand index entries. PostgreSQL computes the median with
+    percentile_cont; other databases read only the middle row(s) in price order.
+    """
+    product_key = search.normalize_product_name(product)
+    product_id = db.query(models.PriceHistoryProduct.id).filter(
+        models.PriceHistoryProduct.product_key == product_key
+    ).scalar()
+    if product_id is None:
+        return None
+
+    until = now or datetime.now(timezone.utc)
+    since = until - timedelta(days=days)
+    price = models.PriceObservation.price_cents
+    conditions = [
+        models.PriceObservation.product_id == product_id,
+        models.PriceObservation.observed_at >= since,
+        models.PriceObservation.observed_at <= until,
+    ]
+    if store_id is not None:
+        conditions.append(models.PriceObservation.store_id == store_id)
+
+    if db.get_bind().dialect.name == "postgresql":
+        count, low, median, high = db.execute(
+            select(func.count(), func.min(price), func.percentile_cont(0.5).within_group(price), func.max(price))
+            .where(*conditions)
+        ).one()
+    else:
+        count, low, high = db.execute(select(func.count(), func.min(price), func.max(price)).where(*conditions)).one()
+        median = None
+        if count:
+            # The middle one or two prices, without fetching the others
+            middle = db.execute(
+                select(price).where(*conditions).order_by(price).offset((count - 1) // 2).limit(2 - count % 2)
+            ).scalars().all()
+            median = sum(middle) / len(middle)
+
+    return {
+        "product_key": product_key,
+        "since": since,
+        "until": until,
+        "observations": count,
+        "min_price": low / 100 if low is not None else None,
+        "median_price": round(float(median) / 100, 4) if median is not None else None,
+        "max_price": high / 100 if high is not None else None,
+    }
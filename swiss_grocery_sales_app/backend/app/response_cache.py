@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import orjson
+
+# Configuration (overridable via environment variables)
+# Set RESPONSE_CACHE_MAX_ENTRIES to 0 to disable response caching.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Upper bound on staleness for changes that are not writes, e.g. a promotion passing its valid_until date
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "300"))
+# PostgreSQL channel over which workers send each other the tags they invalidate
+RESPONSE_CACHE_CHANNEL = os.getenv("RESPONSE_CACHE_CHANNEL", "response_cache")
+# TTL cap for several workers that cannot send invalidations to each other (no PostgreSQL)
+RESPONSE_CACHE_UNSHARED_TTL_S = float(os.getenv("RESPONSE_CACHE_UNSHARED_TTL_S", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+def make_etag(body: bytes) -> str:
+    """
+    Strong ETag derived from the response body.
+    """
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header value matches etag (weak comparison, as RFC 9110 requires for GET).
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def cache_key(path: str, params: Iterable[Tuple[str, str]]) -> str:
+    """
+    Cache key for a route and its (name, value) query parameters, independent of parameter order.
+    """
+    return path + "?" + "&".join(f"{name}={value}" for name, value in sorted(params))
+
+
+def store_tag(store_id: int) -> str:
+    return f"store:{store_id}"
+
+
+def cell_tag(cell: str) -> str:
+    return f"cell:{cell}"
+
+
+class LRUBackend:
+    """
+    In-process storage for ResponseCache: an LRU bounded by entry count and total body size,
+    with a tag -> keys index for invalidation.
+
+    Another backend (e.g. one shared by all workers) only needs the same get/set/delete/invalidate/clear
+    methods and __len__.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._tags_by_key: Dict[str, Set[str]] = {}
+        self._keys_by_tag: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CachedResponse, tags: Iterable[str]) -> None:
+        self._remove(key)
+        self._entries[key] = entry
+        self.bytes += len(entry.body)
+        self._tags_by_key[key] = set(tags)
+        for tag in self._tags_by_key[key]:
+            self._keys_by_tag[tag].add(key)
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        keys = set()
+        for tag in tags:
+            keys.update(self._keys_by_tag.pop(tag, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def delete(self, key: str) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags_by_key.clear()
+        self._keys_by_tag.clear()
+        self.bytes = 0
+        self.evictions = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= len(entry.body)
+        for tag in self._tags_by_key.pop(key, ()):
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class ResponseCache:
+    """
+    Cache of pre-serialized JSON responses for the read endpoints.
+
+    Entries are tagged with the store IDs and geohash cells their content depends on;
+    writes invalidate by those tags (see invalidate_stores). Entries also expire after
+    ttl_s, which bounds staleness from promotions expiring without any write.
+
+    Each worker process has its own cache; see share_with_workers.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[LRUBackend] = None,
+        ttl_s: float = 300,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.ttl_s = ttl_s
+        self.enabled = enabled
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = dict.fromkeys(
+            ("hits", "misses", "not_modified", "invalidations", "bytes_served", "bytes_saved"), 0
+        )
+        # Sends invalidated tags to the other workers, see share_with_workers
+        self.publish: Optional[Callable[[List[str]], None]] = None
+
+    def share_with_workers(self, workers: int, publish: Optional[Callable[[List[str]], None]] = None) -> None:
+        """
+        Keeps the caches of several worker processes consistent: invalidate_stores
+        sends its tags to the other workers with publish(tags), where they are
+        applied by apply_notification. Without publish, entries of several
+        workers expire after RESPONSE_CACHE_UNSHARED_TTL_S at most.
+        """
+        self.publish = publish
+        if publish is None and workers > 1 and self.ttl_s > RESPONSE_CACHE_UNSHARED_TTL_S:
+            logger.warning(
+                "%d workers cannot share response cache invalidations; caching responses for %.0f s only",
+                workers, RESPONSE_CACHE_UNSHARED_TTL_S,
+            )
+            self.ttl_s = RESPONSE_CACHE_UNSHARED_TTL_S
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is not None and entry.expires_at <= self._clock():
+                self.backend.delete(key)
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+            else:
+                self._counters["hits"] += 1
+            return entry
+
+    def set(self, key: str, body: bytes, tags: Iterable[str] = ()) -> CachedResponse:
+        entry = CachedResponse(body=body, etag=make_etag(body), expires_at=self._clock() + self.ttl_s)
+        if self.enabled:
+            with self._lock:
+                self.backend.set(key, entry, tags)
+        return entry
+
+    def record_served(self, entry: CachedResponse, not_modified: bool) -> None:
+        """
+        Counts the bytes a cache hit saved: a 304 saves sending the body, any hit
+        saves querying and serializing it.
+        """
+        with self._lock:
+            if not_modified:
+                self._counters["not_modified"] += 1
+            else:
+                self._counters["bytes_served"] += len(entry.body)
+            self._counters["bytes_saved"] += len(entry.body)
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            removed = self.backend.invalidate(tags)
+            self._counters["invalidations"] += removed
+            return removed
+
+    def invalidate_stores(self, store_ids: Iterable[int], cells: Iterable[str] = ()) -> int:
+        """
+        Drops every response that shows one of the stores or covers one of the cells,
+        here and in the other workers (see share_with_workers). Call after committing
+        writes to stores or promotions, with the stores' cells.
+        """
+        tags = [store_tag(store_id) for store_id in store_ids] + [cell_tag(cell) for cell in cells if cell]
+        removed = self.invalidate(tags)
+        if self.publish is not None and tags and self.enabled:
+            try:
+                self.publish(tags)
+            except Exception as e:  # The write is committed; other workers catch up after ttl_s
+                logger.warning("Cannot send response cache invalidations to the other workers: %s", e)
+        return removed
+
+    def apply_notification(self, payload: str) -> None:
+        """
+        Applies tags published by a worker (JSON array). Raises ValueError if malformed.
+        """
+        tags = orjson.loads(payload)
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValueError("Malformed response cache notification")
+        self.invalidate(tags)
+
+    def clear(self) -> None:
+        """
+        Empties the cache and resets the counters.
+        """
+        with self._lock:
+            self.backend.clear()
+            for name in self._counters:
+                self._counters[name] = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self.backend)
+            stats["bytes"] = getattr(self.backend, "bytes", 0)
+            stats["evictions"] = getattr(self.backend, "evictions", 0)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# Application-wide cache used by the read endpoints in app.main
+response_cache = ResponseCache(
+    backend=LRUBackend(max_entries=max(RESPONSE_CACHE_MAX_ENTRIES, 1), max_bytes=RESPONSE_CACHE_MAX_BYTES),
+    ttl_s=RESPONSE_CACHE_TTL_S,
+    enabled=RESPONSE_CACHE_MAX_ENTRIES > 0,
+)
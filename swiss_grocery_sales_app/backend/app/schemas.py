@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Literal, Optional
 from datetime import date, datetime
 
 # --- Geocoding Schemas ---
@@ -10,6 +10,54 @@ class GeocodeResponse(BaseModel):
     latitude: float
     longitude: float
 
+class BatchGeocodeRequest(BaseModel):
+    addresses: List[str] = Field(..., min_length=1, max_length=10000)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+class BatchGeocodeResult(BaseModel):
+    index: int
+    address: str
+    status: Literal["ok", "not_found", "error"]
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    error: Optional[str] = None
+
+class AddressSuggestion(BaseModel):
+    address_key: str
+    latitude: float
+    longitude: float
+
+class AddressIndexStats(BaseModel):
+    path: str
+    entries: int
+    file_bytes: int
+    bytes_per_entry: float
+    load_ms: float
+
+class GeocodeCacheStats(BaseModel):
+    hits: int
+    persistent_hits: int
+    negative_hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    errors: int
+    size: int
+    max_entries: int
+    hit_ratio: float
+
+class ResponseCacheStats(BaseModel):
+    hits: int
+    misses: int
+    not_modified: int
+    invalidations: int
+    evictions: int
+    bytes_served: int
+    bytes_saved: int
+    size: int
+    bytes: int
+    hit_ratio: float
+
 # --- Promotion Schemas ---
 class PromotionBase(BaseModel):
     product_name: str
@@ -34,6 +82,94 @@ class PromotionRead(PromotionBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class PromotionSearchResult(PromotionRead):
+    score: float
+
+class NearbyPromotionRead(PromotionRead):
+    store_name: str
+    chain_name: Optional[str] = None
+    distance_m: float
+
+class BestPriceRead(NearbyPromotionRead):
+    product_key: str
+    cell: str
+
+class PriceStats(BaseModel):
+    product_key: str
+    since: datetime
+    until: datetime
+    observations: int
+    min_price: Optional[float] = None
+    median_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+# --- Basket Schemas ---
+class BasketRequest(BaseModel):
+    items: List[str] = Field(..., min_length=1, max_length=50)
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    radius_m: float = Field(5000, gt=0, le=50000)
+    max_stores: int = Field(2, ge=1, le=4)
+    # Travel cost in francs per kilometre of the round trip
+    cost_per_km: float = Field(0.5, ge=0)
+    time_budget_ms: float = Field(200, gt=0, le=5000)
+
+class BasketStore(BaseModel):
+    store_id: int
+    name: str
+    chain_name: Optional[str] = None
+    distance_m: float
+
+class BasketItem(BaseModel):
+    item: str
+    promotion_id: Optional[int] = None
+    product_name: Optional[str] = None
+    store_id: Optional[int] = None
+    sale_price: Optional[float] = None
+
+class BasketResult(BaseModel):
+    stores: List[BasketStore]
+    items: List[BasketItem]
+    missing_items: List[str]
+    items_total: float
+    travel_cost: float
+    travel_distance_m: float
+    total_cost: float
+    method: Literal["none", "greedy", "exact", "exact_timeout"]
+    exact: bool
+    candidate_stores: int
+    elapsed_ms: float
+
+# --- Price Alert Schemas ---
+class PriceAlertSubscription(BaseModel):
+    # Matched against normalized product names, like the basket items
+    q: str = Field(..., min_length=3, max_length=100)
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    radius_m: float = Field(3000, gt=0, le=20000)
+    max_price: float = Field(..., gt=0)
+
+class PriceAlert(BaseModel):
+    type: Literal["price_alert"] = "price_alert"
+    subscription_id: int
+    promotion_id: int
+    store_id: int
+    store_name: str
+    chain_name: Optional[str] = None
+    product_name: str
+    sale_price: float
+    distance_m: float
+
+class PriceAlertStats(BaseModel):
+    bus: str
+    connections: int
+    subscriptions: int
+    index_entries: int
+    candidates_checked: int
+    events: int
+    delivered: int
+    dropped: int
+
 # --- Store Schemas ---
 class StoreBase(BaseModel):
     name: str
@@ -57,3 +193,33 @@ class StoreRead(StoreBase):
     promotions: List[PromotionRead] = []
 
     model_config = ConfigDict(from_attributes=True)
+
+class BulkImportResult(BaseModel):
+    received: int
+    written: int
+    seconds: float
+    rows_per_second: float
+
+class IngestError(BaseModel):
+    line: Optional[int] = None
+    field: Optional[str] = None
+    error: str
+
+class PromotionIngestResult(BaseModel):
+    received: int
+    written: int
+    unchanged: int
+    invalid: int
+    seconds: float
+    rows_per_second: float
+    store_ids: List[int] = []
+    errors: List[IngestError] = []
+
+# --- Pagination Schemas ---
+class StorePage(BaseModel):
+    items: List[StoreRead]
+    next_cursor: Optional[str] = None
+
+class PromotionPage(BaseModel):
+    items: List[PromotionRead]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Minimum share of the query's trigrams a product must contain to match.
+# Mirrors pg_trgm.word_similarity_threshold, which the PostgreSQL search sets to the same value.
+SEARCH_SIMILARITY_THRESHOLD = 0.4
+
+# Matches in the description count for less than matches in the product name
+DESCRIPTION_WEIGHT = 0.5
+
+# Configuration (overridable via environment variables)
+# Longest a cached search index may miss promotions written by other processes
+SEARCH_INDEX_TTL_S = float(os.getenv("SEARCH_INDEX_TTL_S", "60"))
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_product_name(product_name: str) -> str:
+    """
+    Normalized product key used to group the same product across stores:
+    "Vollmilch  1L" and "vollmilch 1l" map to "vollmilch 1l".
+    """
+    return " ".join(_WORD.findall(unicodedata.normalize("NFKC", product_name).lower()))
+
+
+def trigrams(text: Optional[str]) -> FrozenSet[str]:
+    """
+    Splits text into trigrams the way pg_trgm does: lower-cased alphanumeric words,
+    each padded with two spaces in front and one behind ("milch" -> "  m", " mi", ..., "ch ").
+    """
+    if not text:
+        return frozenset()
+    grams: Set[str] = set()
+    for word in _WORD.findall(unicodedata.normalize("NFKC", text).lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def containment(query_trigrams: FrozenSet[str], text_trigrams: FrozenSet[str]) -> float:
+    """
+    Share of the query's trigrams that occur in the text (0..1), an approximation of
+    pg_trgm's word_similarity(query, text).
+    """
+    if not query_trigrams:
+        return 0.0
+    return len(query_trigrams & text_trigrams) / len(query_trigrams)
+
+
+class ProductSearchIndex:
+    """
+    In-memory trigram inverted index over product names and descriptions.
+
+    This is the fallback for the pg_trgm GIN indexes when the database is not
+    PostgreSQL. A query only visits the posting lists of its own trigrams, so the
+    cost depends on how common those trigrams are rather than on the number of
+    indexed documents.
+    """
+
+    def __init__(self):
+        self._names: Dict[str, List[Hashable]] = defaultdict(list)
+        self._descriptions: Dict[str, List[Hashable]] = defaultdict(list)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: Hashable, product_name: str, description: Optional[str] = None) -> None:
+        for gram in trigrams(product_name):
+            self._names[gram].append(key)
+        for gram in trigrams(description):
+            self._descriptions[gram].append(key)
+        self._size += 1
+
+    def extend(self, rows: Iterable[Tuple[Hashable, str, Optional[str]]]) -> None:
+        for key, product_name, description in rows:
+            self.add(key, product_name, description)
+
+    def search(self, query: str, threshold: float = SEARCH_SIMILARITY_THRESHOLD) -> List[Tuple[Hashable, float]]:
+        """
+        Returns (key, score) for documents scoring at least threshold, best first.
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        name_hits: Counter = Counter()
+        description_hits: Counter = Counter()
+        for gram in query_trigrams:
+            name_hits.update(self._names.get(gram, ()))
+            description_hits.update(self._descriptions.get(gram, ()))
+
+        total = len(query_trigrams)
+        scores: Dict[Hashable, float] = {}
+        for key, hits in name_hits.items():
+            scores[key] = hits / total
+        for key, hits in description_hits.items():
+            scores[key] = max(scores.get(key, 0.0), DESCRIPTION_WEIGHT * hits / total)
+
+        results = [(key, score) for key, score in scores.items() if score >= threshold]
+        results.sort(key=lambda result: -result[1])
+        return results
+
+
+class CachedSearchIndex:
+    """
+    A ProductSearchIndex kept between requests.
+
+    The index is built from load()'s rows on first use and rebuilt after writes in
+    this process (see invalidate()), after ttl_s for writes made elsewhere, and
+    whenever it is requested for a different source (e.g. another database).
+    """
+
+    def __init__(self, ttl_s: float = 60, clock: Callable[[], float] = time.monotonic):
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index: Optional[ProductSearchIndex] = None
+        self._source = None
+        self._loaded_at = 0.0
+        self._stale = True
+        self._counters: Dict[str, int] = dict.fromkeys(("loads", "invalidations"), 0)
+        self.last_load_seconds = 0.0
+
+    def invalidate(self) -> None:
+        """
+        Marks the index as outdated; it is rebuilt on next use.
+        """
+        self._stale = True
+        self._counters["invalidations"] += 1
+
+    def _current(self, source) -> bool:
+        return (
+            self._index is not None and not self._stale and self._source is source
+            and self._clock() - self._loaded_at < self.ttl_s
+        )
+
+    def get(self, source, load: Callable[[], Iterable[Tuple[Hashable, str, Optional[str]]]]) -> ProductSearchIndex:
+        """
+        The index for source, built from load() if the cached one is outdated.
+        """
+        if self._current(source):
+            return self._index
+        with self._lock:
+            if not self._current(source):
+                # Cleared before reading, so a write committed during the load marks it stale again
+                self._stale = False
+                started = time.perf_counter()
+                index = ProductSearchIndex()
+                index.extend(load())
+                self._index = index
+                self.last_load_seconds = time.perf_counter() - started
+                self._source = source
+                self._loaded_at = self._clock()
+                self._counters["loads"] += 1
+            return self._index
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._index) if self._index is not None else 0,
+            "last_load_ms": round(self.last_load_seconds * 1000, 3),
+            **self._counters,
+        }
+
+
+# Index of the active promotions, used by crud.search_promotions on non-PostgreSQL databases
+promotion_index = CachedSearchIndex(ttl_s=SEARCH_INDEX_TTL_S)
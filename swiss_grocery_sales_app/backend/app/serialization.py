@@ -0,0 +1,87 @@
+import types
+import typing
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Type
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from . import schemas
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes plain Python data as compact UTF-8 JSON, formatted like pydantic's
+    model_dump_json (dates in ISO 8601, UTC datetimes with a "Z" suffix).
+    """
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+class ORJSONResponse(Response):
+    """
+    JSON response encoded with dumps(). Content that is already bytes is sent as is.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+# `float | None` annotations (Python 3.10+) have their own origin type
+_UNION_ORIGINS = tuple(origin for origin in (typing.Union, getattr(types, "UnionType", None)) if origin is not None)
+
+
+def _is_float_field(annotation) -> bool:
+    if annotation is float:
+        return True
+    return typing.get_origin(annotation) in _UNION_ORIGINS and float in typing.get_args(annotation)
+
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+def row_encoder(schema: Type[BaseModel], fields: Optional[Sequence[str]] = None) -> Callable[[Sequence], Dict[str, Any]]:
+    """
+    Builds a function turning a row whose columns are in the order of `fields`
+    (default: the schema's fields) into the dict the schema would serialize to.
+
+    No validation happens: values are trusted to come from the database. The only
+    conversion is float() for float fields (Numeric columns come back as Decimal,
+    and pydantic writes 3.0 rather than 3 for floats).
+    """
+    fields = tuple(fields if fields is not None else schema.model_fields)
+    floats = [
+        index for index, field in enumerate(fields)
+        if _is_float_field(schema.model_fields[field].annotation)
+    ]
+
+    def encode(row: Sequence) -> Dict[str, Any]:
+        values = list(row)
+        for index in floats:
+            values[index] = _as_float(values[index])
+        return dict(zip(fields, values))
+
+    return encode
+
+
+# Column order of the rows expected by store_read_json (every field except the nested promotions)
+STORE_READ_FIELDS = tuple(field for field in schemas.StoreRead.model_fields if field != "promotions")
+PROMOTION_READ_FIELDS = tuple(schemas.PromotionRead.model_fields)
+
+_encode_store = row_encoder(schemas.StoreRead, STORE_READ_FIELDS)
+_encode_promotion = row_encoder(schemas.PromotionRead)
+
+
+def store_read_json(store_row: Sequence, promotion_rows: Iterable[Sequence]) -> bytes:
+    """
+    Serializes a store and its promotions to the same bytes as
+    schemas.StoreRead.model_validate(store).model_dump_json(), without building
+    ORM objects or pydantic models. Rows are in STORE_READ_FIELDS/PROMOTION_READ_FIELDS
+    order, as returned by crud.get_store_rows.
+    """
+    store = _encode_store(store_row)
+    store["promotions"] = [_encode_promotion(row) for row in promotion_rows]
+    return dumps(store)
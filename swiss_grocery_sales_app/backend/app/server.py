@@ -0,0 +1,136 @@
+import argparse
+import copy
+import logging
+import math
+import os
+from typing import Optional
+
+# Configuration (overridable via environment variables)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("PORT", "8000"))
+# Worker processes; 0 sizes them from the CPUs available to the container (see default_workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))
+SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "16"))
+SERVER_LOG_LEVEL = os.getenv("SERVER_LOG_LEVEL", "info")
+# Access logs cost measurable CPU per request under load; /metrics has per-route counts
+SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "0") == "1"
+SERVER_KEEPALIVE_S = int(os.getenv("SERVER_KEEPALIVE_S", "5"))
+# Comma-separated proxy addresses trusted for X-Forwarded-* headers
+SERVER_FORWARDED_ALLOW_IPS = os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+logger = logging.getLogger(__name__)
+
+
+def cgroup_cpu_limit(root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """
+    CPU quota of the container in CPUs (e.g. 1.5 for "150000 100000"), or None if
+    it is unlimited or cannot be read. Supports cgroup v2 and v1.
+    """
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+            quota = int(f.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def usable_cpus() -> int:
+    """
+    CPUs this process may run on: the affinity mask, further limited by the
+    container's CPU quota (os.cpu_count() reports the host's CPUs).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+def default_workers() -> int:
+    """
+    One worker per usable CPU: each worker runs an event loop plus a threadpool for
+    the synchronous endpoints, so more processes than CPUs only add memory and
+    database connections.
+    """
+    if WEB_CONCURRENCY > 0:
+        return WEB_CONCURRENCY
+    return max(1, min(usable_cpus(), SERVER_MAX_WORKERS))
+
+
+def worker_count() -> int:
+    """
+    Worker processes serving the app, as exported to them by main() in
+    WEB_CONCURRENCY (which uvicorn and gunicorn read too); 1 if unknown.
+    """
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    except ValueError:
+        return 1
+
+
+def log_config(level: str) -> dict:
+    """
+    uvicorn's logging configuration, extended so the app's own loggers (warm-up,
+    first request timing, geocoding) are printed too.
+    """
+    from uvicorn.config import LOGGING_CONFIG
+
+    config = copy.deepcopy(LOGGING_CONFIG)
+    config["loggers"]["app"] = {"handlers": ["default"], "level": level.upper(), "propagate": False}
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with multiple uvicorn worker processes.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Default: one per usable CPU")
+    parser.add_argument("--log-level", default=SERVER_LOG_LEVEL)
+    parser.add_argument("--access-log", action="store_true", default=SERVER_ACCESS_LOG)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    from .database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+    workers = args.workers or default_workers()
+    # Inherited by the workers, so process-local state can tell it is not alone (worker_count())
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    logging.basicConfig(level=args.log_level.upper())
+    logger.info(
+        "Starting %d worker(s) on %s:%d (%d usable CPUs); up to %d database connections in total",
+        workers, args.host, args.port, usable_cpus(), workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+    )
+    # Each worker imports app.main itself, then runs the lifespan warm-up before it
+    # accepts connections; startup and first request times are logged per worker
+    # and exported on /metrics (app_startup_seconds, process_resident_memory_bytes).
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        log_level=args.log_level,
+        log_config=log_config(args.log_level),
+        access_log=args.access_log,
+        timeout_keep_alive=SERVER_KEEPALIVE_S,
+        proxy_headers=True,
+        forwarded_allow_ips=SERVER_FORWARDED_ALLOW_IPS,
+    )
+
+
+if __name__ == "__main__":
+    # Usage (from the backend directory): python -m app.server [--workers N]
+    main()
@@ -0,0 +1,106 @@
+import math
+from typing import Set, Tuple
+
+# Mean Earth radius in metres, as used by PostGIS for spherical distances
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance in metres between two WGS84 points.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    Returns (min_lat, min_lon, max_lat, max_lon) of a box enclosing the circle
+    of radius_m around the given point, on the same sphere as haversine_m.
+    """
+    # Widened by a hair so points exactly on the circle survive float rounding
+    angle = radius_m / EARTH_RADIUS_M * (1 + 1e-9)
+    d_lat = math.degrees(angle)
+    # The circle's widest longitude is where a meridian touches it, which lies
+    # poleward of the centre; near the poles the circle spans every meridian
+    cos_lat = math.cos(math.radians(latitude))
+    if math.sin(angle) >= cos_lat:
+        d_lon = 180.0
+    else:
+        d_lon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    return latitude - d_lat, longitude - d_lon, latitude + d_lat, longitude + d_lon
+
+
+def lv95_to_wgs84(easting: float, northing: float) -> Tuple[float, float]:
+    """
+    Converts Swiss LV95 (EPSG:2056) coordinates to WGS84 (latitude, longitude) with
+    swisstopo's approximate formulas, accurate to about a metre within Switzerland.
+    """
+    y = (easting - 2600000) / 1000000
+    x = (northing - 1200000) / 1000000
+    longitude = 2.6779094 + 4.728982 * y + 0.791484 * y * x + 0.1306 * y * x * x - 0.0436 * y ** 3
+    latitude = (
+        16.9023892 + 3.238272 * x - 0.270978 * y * y - 0.002528 * x * x - 0.0447 * y * y * x - 0.0140 * x ** 3
+    )
+    # Results of the formulas are in units of 10000"
+    return latitude * 100 / 36, longitude * 100 / 36
+
+
+# --- Geohash cells ---
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _geohash_bits(precision: int) -> Tuple[int, int]:
+    # Geohash interleaves longitude and latitude bits, starting with longitude
+    total = 5 * precision
+    return total // 2, total - total // 2  # (latitude bits, longitude bits)
+
+
+def _geohash_from_indexes(lat_index: int, lon_index: int, precision: int) -> str:
+    lat_bits, lon_bits = _geohash_bits(precision)
+    value = 0
+    for position in range(5 * precision):
+        if position % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> lat_bits) & 1
+        value = (value << 1) | bit
+    return "".join(
+        _GEOHASH_ALPHABET[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision)
+    )
+
+
+def _geohash_indexes(latitude: float, longitude: float, precision: int) -> Tuple[int, int]:
+    lat_bits, lon_bits = _geohash_bits(precision)
+    lat_cells, lon_cells = 1 << lat_bits, 1 << lon_bits
+    lat_index = min(int((latitude + 90.0) / 180.0 * lat_cells), lat_cells - 1)
+    lon_index = min(int((longitude + 180.0) / 360.0 * lon_cells), lon_cells - 1)
+    return lat_index, lon_index
+
+
+def geohash(latitude: float, longitude: float, precision: int = 5) -> str:
+    """
+    Encodes a point as a geohash. At precision 5 a cell is about 4.9 x 3.3 km in Switzerland.
+    """
+    return _geohash_from_indexes(*_geohash_indexes(latitude, longitude, precision), precision)
+
+
+def geohash_cells_for_radius(latitude: float, longitude: float, radius_m: float, precision: int = 5) -> Set[str]:
+    """
+    Returns the geohash cells overlapping the bounding box of the circle of radius_m.
+    """
+    min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, radius_m)
+    row_min, col_min = _geohash_indexes(max(min_lat, -90.0), max(min_lon, -180.0), precision)
+    row_max, col_max = _geohash_indexes(min(max_lat, 90.0), min(max_lon, 180.0), precision)
+    return {
+        _geohash_from_indexes(row, col, precision)
+        for row in range(row_min, row_max + 1)
+        for col in range(col_min, col_max + 1)
+    }
@@ -0,0 +1,500 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import metrics, models, schemas, search, spatial
+
+logger = logging.getLogger(__name__)
+
+# Configuration (overridable via environment variables)
+# "postgres" broadcasts promotion writes to every worker with NOTIFY (each worker
+# LISTENs, see listen_postgres); "local" delivers them to subscribers of the same
+# process only; "auto" picks "postgres" whenever the database is PostgreSQL
+SUBSCRIPTIONS_BUS = os.getenv("SUBSCRIPTIONS_BUS", "auto")
+SUBSCRIPTIONS_CHANNEL = os.getenv("SUBSCRIPTIONS_CHANNEL", "price_events")
+# Seconds between attempts to (re)connect the PostgreSQL listener
+SUBSCRIPTIONS_LISTEN_RETRY_S = float(os.getenv("SUBSCRIPTIONS_LISTEN_RETRY_S", "5"))
+# Undelivered alerts kept per connection; the oldest are dropped beyond that
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("SUBSCRIPTION_QUEUE_SIZE", "100"))
+# Seconds between SSE keep-alive comments, so proxies do not close idle streams
+SUBSCRIPTION_HEARTBEAT_S = float(os.getenv("SUBSCRIPTION_HEARTBEAT_S", "15"))
+
+# Product queries are matched as substrings of Promotion.product_key, indexed by one of
+# their trigrams: every trigram of a query occurs in any product key containing it
+MIN_QUERY_LENGTH = 3
+# NOTIFY payloads must stay below 8000 bytes
+_MAX_NOTIFY_BYTES = 7000
+
+
+def bus_for(dialect_name: str, setting: str = None) -> str:
+    """
+    The bus ("postgres" or "local") used with a database of the given dialect.
+    """
+    setting = setting or SUBSCRIPTIONS_BUS
+    if dialect_name == "postgresql" and setting in ("auto", "postgres"):
+        return "postgres"
+    if setting == "postgres":
+        logger.warning("SUBSCRIPTIONS_BUS=postgres needs PostgreSQL; using the local bus on %s", dialect_name)
+    return "local"
+
+
+class PriceEvent(NamedTuple):
+    """
+    A promotion that was inserted or changed price, with its store's location.
+    """
+    promotion_id: int
+    store_id: int
+    store_name: str
+    chain_name: Optional[str]
+    product_name: str
+    product_key: str
+    sale_price: float
+    latitude: float
+    longitude: float
+    cell: str
+
+
+def query_trigrams(key: str) -> Set[str]:
+    """
+    The 3-character substrings of a normalized product key ("milch" -> "mil", "ilc", "lch").
+    """
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+class Subscription:
+    __slots__ = ("id", "key", "latitude", "longitude", "radius_m", "max_price", "cells", "gram", "connection")
+
+    def __init__(self, subscription_id: int, request: schemas.PriceAlertSubscription, connection: "Connection"):
+        self.id = subscription_id
+        self.key = search.normalize_product_name(request.q)
+        if len(self.key) < MIN_QUERY_LENGTH:
+            raise ValueError(f"Product query must have at least {MIN_QUERY_LENGTH} letters or digits")
+        self.latitude = request.latitude
+        self.longitude = request.longitude
+        self.radius_m = request.radius_m
+        self.max_price = request.max_price
+        self.cells = spatial.geohash_cells_for_radius(
+            request.latitude, request.longitude, request.radius_m, models.STORE_CELL_PRECISION
+        )
+        self.gram = ""
+        self.connection = connection
+
+    def distance_to(self, event: PriceEvent) -> Optional[float]:
+        """
+        Distance to the event's store if the event matches this subscription, else None.
+        """
+        if event.sale_price > self.max_price or self.key not in event.product_key:
+            return None
+        distance = spatial.haversine_m(self.latitude, self.longitude, event.latitude, event.longitude)
+        return distance if distance <= self.radius_m else None
+
+
+class SubscriptionIndex:
+    """
+    Subscriptions by (geohash cell, trigram of the product query).
+
+    A subscription is posted once per cell its radius touches, under a single trigram
+    of its query (the one least used so far, which keeps posting lists short). A
+    promotion then only looks up its own cell with each trigram of its product key,
+    so matching costs about len(product_key) lookups plus the candidates found
+    there, independent of the total number of subscriptions.
+    """
+
+    def __init__(self):
+        self._postings: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._gram_use: Counter = Counter()
+        self.candidates_checked = 0
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    @property
+    def entries(self) -> int:
+        return sum(len(ids) for ids in self._postings.values())
+
+    def add(self, subscription: Subscription) -> None:
+        subscription.gram = min(query_trigrams(subscription.key), key=lambda gram: (self._gram_use[gram], gram))
+        self._gram_use[subscription.gram] += 1
+        self._subscriptions[subscription.id] = subscription
+        for cell in subscription.cells:
+            self._postings[(cell, subscription.gram)].add(subscription.id)
+
+    def remove(self, subscription_id: int) -> Optional[Subscription]:
+        subscription = self._subscriptions.pop(subscription_id, None)
+        if subscription is None:
+            return None
+        self._gram_use[subscription.gram] -= 1
+        if not self._gram_use[subscription.gram]:
+            del self._gram_use[subscription.gram]
+        for cell in subscription.cells:
+            ids = self._postings.get((cell, subscription.gram))
+            if ids is not None:
+                ids.discard(subscription_id)
+                if not ids:
+                    del self._postings[(cell, subscription.gram)]
+        return subscription
+
+    def match(self, event: PriceEvent) -> List[Tuple[Subscription, float]]:
+        """
+        (subscription, distance_m) of every subscription the event matches.
+        """
+        candidates: Set[int] = set()
+        for gram in query_trigrams(event.product_key):
+            candidates.update(self._postings.get((event.cell, gram), ()))
+        self.candidates_checked += len(candidates)
+        matches = []
+        for subscription_id in sorted(candidates):
+            subscription = self._subscriptions[subscription_id]
+            distance = subscription.distance_to(event)
+            if distance is not None:
+                matches.append((subscription, distance))
+        return matches
+
+
+class Connection:
+    """
+    One SSE stream or WebSocket: its subscriptions and a bounded queue of alerts,
+    owned by the event loop that serves it.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int = SUBSCRIPTION_QUEUE_SIZE):
+        self.loop = loop
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self.subscription_ids: Set[int] = set()
+        self.dropped = 0
+
+    def deliver(self, message: bytes) -> None:
+        # Runs on self.loop; a slow client loses its oldest alerts, never blocks publishers
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            metrics.PRICE_ALERTS.inc(outcome="dropped")
+        self.queue.put_nowait(message)
+
+    async def next_alert(self) -> bytes:
+        return await self.queue.get()
+
+
+class Broker:
+    """
+    Process-wide registry of connections and their subscriptions.
+
+    dispatch() may be called from any thread (e.g. the threadpool running a feed
+    ingest, or the PostgreSQL listener); alerts are handed to each connection's
+    event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.index = SubscriptionIndex()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._connections: Set[Connection] = set()
+        self._counters: Dict[str, int] = dict.fromkeys(("events", "delivered"), 0)
+        # Set by start(); "local" until the PostgreSQL listener is running
+        self.bus = "local"
+
+    def has_subscriptions(self) -> bool:
+        return len(self.index) > 0
+
+    def connect(self, queue_size: int = SUBSCRIPTION_QUEUE_SIZE) -> Connection:
+        """
+        Registers a connection served by the running event loop.
+        """
+        connection = Connection(asyncio.get_running_loop(), queue_size)
+        with self._lock:
+            self._connections.add(connection)
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        with self._lock:
+            self._connections.discard(connection)
+            for subscription_id in connection.subscription_ids:
+                self.index.remove(subscription_id)
+            connection.subscription_ids.clear()
+
+    def subscribe(self, connection: Connection, request: schemas.PriceAlertSubscription) -> Subscription:
+        """
+        Adds a subscription to a connection. Raises ValueError for unusable queries.
+        """
+        with self._lock:
+            subscription = Subscription(next(self._ids), request, connection)
+            self.index.add(subscription)
+            connection.subscription_ids.add(subscription.id)
+        return subscription
+
+    def unsubscribe(self, connection: Connection, subscription_id: int) -> bool:
+        with self._lock:
+            if subscription_id not in connection.subscription_ids:
+                return False
+            connection.subscription_ids.discard(subscription_id)
+            self.index.remove(subscription_id)
+            return True
+
+    def dispatch(self, events: Iterable[PriceEvent]) -> int:
+        """
+        Sends an alert for every (event, matching subscription). Returns the number sent.
+        """
+        deliveries = []
+        with self._lock:
+            for event in events:
+                self._counters["events"] += 1
+                for subscription, distance in self.index.match(event):
+                    deliveries.append((subscription.connection, alert_json(subscription.id, event, distance)))
+            self._counters["delivered"] += len(deliveries)
+        for connection, message in deliveries:
+            try:
+                connection.loop.call_soon_threadsafe(connection.deliver, message)
+            except RuntimeError:  # The connection's loop has shut down
+                continue
+            metrics.PRICE_ALERTS.inc(outcome="delivered")
+        return len(deliveries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bus": self.bus,
+                "connections": len(self._connections),
+                "subscriptions": len(self.index),
+                "index_entries": self.index.entries,
+                "candidates_checked": self.index.candidates_checked,
+                "dropped": sum(connection.dropped for connection in self._connections),
+                **self._counters,
+            }
+
+
+def alert_json(subscription_id: int, event: PriceEvent, distance_m: float) -> bytes:
+    """
+    A price alert as sent to clients (schemas.PriceAlert).
+    """
+    return orjson.dumps({
+        "type": "price_alert",
+        "subscription_id": subscription_id,
+        "promotion_id": event.promotion_id,
+        "store_id": event.store_id,
+        "store_name": event.store_name,
+        "chain_name": event.chain_name,
+        "product_name": event.product_name,
+        "sale_price": event.sale_price,
+        "distance_m": round(distance_m, 1),
+    })
+
+
+def price_events(db: Session, promotions: Iterable) -> List[PriceEvent]:
+    """
+    Events for inserted or changed promotions, e.g. the rows returned by
+    crud.upsert_promotions (anything with id, store_id, product_name, product_key
+    and sale_price), joined with their stores' locations in one query.
+    """
+    promotions = [promotion for promotion in promotions if promotion.product_key]
+    if not promotions:
+        return []
+    stores = {
+        row.id: row
+        for row in db.query(
+            models.Store.id, models.Store.name, models.Store.chain_name,
+            models.Store.latitude, models.Store.longitude, models.Store.cell,
+        ).filter(models.Store.id.in_({promotion.store_id for promotion in promotions}))
+    }
+    return [
+        PriceEvent(
+            promotion.id, promotion.store_id, store.name, store.chain_name, promotion.product_name,
+            promotion.product_key, float(promotion.sale_price), store.latitude, store.longitude, store.cell,
+        )
+        for promotion in promotions
+        for store in (stores.get(promotion.store_id),)
+        if store is not None and store.cell
+    ]
+
+
+def json_array_payloads(items: Iterable) -> List[str]:
+    """
+    JSON-serializable items as JSON arrays that each fit into one NOTIFY payload.
+    """
+    payloads, batch, size = [], [], 2
+    for item in items:
+        encoded = orjson.dumps(item)
+        if batch and size + len(encoded) + 1 > _MAX_NOTIFY_BYTES:
+            payloads.append(b"[" + b",".join(batch) + b"]")
+            batch, size = [], 2
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        payloads.append(b"[" + b",".join(batch) + b"]")
+    return [payload.decode() for payload in payloads]
+
+
+def notify_payloads(events: Iterable[PriceEvent]) -> List[str]:
+    """
+    Events as JSON arrays that each fit into one NOTIFY payload.
+    """
+    return json_array_payloads(list(event) for event in events)
+
+
+def parse_notification(payload: str) -> List[PriceEvent]:
+    """
+    The events of one NOTIFY payload built by notify_payloads().
+    Raises ValueError if it is malformed.
+    """
+    try:
+        return [PriceEvent(*fields) for fields in orjson.loads(payload)]
+    except TypeError as e:
+        raise ValueError(f"Malformed price event notification: {e}") from e
+
+
+def dispatch_notification(payload: str) -> None:
+    broker.dispatch(parse_notification(payload))
+
+
+def notify(engine: Engine, channel: str, items: Iterable) -> None:
+    """
+    Sends items to the listeners of channel in every worker (see listen_postgres),
+    in as many NOTIFYs as needed, in a transaction of its own.
+    """
+    with engine.begin() as connection:
+        for payload in json_array_payloads(items):
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": channel, "payload": payload})
+
+
+def publish(db: Session, promotions: Iterable) -> int:
+    """
+    Publishes committed promotion writes to subscribers. With the local bus they are
+    matched in this process right away; with the PostgreSQL bus one NOTIFY per
+    payload is committed and every worker's listener matches them. Returns the
+    number of events published.
+    """
+    if bus_for(db.get_bind().dialect.name) == "postgres":
+        events = price_events(db, promotions)
+        for payload in notify_payloads(events):
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": SUBSCRIPTIONS_CHANNEL, "payload": payload})
+        db.commit()
+        return len(events)
+    # Nobody listening here: skip the store lookup
+    if not broker.has_subscriptions():
+        return 0
+    events = price_events(db, promotions)
+    broker.dispatch(events)
+    return len(events)
+
+
+def _listen_connection(engine: Engine, channels: Iterable[str]):
+    # Blocking; run in the executor. Detached so the pool never hands it out again.
+    pooled = engine.raw_connection()
+    pooled.detach()
+    connection = pooled.driver_connection
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        for channel in channels:
+            cursor.execute(f'LISTEN "{channel}"')
+    return connection
+
+
+async def listen_postgres(
+    engine: Engine,
+    handlers: Optional[Dict[str, Callable[[str], None]]] = None,
+    retry_s: float = SUBSCRIPTIONS_LISTEN_RETRY_S,
+) -> None:
+    """
+    LISTENs with a dedicated connection and passes each notification's payload to
+    the handler of its channel; by default, dispatches the price events published
+    by any worker to this process's subscribers. Handlers raise ValueError for
+    malformed payloads, which are skipped.
+
+    Connecting runs in the executor; notifications are read without blocking when
+    the connection's socket becomes readable. A lost connection is re-established
+    every retry_s (notifications sent in between are missed). Runs until
+    cancelled; started by start().
+    """
+    handlers = handlers or {SUBSCRIPTIONS_CHANNEL: dispatch_notification}
+    channels = ", ".join(handlers)
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            connection = await loop.run_in_executor(None, _listen_connection, engine, list(handlers))
+        except Exception as e:
+            logger.warning("Cannot listen on %s, retrying in %.0f s: %s", channels, retry_s, e)
+            await asyncio.sleep(retry_s)
+            continue
+        lost: "asyncio.Future[None]" = loop.create_future()
+
+        def on_notify():
+            try:
+                connection.poll()
+            except Exception as e:  # e.g. the server closed the connection
+                if not lost.done():
+                    lost.set_exception(e)
+                return
+            while connection.notifies:
+                notification = connection.notifies.pop(0)
+                try:
+                    handlers[notification.channel](notification.payload)
+                except (KeyError, ValueError):
+                    logger.warning("Ignoring malformed %s notification", notification.channel)
+
+        fileno = connection.fileno()
+        loop.add_reader(fileno, on_notify)
+        logger.info("Listening on %s", channels)
+        try:
+            await lost
+        except Exception as e:
+            logger.warning("Listener on %s lost its connection, reconnecting: %s", channels, e)
+        finally:
+            loop.remove_reader(fileno)
+            try:
+                connection.close()
+            except Exception:
+                pass
+        await asyncio.sleep(retry_s)
+
+
+def start(
+    engine: Engine, workers: int = 1, handlers: Optional[Dict[str, Callable[[str], None]]] = None
+) -> Optional["asyncio.Task[None]"]:
+    """
+    Chooses the bus for engine's database and, for the PostgreSQL bus, starts the
+    listener task for price events plus the channels of handlers (returned so the
+    app's lifespan can cancel it). Warns when the local bus is used by several
+    workers, as each would only alert its own subscribers.
+    """
+    broker.bus = bus_for(engine.dialect.name)
+    if broker.bus == "local":
+        if workers > 1:
+            logger.warning(
+                "Price alerts use the local bus with %d workers: subscribers only get alerts for "
+                "promotions ingested by their own worker. Use PostgreSQL with SUBSCRIPTIONS_BUS=auto "
+                "(or postgres), or a single worker.", workers,
+            )
+        return None
+    return asyncio.create_task(listen_postgres(engine, {SUBSCRIPTIONS_CHANNEL: dispatch_notification, **(handlers or {})}))
+
+
+async def sse_stream(connection: Connection, subscription: Subscription, heartbeat_s: float = SUBSCRIPTION_HEARTBEAT_S) -> AsyncIterator[bytes]:
+    """
+    Server-sent events for one subscription: a "subscribed" event, then one
+    "price_alert" event per match, with keep-alive comments in between.
+    Unsubscribes when the client goes away.
+    """
+    try:
+        yield b"event: subscribed\ndata: " + orjson.dumps({"subscription_id": subscription.id}) + b"\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(connection.next_alert(), heartbeat_s)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            yield b"event: price_alert\ndata: " + message + b"\n\n"
+    finally:
+        broker.disconnect(connection)
+
+
+# Subscriptions of this process, used by the endpoints in app.main
+broker = Broker()
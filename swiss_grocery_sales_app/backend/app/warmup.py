@@ -0,0 +1,107 @@
+import logging
+import os
+import time
+from typing import Callable, Dict
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import address_index, best_price, crud, database, distance
+from .geocode_cache import geocode_cache
+
+logger = logging.getLogger(__name__)
+
+# Configuration (overridable via environment variables)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+# Pool connections opened before serving (capped at the pool size)
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", str(database.DB_POOL_SIZE)))
+
+# The reads behind the busiest endpoints, with arguments that match nothing. Running
+# them once compiles their SQL into the engine's compiled cache (limits and IDs are
+# bound parameters, so real requests reuse the cached statements).
+HOT_QUERIES: Dict[str, Callable[[Session], object]] = {
+    "get_store_rows": lambda db: crud.get_store_rows(db, 0, promotions_limit=100),
+    # get_store_rows stops before its promotions query when the store does not exist
+    "store_promotions": lambda db: db.execute(crud.store_promotions_query(0, False, 100, 0)).all(),
+    "get_stores": lambda db: crud.get_stores(db, after_id=2 ** 31 - 1, limit=51),
+    "get_promotions": lambda db: crud.get_promotions(db, limit=51),
+    "get_nearby_promotions": lambda db: crud.get_nearby_promotions(db, 0.0, 0.0, 1.0, limit=1),
+    "nearby_best_prices": lambda db: best_price.nearby_best_prices(db, 0.0, 0.0, 1.0, None, 1),
+    # Loads the store coordinates used for nearby queries and basket travel costs
+    "store_locations": lambda db: distance.distance_service.locations(db),
+}
+
+
+def prewarm_pool(engine: Engine, connections: int = WARMUP_CONNECTIONS) -> int:
+    """
+    Opens up to `connections` connections at once and returns them to the pool, so
+    early requests do not pay for connecting (TCP, TLS, authentication). Returns
+    the number opened.
+    """
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    # SQLite has nothing worth pre-connecting
+    count = 1 if engine.dialect.name == "sqlite" else max(1, min(connections, pool_size))
+    opened = []
+    try:
+        for _ in range(count):
+            opened.append(engine.connect())
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+
+def compile_hot_queries(session_factory: Callable[[], Session]) -> int:
+    """
+    Runs HOT_QUERIES once. Returns how many succeeded; failures are logged, since a
+    missing table or an unreachable database should not keep the app from starting.
+    """
+    succeeded = 0
+    db = session_factory()
+    try:
+        for name, query in HOT_QUERIES.items():
+            try:
+                query(db)
+                succeeded += 1
+            except Exception:
+                logger.warning("Warm-up query %s failed", name, exc_info=True)
+                db.rollback()
+    finally:
+        db.close()
+    return succeeded
+
+
+def prime_caches() -> None:
+    """
+    Opens the persistent geocoding cache and maps the offline address index.
+    """
+    geocode_cache.open()
+    index = address_index.get_address_index()
+    if index is not None:
+        logger.info("Address index loaded: %s", index.stats())
+
+
+def warm_up(engine: Engine, session_factory: Callable[[], Session]) -> Dict[str, float]:
+    """
+    Prepares a worker before it serves traffic. Called from the FastAPI lifespan
+    hook in app.main. Returns the seconds spent per step.
+    """
+    timings = {}
+    steps = (
+        ("pool", lambda: prewarm_pool(engine)),
+        ("queries", lambda: compile_hot_queries(session_factory)),
+        ("caches", prime_caches),
+    )
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.warning("Warm-up step %s failed", name, exc_info=True)
+        timings[name] = time.perf_counter() - started
+    logger.info(
+        "Warm-up done in %.1f ms (%s)",
+        sum(timings.values()) * 1000,
+        ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items()),
+    )
+    return timings
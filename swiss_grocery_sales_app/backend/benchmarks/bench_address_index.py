@@ -0,0 +1,80 @@
+"""
+Measures the offline address index (app.address_index): build time, file size,
+open time, heap memory used by an open index, and lookup / prefix search latency.
+
+Generates --addresses synthetic addresses (the Swiss building address register
+has about 3.3 million), builds an index in a temporary directory, and times
+--queries random lookups of full addresses (parsing included) and prefix searches.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_address_index --addresses 3000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from app.address_index import AddressIndex, address_key, build_index
+
+from . import results
+from .datagen import PRODUCTS, TOWNS
+
+
+def make_addresses(count, seed=42):
+    rng = random.Random(seed)
+    # Street names reuse a few thousand stems, like real ones (Bahnhofstrasse, Dorfstrasse...)
+    stems = [f"{word}{suffix}" for word in PRODUCTS + [town for town, _, _, _ in TOWNS] for suffix in ("strasse", "weg", "gasse", "platz")]
+    streets = [f"{stem}{'' if i == 0 else f' {i}'}" for i in range(count // (len(stems) * 40) + 1) for stem in stems]
+    for i in range(count):
+        street = rng.choice(streets)
+        number = f"{rng.randint(1, 200)}{rng.choice(['', '', '', 'a', 'b'])}"
+        yield street, number, str(rng.randint(1000, 9658)), rng.uniform(45.82, 47.81), rng.uniform(5.96, 10.49)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--addresses", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    addresses = list(make_addresses(args.addresses))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "addresses.bin")
+        started = time.perf_counter()
+        count = build_index(((address_key(s, n, p), lat, lon) for s, n, p, lat, lon in addresses), path)
+        build_s = time.perf_counter() - started
+
+        tracemalloc.start()
+        index = AddressIndex(path)
+        heap_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        rng = random.Random(1)
+        sample = rng.sample(addresses, min(args.queries, len(addresses)))
+        lookups = []
+        for street, number, postcode, _, _ in sample:
+            address = f"{street} {number}, {postcode} Ort"
+            started = time.perf_counter()
+            found = index.lookup(address)
+            lookups.append(time.perf_counter() - started)
+            assert found is not None, address
+        prefixes = []
+        for street, _, _, _, _ in sample:
+            started = time.perf_counter()
+            index.search(street[:6], limit=10)
+            prefixes.append(time.perf_counter() - started)
+
+        print(f"{count} unique addresses of {len(addresses)} generated")
+        print(f"  build: {build_s:.1f}s, file: {index.file_bytes / 1e6:.1f} MB ({index.file_bytes / count:.1f} B per address)")
+        print(f"  open: {index.load_seconds * 1000:.3f} ms, heap after open: {heap_bytes / 1024:.1f} KiB (data stays in the page cache)")
+        results.print_table({
+            "lookup (parse + binary search)": results.summarize(lookups, sum(lookups)),
+            "prefix search (10 results)": results.summarize(prefixes, sum(prefixes)),
+        })
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
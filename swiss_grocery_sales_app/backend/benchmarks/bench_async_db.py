@@ -0,0 +1,125 @@
+"""
+Load-test comparison of the synchronous and async database paths under concurrent reads.
+
+Both modes run the same read as GET /api/v1/stores/{id} (crud.get_store with a page of
+promotions) from many concurrent asyncio tasks:
+  sync:  crud.get_store on the threadpool, the way FastAPI runs it when DB_ASYNC=0
+  async: crud_async.get_store on the async engine, the way it runs when DB_ASYNC=1
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_async_db --concurrency 64 --requests 2000
+    python -m benchmarks.bench_async_db --database-url postgresql://user:pw@localhost/bench_db
+
+The async mode needs asyncpg (PostgreSQL) or aiosqlite (SQLite) installed.
+The target database is wiped and seeded before the run.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app import crud, crud_async, models, schemas
+from app.database import Base, async_database_url, engine_options
+
+from .bench_store_import import make_stores
+
+
+def seed(engine, stores, promotions_per_store):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        crud.bulk_upsert_stores(db, make_stores(stores))
+        store_ids = [store_id for (store_id,) in db.query(models.Store.id)]
+        promotions = [
+            schemas.PromotionCreate(store_id=store_id, product_name=f"Product {i}", sale_price=1 + i % 20)
+            for store_id in store_ids
+            for i in range(promotions_per_store)
+        ]
+        for chunk in crud.chunked(promotions, 1000):
+            crud.upsert_promotions(db, chunk)
+        db.commit()
+        return store_ids
+    finally:
+        db.close()
+
+
+async def run_load(read_one, store_ids, concurrency, requests):
+    rng = random.Random(7)
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            started = time.perf_counter()
+            await read_one(rng.choice(store_ids))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def bench_sync(url, store_ids, args):
+    engine = create_engine(url, **engine_options(url))
+    SessionLocal = sessionmaker(bind=engine, autoflush=False)
+
+    def read(store_id):
+        db = SessionLocal()
+        try:
+            return schemas.StoreRead.model_validate(crud.get_store(db, store_id, promotions_limit=100))
+        finally:
+            db.close()
+
+    try:
+        return await run_load(lambda store_id: run_in_threadpool(read, store_id), store_ids, args.concurrency, args.requests)
+    finally:
+        engine.dispose()
+
+
+async def bench_async(url, store_ids, args):
+    url = async_database_url(url)
+    engine = create_async_engine(url, **engine_options(url))
+    AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    async def read(store_id):
+        async with AsyncSessionLocal() as db:
+            return schemas.StoreRead.model_validate(await crud_async.get_store(db, store_id, promotions_limit=100))
+
+    try:
+        return await run_load(read, store_ids, args.concurrency, args.requests)
+    finally:
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///bench_async_db.sqlite3")
+    parser.add_argument("--stores", type=int, default=500)
+    parser.add_argument("--promotions-per-store", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    store_ids = seed(create_engine(args.database_url), args.stores, args.promotions_per_store)
+    print(f"{args.requests} reads, {args.concurrency} concurrent clients, {args.database_url.split(':')[0]}")
+    for label, bench in (("sync (threadpool)", bench_sync), ("async", bench_async)):
+        result = asyncio.run(bench(args.database_url, store_ids, args))
+        print(f"  {label:18} {result['requests_per_second']:8.0f} req/s"
+              f"  p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
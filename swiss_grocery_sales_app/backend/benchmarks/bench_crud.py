@@ -0,0 +1,140 @@
+"""
+Microbenchmarks of the crud functions behind the API endpoints and of response
+serialization, on the synthetic data set from benchmarks.datagen.
+
+Each benchmark runs --warmup untimed iterations, then --repeat timed ones. Random
+inputs (store IDs, locations) come from a fixed seed, so runs are comparable.
+The session's identity map is cleared between iterations, so every call builds
+its objects from fresh rows as it does in a request.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_crud --stores 1000 --promotions 50 --json crud.json
+    python -m benchmarks.bench_crud --filter store --repeat 500
+    python -m benchmarks.bench_crud --database-url postgresql://user:pw@localhost/bench_db --skip-seed
+
+Compare two runs with python -m benchmarks.compare before.json after.json.
+Unless --skip-seed is given, the target database is wiped and seeded first.
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from app import best_price, crud, schemas, search, serialization
+
+from . import datagen, results
+
+# Query locations: town centres, so nearby searches find stores
+LOCATIONS = [(lat, lon) for _, lat, lon, _ in datagen.TOWNS]
+QUERIES = ["milch", "schokolade", "kaffee bohnen", "bio", "äpfel"]
+
+
+def benchmarks(db, store_ids, rng):
+    """
+    (name, setup, run) triples: setup() returns the arguments of one timed run(...) call.
+    """
+    def random_store():
+        return (rng.choice(store_ids),)
+
+    def random_location():
+        return rng.choice(LOCATIONS)
+
+    # Rows of one store, serialized repeatedly
+    store_rows = crud.get_store_rows(db, store_ids[0], promotions_limit=100)
+    store = crud.get_store(db, store_ids[0], promotions_limit=100)
+    created = iter(range(10 ** 9))
+
+    def new_store():
+        i = next(created)
+        return (schemas.StoreCreate(
+            name=f"Bench Store {time.time_ns()}-{i}",
+            address=f"Benchweg {i}",
+            latitude=rng.uniform(46.0, 47.5),
+            longitude=rng.uniform(6.5, 9.5),
+            chain_name="Bench",
+        ),)
+
+    def promotion_feed():
+        store_id = rng.choice(store_ids)
+        return (datagen.make_promotions([store_id], 50, seed=rng.randrange(10 ** 6)),)
+
+    def upsert_and_rollback(promotions):
+        crud.upsert_promotions(db, promotions)
+        db.rollback()
+
+    return [
+        ("crud.get_store", random_store, lambda store_id: crud.get_store(db, store_id, promotions_limit=100)),
+        ("crud.get_store_rows", random_store, lambda store_id: crud.get_store_rows(db, store_id, promotions_limit=100)),
+        ("crud.get_stores", lambda: (rng.choice([None, *datagen.CHAINS]),), lambda chain: crud.get_stores(db, chain_name=chain, limit=50)),
+        ("crud.get_promotions", lambda: (rng.choice(QUERIES),), lambda product: crud.get_promotions(db, product=product, limit=50)),
+        ("crud.search_promotions", lambda: (rng.choice(QUERIES),), lambda query: crud.search_promotions(db, query, limit=50)),
+        ("crud.get_nearby_promotions", random_location, lambda lat, lon: crud.get_nearby_promotions(db, lat, lon, 3000)),
+        ("best_price.nearby_best_prices", random_location, lambda lat, lon: best_price.nearby_best_prices(db, lat, lon, 3000, None, 50)),
+        (
+            "crud.get_basket_candidates",
+            random_location,
+            lambda lat, lon: crud.get_basket_candidates(
+                db, [search.normalize_product_name(query) for query in QUERIES], lat, lon, 5000
+            ),
+        ),
+        ("crud.upsert_promotions[50]", promotion_feed, upsert_and_rollback),
+        ("crud.create_store", new_store, lambda store: crud.create_store(db, store)),
+        ("serialization.store_read_json", lambda: (), lambda: serialization.store_read_json(*store_rows)),
+        (
+            "schemas.StoreRead.model_dump_json",
+            lambda: (),
+            lambda: schemas.StoreRead.model_validate(store).model_dump_json(),
+        ),
+    ]
+
+
+def run_benchmark(db, setup, run, warmup, repeat):
+    latencies = []
+    for iteration in range(warmup + repeat):
+        args = setup()
+        db.expunge_all()
+        started = time.perf_counter()
+        run(*args)
+        elapsed = time.perf_counter() - started
+        if iteration >= warmup:
+            latencies.append(elapsed)
+    return results.summarize(latencies, sum(latencies))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    datagen.add_arguments(parser)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data already in the database")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON (- for stdout)")
+    args = parser.parse_args(argv)
+
+    engine = datagen.create_bench_engine(args.database_url)
+    if args.skip_seed:
+        store_ids = datagen.load_store_ids(engine)
+    else:
+        store_ids = datagen.seed_database(engine, args.stores, args.promotions, args.seed)
+    size = datagen.dataset_size(engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    rng = random.Random(args.seed)
+    summaries = {}
+    try:
+        for name, setup, run in benchmarks(db, store_ids, rng):
+            if args.filter in name:
+                summaries[name] = run_benchmark(db, setup, run, args.warmup, args.repeat)
+    finally:
+        db.close()
+
+    print(f"{size['stores']} stores, {size['promotions']} promotions on {engine.dialect.name}, "
+          f"{args.repeat} runs per benchmark")
+    results.print_table(summaries)
+    if args.json:
+        config = {**size, **{key: getattr(args, key) for key in ("seed", "repeat", "warmup")}}
+        results.write_results(args.json, "crud", config, summaries, engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measures the store distance queries of app.distance with and without the KD-tree:
+
+  scan      StoreLocations without a tree: vectorized haversine over all stores
+  kd-tree   StoreLocations with the KD-tree over unit vectors
+
+for radius queries (--radius-m) and k nearest stores (-k), at each --stores size,
+plus the basket travel matrix (41 x 41) computed per pair in Python vs. NumPy.
+All variants are checked to return the same stores first.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_distance --stores 1000 10000 100000
+"""
+import argparse
+import random
+import time
+
+from app import basket
+from app.distance import DistanceService, StoreLocations
+
+from . import results
+from .datagen import SWISS_BBOX
+
+
+def make_stores(count, seed=42):
+    rng = random.Random(seed)
+    min_lat, min_lon, max_lat, max_lon = SWISS_BBOX
+    return [(i + 1, rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for i in range(count)]
+
+
+def timed(function, points, repeat=1):
+    samples = []
+    for latitude, longitude in points:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = function(latitude, longitude)
+        samples.append((time.perf_counter() - started) / repeat)
+    return samples, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, nargs="+", default=[1000, 4000, 20000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-m", type=float, default=3000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    rows = {}
+    for count in args.stores:
+        stores = make_stores(count)
+        points = [(latitude, longitude) for _, latitude, longitude in rng.sample(stores, min(args.queries, count))]
+        scan = StoreLocations(stores, tree_min_stores=count + 1)
+        started = time.perf_counter()
+        tree = StoreLocations(stores, tree_min_stores=0)
+        print(f"{count} stores: KD-tree built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        variants = [
+            ("scan", lambda lat, lon: scan.within(lat, lon, args.radius_m), points),
+            ("kd-tree", lambda lat, lon: tree.within(lat, lon, args.radius_m), points),
+        ]
+        expected = None
+        for name, function, sample in variants:
+            samples, _ = timed(function, sample)
+            found = [store_id for store_id, _ in function(*points[0])]
+            assert expected is None or found == expected, name
+            expected = found
+            rows[f"{count} within {args.radius_m:.0f} m: {name}"] = results.summarize(samples, sum(samples))
+        for name, locations in (("scan", scan), ("kd-tree", tree)):
+            samples, _ = timed(lambda lat, lon: locations.nearest(lat, lon, args.k), points)
+            rows[f"{count} nearest {args.k}: {name}"] = results.summarize(samples, sum(samples))
+
+    stores = make_stores(40)
+    origin = (46.948, 7.444)
+    service = DistanceService()
+    for name, function in (
+        ("python", lambda lat, lon: basket.TravelCosts((lat, lon), [s[1:] for s in stores], 30)),
+        ("numpy", lambda lat, lon: service.travel_matrix((lat, lon), stores)),
+    ):
+        samples, _ = timed(function, [origin] * 50)
+        rows[f"travel matrix 41 x 41: {name}"] = results.summarize(samples, sum(samples))
+
+    results.print_table(rows)
+    if args.json:
+        results.write_results(args.json, "bench_distance", vars(args), rows)
+
+
+if __name__ == "__main__":
+    main()
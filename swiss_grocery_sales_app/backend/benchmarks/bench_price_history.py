@@ -0,0 +1,94 @@
+"""
+Measures price_history.price_stats latency for one product over a year of history,
+and the storage used per observation.
+
+Generates --products products observed weekly at --stores stores for a year, then
+times the stats query for random products.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_price_history --products 200 --stores 100
+    python -m benchmarks.bench_price_history --database-url postgresql://user:pw@localhost/bench_db
+
+The target database is wiped (drop_all/create_all) before the run.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import models, price_history
+from app.database import Base
+
+
+def seed(db, products, stores, seed=42):
+    rng = random.Random(seed)
+    for i in range(stores):
+        db.add(models.Store(name=f"Store {i}", address=f"Weg {i}", latitude=46.9, longitude=7.4))
+    db.commit()
+    store_ids = [store_id for (store_id,) in db.query(models.Store.id)]
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    # Appended week by week, like real feeds arrive
+    for week in range(52):
+        observed_at = start + timedelta(weeks=week)
+        price_history.record_observations(db, [
+            (f"product {p}", store_id, round(rng.uniform(0.5, 20), 2), observed_at)
+            for p in range(products)
+            for store_id in store_ids
+        ])
+        db.commit()
+    return start + timedelta(weeks=52)
+
+
+def storage_bytes(engine, url):
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT pg_total_relation_size('price_history')")).scalar()
+    if engine.dialect.name == "sqlite" and url.startswith("sqlite:///"):
+        with engine.connect() as conn:
+            conn.execute(text("VACUUM"))
+        return os.path.getsize(url[len("sqlite:///"):])
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--stores", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database-url", default="sqlite:///bench_price_history.sqlite3")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        now = seed(db, args.products, args.stores)
+        rows = db.query(models.PriceObservation).count()
+        rng = random.Random(1)
+        timings = []
+        for _ in range(args.queries):
+            product = f"product {rng.randrange(args.products)}"
+            started = time.perf_counter()
+            price_history.price_stats(db, product, days=365, now=now)
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
+
+    size = storage_bytes(engine, args.database_url)
+    timings.sort()
+    print(f"{rows} observations ({args.products} products x {args.stores} stores x 52 weeks) on {engine.dialect.name}")
+    print(f"  price_stats over 365 days ({args.stores * 52} observations per product):")
+    print(f"    median {statistics.median(timings):.2f} ms, p95 {timings[int(len(timings) * 0.95)]:.2f} ms")
+    if size is not None:
+        print(f"  storage: {size / rows:.1f} bytes per observation (including indexes)")
+    Base.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main()
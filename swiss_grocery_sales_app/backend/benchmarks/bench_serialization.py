@@ -0,0 +1,92 @@
+"""
+Measures the CPU cost of producing one read_store response body for a store with
+many promotions, comparing:
+
+  orm+pydantic  crud.get_store + StoreRead.model_validate(...).model_dump_json()
+  rows+orjson   crud.get_store_rows + serialization.store_read_json (the endpoint's path)
+
+Both paths are checked to produce identical bytes first.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_serialization --promotions 500 --repeat 200
+    python -m benchmarks.bench_serialization --database-url postgresql://user:pw@localhost/bench_db
+
+The target database is wiped (drop_all/create_all) before the run.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas, serialization
+from app.database import Base
+
+
+def seed(db, promotions, seed=42):
+    rng = random.Random(seed)
+    store = models.Store(name="Migros Bern", address="Marktgasse 46", latitude=46.948, longitude=7.444, chain_name="Migros")
+    store.promotions = [
+        models.Promotion(
+            product_name=f"Product {i}",
+            sale_price=round(rng.uniform(0.5, 30), 2),
+            original_price=round(rng.uniform(30, 40), 2) if i % 2 else None,
+            valid_until=date(2030, 1, 1) + timedelta(days=i % 30),
+            description=f"Description of product {i}" if i % 3 else None,
+            last_updated=datetime(2024, 5, 1, 12, 0, 0) + timedelta(minutes=i),
+        )
+        for i in range(promotions)
+    ]
+    db.add(store)
+    db.commit()
+    return store.id
+
+
+def cpu_per_call(work, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        work()
+    return (time.process_time() - started) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--promotions", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--database-url", default="sqlite:///bench_serialization.sqlite3")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        store_id = seed(db, args.promotions)
+        limit = args.promotions
+
+        def orm_pydantic():
+            db.expunge_all()
+            store = crud.get_store(db, store_id, promotions_limit=limit)
+            return schemas.StoreRead.model_validate(store).model_dump_json().encode()
+
+        def rows_orjson():
+            return serialization.store_read_json(*crud.get_store_rows(db, store_id, promotions_limit=limit))
+
+        assert orm_pydantic() == rows_orjson(), "fast path output differs from StoreRead"
+        size = len(rows_orjson())
+        before = cpu_per_call(orm_pydantic, args.repeat)
+        after = cpu_per_call(rows_orjson, args.repeat)
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+    print(f"read_store body with {args.promotions} promotions ({size} bytes) on {engine.dialect.name}")
+    print(f"  orm+pydantic: {before * 1000:8.3f} ms CPU per response")
+    print(f"  rows+orjson:  {after * 1000:8.3f} ms CPU per response")
+    print(f"  speed-up: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
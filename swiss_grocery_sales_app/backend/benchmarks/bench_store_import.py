@@ -0,0 +1,77 @@
+"""
+Compares the per-row store creation path (crud.create_store: add + commit + refresh
+per store) against the chunked bulk upsert (crud.bulk_upsert_stores).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_store_import --stores 2000
+    python -m benchmarks.bench_store_import --database-url postgresql://user:pw@localhost/bench_db
+
+The target database is wiped (drop_all/create_all) before each run.
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas
+from app.database import Base
+
+
+def make_stores(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        schemas.StoreCreate(
+            name=f"Store {i}",
+            address=f"Bahnhofstrasse {i}, {1000 + i % 8000} Ort",
+            latitude=rng.uniform(45.82, 47.81),
+            longitude=rng.uniform(5.96, 10.49),
+            chain_name=rng.choice(["Migros", "Coop", "Denner", "Aldi", "Lidl"]),
+        )
+        for i in range(count)
+    ]
+
+
+def run(engine, work):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        started = time.perf_counter()
+        work(db)
+        return time.perf_counter() - started
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stores", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--database-url", default="sqlite:///bench_store_import.sqlite3")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    stores = make_stores(args.stores)
+
+    def per_row(db):
+        for store in stores:
+            crud.create_store(db, store)
+
+    def bulk(db):
+        crud.bulk_upsert_stores(db, stores, chunk_size=args.chunk_size)
+        db.commit()
+
+    per_row_s = run(engine, per_row)
+    bulk_s = run(engine, bulk)
+    Base.metadata.drop_all(bind=engine)
+
+    print(f"{args.stores} stores on {engine.dialect.name}")
+    print(f"  per-row create_store: {per_row_s:8.3f}s  {args.stores / per_row_s:10.0f} rows/s")
+    print(f"  bulk_upsert_stores:   {bulk_s:8.3f}s  {args.stores / bulk_s:10.0f} rows/s")
+    print(f"  speed-up: {per_row_s / bulk_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
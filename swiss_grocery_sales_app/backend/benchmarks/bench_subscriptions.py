@@ -0,0 +1,84 @@
+"""
+Measures price alert matching (app.subscriptions): the time to find the matching
+subscriptions for one promotion write, with the (cell, trigram) index vs. checking
+every subscription, at each --subscriptions size. Both are checked to agree.
+
+Subscriptions watch random products around datagen's towns; events are promotions
+at random stores.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_subscriptions --subscriptions 1000 100000
+"""
+import argparse
+import random
+import time
+
+from app import models, schemas, spatial
+from app.subscriptions import PriceEvent, Subscription, SubscriptionIndex
+
+from . import results
+from .datagen import PRODUCTS, make_stores
+
+
+def make_subscriptions(count, stores, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        store = rng.choice(stores)
+        yield Subscription(i + 1, schemas.PriceAlertSubscription(
+            q=rng.choice(PRODUCTS),
+            latitude=store.latitude + rng.uniform(-0.02, 0.02),
+            longitude=store.longitude + rng.uniform(-0.02, 0.02),
+            radius_m=rng.choice((1000, 3000, 5000, 10000)),
+            max_price=rng.uniform(1, 10),
+        ), connection=None)
+
+
+def make_events(count, stores, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        store = rng.choice(stores)
+        product = f"{rng.choice(PRODUCTS)} {rng.choice(['', 'bio ', 'M-Budget '])}{rng.randint(1, 5)}00g"
+        yield PriceEvent(
+            i + 1, i, store.name, store.chain_name, product, product.lower(), rng.uniform(0.5, 12),
+            store.latitude, store.longitude, spatial.geohash(store.latitude, store.longitude, models.STORE_CELL_PRECISION),
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--stores", type=int, default=3000)
+    args = parser.parse_args(argv)
+
+    stores = make_stores(args.stores)
+    events = list(make_events(args.events, stores))
+    rows = {}
+    for count in args.subscriptions:
+        all_subscriptions = list(make_subscriptions(count, stores))
+        index = SubscriptionIndex()
+        started = time.perf_counter()
+        for subscription in all_subscriptions:
+            index.add(subscription)
+        print(f"{count} subscriptions indexed in {time.perf_counter() - started:.2f}s ({index.entries} entries)")
+
+        indexed, scanned, matched = [], [], 0
+        for event in events:
+            started = time.perf_counter()
+            found = [subscription.id for subscription, _ in index.match(event)]
+            indexed.append(time.perf_counter() - started)
+            matched += len(found)
+            # The scan is the baseline; a sample of events is enough at large sizes
+            if len(scanned) < 200:
+                started = time.perf_counter()
+                expected = [s.id for s in all_subscriptions if s.distance_to(event) is not None]
+                scanned.append(time.perf_counter() - started)
+                assert found == expected
+        rows[f"{count} subscriptions: index"] = results.summarize(indexed, sum(indexed))
+        rows[f"{count} subscriptions: scan"] = results.summarize(scanned, sum(scanned))
+        print(f"  {matched / len(events):.2f} alerts per event, {index.candidates_checked / len(events):.1f} candidates checked per event")
+    results.print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares two benchmark result files (from bench_crud or loadtest --json) and flags
+regressions: latency percentiles that grew, or throughput that dropped, by more
+than --threshold percent. Exits with status 1 if any benchmark regressed, so it
+can gate CI.
+
+Usage (from the backend directory):
+    python -m benchmarks.compare baseline.json candidate.json
+    python -m benchmarks.compare baseline.json candidate.json --threshold 5 --metrics p50_ms,p99_ms
+
+Run both sides on the same machine and data set (see the "config" and
+"environment" sections of the files); differences there are reported first.
+"""
+import argparse
+import sys
+
+from . import results
+
+DEFAULT_METRICS = "p50_ms,p95_ms,p99_ms,throughput_per_s"
+# Metrics where a larger value is better
+HIGHER_IS_BETTER = {"throughput_per_s"}
+
+
+def change_percent(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(baseline, candidate, metrics, threshold):
+    """
+    Returns (rows, regressions): one row (benchmark, metric, before, after, change %,
+    regressed) per metric present on both sides, and the regressed rows.
+    """
+    rows = []
+    for name, before in baseline["results"].items():
+        after = candidate["results"].get(name)
+        if after is None:
+            continue
+        for metric in metrics:
+            if before.get(metric) is None or after.get(metric) is None:
+                continue
+            change = change_percent(before[metric], after[metric])
+            worse = change is not None and (-change if metric in HIGHER_IS_BETTER else change) > threshold
+            rows.append((name, metric, before[metric], after[metric], change, worse))
+        if after.get("errors", 0) > before.get("errors", 0):
+            rows.append((name, "errors", before.get("errors", 0), after["errors"], None, True))
+    return rows, [row for row in rows if row[5]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent (default: 10)")
+    parser.add_argument("--metrics", default=DEFAULT_METRICS)
+    args = parser.parse_args(argv)
+
+    baseline = results.read_results(args.baseline)
+    candidate = results.read_results(args.candidate)
+    if baseline.get("suite") != candidate.get("suite"):
+        raise SystemExit(f"Cannot compare suite {baseline.get('suite')!r} with {candidate.get('suite')!r}")
+    for section in ("config", "environment"):
+        for key in sorted(set(baseline.get(section, {})) | set(candidate.get(section, {}))):
+            before, after = baseline.get(section, {}).get(key), candidate.get(section, {}).get(key)
+            if before != after and key != "git_revision":
+                print(f"note: {section}.{key} differs: {before!r} -> {after!r}")
+
+    rows, regressions = compare(baseline, candidate, args.metrics.split(","), args.threshold)
+    print(f"{'benchmark':<36} {'metric':<16} {'before':>10} {'after':>10} {'change':>9}")
+    for name, metric, before, after, change, worse in rows:
+        change_text = f"{change:+.1f}%" if change is not None else ""
+        print(f"{name:<36} {metric:<16} {before:>10.3f} {after:>10.3f} {change_text:>9}{'  REGRESSION' if worse else ''}")
+
+    revisions = (baseline["environment"].get("git_revision"), candidate["environment"].get("git_revision"))
+    print(f"{len(regressions)} regression(s) above {args.threshold:g}% ({revisions[0]} -> {revisions[1]})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Synthetic, reproducible data set for the benchmarks: --stores stores spread across
+Switzerland (clustered around the larger towns, like real store locations) with
+--promotions promotions each, drawn from a shared product catalogue so searches,
+nearby queries and basket optimization have realistic overlap between stores.
+
+The same --seed always produces the same rows. Valid-until dates are relative to
+today: about a fifth of the promotions are already expired.
+
+Usage (from the backend directory):
+    python -m benchmarks.datagen --stores 1000 --promotions 50
+    python -m benchmarks.datagen --database-url postgresql://user:pw@localhost/bench_db
+
+Without --database-url a local SQLite file is used. With PostgreSQL, create the
+PostGIS extension first. The target database is wiped (drop_all/create_all).
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from app import best_price, crud, models, schemas
+from app.database import Base, engine_options
+
+DEFAULT_DATABASE_URL = "sqlite:///bench_data.sqlite3"
+
+# (name, latitude, longitude, weight): weights roughly follow population
+TOWNS = [
+    ("Zürich", 47.3769, 8.5417, 10),
+    ("Genève", 46.2044, 6.1432, 6),
+    ("Basel", 47.5596, 7.5886, 5),
+    ("Lausanne", 46.5197, 6.6323, 4),
+    ("Bern", 46.9480, 7.4474, 4),
+    ("Winterthur", 47.4988, 8.7237, 3),
+    ("Luzern", 47.0502, 8.3093, 3),
+    ("St. Gallen", 47.4245, 9.3767, 2),
+    ("Lugano", 46.0037, 8.9511, 2),
+    ("Biel", 47.1368, 7.2468, 2),
+    ("Thun", 46.7580, 7.6280, 1),
+    ("Fribourg", 46.8065, 7.1620, 1),
+    ("Chur", 46.8499, 9.5329, 1),
+    ("Sion", 46.2331, 7.3606, 1),
+    ("Neuchâtel", 46.9900, 6.9293, 1),
+]
+# Bounding box of Switzerland, for the stores outside the towns
+SWISS_BBOX = (45.82, 5.96, 47.81, 10.49)
+RURAL_SHARE = 0.2
+# Standard deviation of store positions around a town centre, in degrees (~4 km)
+TOWN_SPREAD_DEG = 0.035
+
+CHAINS = ["Migros", "Coop", "Denner", "Aldi", "Lidl", "Volg", "Spar"]
+PRODUCTS = [
+    "Vollmilch", "Butter", "Emmentaler", "Gruyère", "Joghurt Nature", "Rahm", "Eier",
+    "Ruchbrot", "Zopf", "Gipfeli", "Spaghetti", "Basmati Reis", "Olivenöl", "Tomaten Pelati",
+    "Äpfel Gala", "Bananen", "Orangen", "Erdbeeren", "Karotten", "Kartoffeln", "Zwiebeln",
+    "Rüebli", "Salat Eisberg", "Gurken", "Poulet Brust", "Rindshackfleisch", "Cervelat",
+    "Lachs Filet", "Kaffee Bohnen", "Schwarztee", "Orangensaft", "Mineralwasser", "Bier Lager",
+    "Rotwein", "Schokolade Milch", "Schokolade Dunkel", "Chips Paprika", "Müesli", "Honig",
+    "Konfitüre Erdbeer", "Waschmittel", "Toilettenpapier", "Zahnpasta", "Shampoo",
+]
+SIZES = ["", " 250g", " 500g", " 1kg", " 1l", " 6x1.5l", " Bio", " Family Pack"]
+
+
+def make_stores(count, seed=42):
+    rng = random.Random(seed)
+    towns = [town for town in TOWNS for _ in range(town[3])]
+    stores = []
+    for i in range(count):
+        if rng.random() < RURAL_SHARE:
+            town = "Land"
+            latitude = rng.uniform(SWISS_BBOX[0], SWISS_BBOX[2])
+            longitude = rng.uniform(SWISS_BBOX[1], SWISS_BBOX[3])
+        else:
+            town, lat, lon, _ = rng.choice(towns)
+            latitude = rng.gauss(lat, TOWN_SPREAD_DEG)
+            longitude = rng.gauss(lon, TOWN_SPREAD_DEG * 1.5)
+        chain = rng.choice(CHAINS)
+        stores.append(schemas.StoreCreate(
+            name=f"{chain} {town} {i}",
+            address=f"Bahnhofstrasse {i % 200 + 1}, {1000 + i % 8000} {town}",
+            latitude=round(latitude, 6),
+            longitude=round(longitude, 6),
+            chain_name=chain,
+        ))
+    return stores
+
+
+def make_promotions(store_ids, per_store, seed=42, today=None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    catalogue = [product + size for product in PRODUCTS for size in SIZES]
+    promotions = []
+    for store_id in store_ids:
+        for product_name in rng.sample(catalogue, min(per_store, len(catalogue))):
+            original = round(rng.uniform(0.9, 30), 2)
+            promotions.append(schemas.PromotionCreate(
+                store_id=store_id,
+                product_name=product_name,
+                sale_price=round(original * rng.uniform(0.5, 0.95), 2),
+                original_price=original,
+                valid_until=today + timedelta(days=rng.randint(-7, 28)),
+                description=f"{product_name} im Angebot",
+            ))
+    return promotions
+
+
+def create_bench_engine(url=DEFAULT_DATABASE_URL):
+    """
+    Engine with the app's pool settings. SQLite connections are shared across the
+    threadpool workers that serve sync endpoints.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url, **engine_options(url))
+
+
+def seed_database(engine, stores, promotions_per_store, seed=42, chunk_size=1000):
+    """
+    Recreates all tables and loads the synthetic data set, including the best-price
+    table. Returns the store IDs.
+    """
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        store_ids = crud.bulk_upsert_stores(db, make_stores(stores, seed), chunk_size)
+        for chunk in crud.chunked(make_promotions(store_ids, promotions_per_store, seed), chunk_size):
+            crud.upsert_promotions(db, chunk)
+        best_price.rebuild(db)
+        db.commit()
+        return sorted(store_ids)
+    finally:
+        db.close()
+
+
+def load_store_ids(engine):
+    db = sessionmaker(bind=engine)()
+    try:
+        return [store_id for (store_id,) in db.query(models.Store.id).order_by(models.Store.id)]
+    finally:
+        db.close()
+
+
+def dataset_size(engine):
+    """
+    Row counts recorded with the results, so runs on different data sets are not compared blindly.
+    """
+    db = sessionmaker(bind=engine)()
+    try:
+        return {
+            "stores": db.query(models.Store).count(),
+            "promotions": db.query(models.Promotion).count(),
+        }
+    finally:
+        db.close()
+
+
+def add_arguments(parser, stores=1000, promotions=50):
+    parser.add_argument("--stores", type=int, default=stores)
+    parser.add_argument("--promotions", type=int, default=promotions, help="Promotions per store")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    engine = create_bench_engine(args.database_url)
+    started = time.perf_counter()
+    ids = seed_database(engine, args.stores, args.promotions, args.seed)
+    print(f"Seeded {len(ids)} stores x {args.promotions} promotions on {engine.dialect.name} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
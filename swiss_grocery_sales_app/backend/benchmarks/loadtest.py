@@ -0,0 +1,225 @@
+"""
+asyncio load generator for the API. Reports p50/p95/p99 latency and throughput
+per scenario and overall.
+
+By default the requests go in-process to app.main:app via httpx.ASGITransport,
+with the app's get_db dependency bound to the benchmark database. No server is
+needed, but the client and the app then share one process and one event loop.
+With --url, the requests go to a running server instead, e.g.
+    uvicorn app.main:app --workers 4
+started with DATABASE_URL pointing at the database seeded here (or use --skip-seed
+against a database the server already uses).
+
+--concurrency clients each send their next request as soon as the previous one
+completes (closed loop), until --requests have been sent or --duration seconds
+have passed. Scenarios are picked at random with the weights given by --mix.
+
+Usage (from the backend directory):
+    python -m benchmarks.loadtest --concurrency 32 --requests 5000 --json load.json
+    python -m benchmarks.loadtest --mix read_store=1 --no-response-cache
+    python -m benchmarks.loadtest --url http://localhost:8000 --duration 60 --skip-seed \\
+        --database-url postgresql://user:pw@localhost/bench_db
+
+Compare two runs with python -m benchmarks.compare before.json after.json.
+Unless --skip-seed is given, the target database is wiped and seeded first.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import httpx
+from sqlalchemy.orm import sessionmaker
+
+from . import datagen, results
+from .bench_crud import LOCATIONS, QUERIES
+
+DEFAULT_MIX = "read_store=50,list_stores=10,nearby=15,best_prices=10,search=2,basket=5,create_store=8"
+
+
+def scenarios(store_ids, rng):
+    """
+    Scenario name -> function returning (method, path, params, json body) of one request.
+    """
+    created = iter(range(10 ** 9))
+
+    def location():
+        lat, lon = rng.choice(LOCATIONS)
+        # Within a few hundred metres of the town centre, so cache keys vary
+        return round(lat + rng.uniform(-0.005, 0.005), 5), round(lon + rng.uniform(-0.005, 0.005), 5)
+
+    def read_store():
+        return "GET", f"/api/v1/stores/{rng.choice(store_ids)}", {}, None
+
+    def list_stores():
+        return "GET", "/api/v1/stores", {"limit": 50, **({"chain_name": rng.choice(datagen.CHAINS)} if rng.random() < 0.5 else {})}, None
+
+    def nearby():
+        lat, lon = location()
+        return "GET", "/api/v1/promotions/nearby", {"lat": lat, "lon": lon, "radius_m": 3000}, None
+
+    def best_prices():
+        lat, lon = location()
+        return "GET", "/api/v1/best-prices", {"lat": lat, "lon": lon, "radius_m": 3000}, None
+
+    def search():
+        return "GET", "/api/v1/promotions/search", {"q": rng.choice(QUERIES)}, None
+
+    def basket():
+        lat, lon = location()
+        items = rng.sample(datagen.PRODUCTS, 5)
+        return "POST", "/api/v1/basket/optimize", {}, {"items": items, "latitude": lat, "longitude": lon}
+
+    def create_store():
+        i = next(created)
+        lat, lon = location()
+        return "POST", "/api/v1/stores", {}, {
+            "name": f"Load Store {time.time_ns()}-{i}",
+            "address": f"Lastweg {i}",
+            "latitude": lat,
+            "longitude": lon,
+            "chain_name": "Load",
+        }
+
+    return {
+        "read_store": read_store,
+        "list_stores": list_stores,
+        "nearby": nearby,
+        "best_prices": best_prices,
+        "search": search,
+        "basket": basket,
+        "create_store": create_store,
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_load(client, requests, mix, concurrency, total_requests=None, duration_s=None):
+    """
+    Runs the closed-loop load. Returns (latencies per scenario, errors per scenario, elapsed seconds).
+    """
+    rng = random.Random(7)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    sent = 0
+    started = time.perf_counter()
+    deadline = started + duration_s if duration_s else None
+
+    async def worker():
+        nonlocal sent
+        while (total_requests is None or sent < total_requests) and (deadline is None or time.perf_counter() < deadline):
+            sent += 1
+            name = rng.choices(names, weights)[0]
+            method, path, params, body = requests[name]()
+            request_started = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies[name].append(time.perf_counter() - request_started)
+            if not ok:
+                errors[name] += 1
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def in_process_client(engine, disable_response_cache):
+    from app.database import get_db
+    from app.main import app
+    from app.response_cache import response_cache
+
+    SessionLocal = sessionmaker(bind=engine, autoflush=False)
+
+    def get_bench_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_bench_db
+    response_cache.clear()
+    response_cache.enabled = not disable_response_cache
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+async def run(args, engine, store_ids):
+    mix = parse_mix(args.mix)
+    requests = scenarios(store_ids, random.Random(args.seed))
+    unknown = set(mix) - set(requests)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))} (known: {', '.join(requests)})")
+
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+    else:
+        client = in_process_client(engine, args.no_response_cache)
+    async with client:
+        if args.warmup:
+            await run_load(client, requests, mix, args.concurrency, total_requests=args.warmup)
+        return await run_load(client, requests, mix, args.concurrency, args.requests, args.duration)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    datagen.add_arguments(parser)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data already in the database")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of --requests")
+    parser.add_argument("--warmup", type=int, default=200, help="Untimed requests sent first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--no-response-cache", action="store_true", help="Disable the response cache (in-process only)")
+    parser.add_argument("--json", metavar="PATH", help="Write results as JSON (- for stdout)")
+    args = parser.parse_args(argv)
+    if args.duration:
+        args.requests = None
+
+    engine = datagen.create_bench_engine(args.database_url)
+    if args.skip_seed:
+        store_ids = datagen.load_store_ids(engine)
+    else:
+        store_ids = datagen.seed_database(engine, args.stores, args.promotions, args.seed)
+
+    size = datagen.dataset_size(engine)
+    latencies, errors, elapsed = asyncio.run(run(args, engine, store_ids))
+
+    summaries = {
+        "all": results.summarize([value for values in latencies.values() for value in values], elapsed)
+    }
+    summaries["all"]["errors"] = sum(errors.values())
+    for name in sorted(latencies):
+        summaries[name] = results.summarize(latencies[name], elapsed)
+        summaries[name]["errors"] = errors[name]
+
+    target = args.url or "in-process app.main:app"
+    print(f"{target}, {size['stores']} stores, {size['promotions']} promotions on {engine.dialect.name}, "
+          f"concurrency {args.concurrency}, "
+          f"{summaries['all']['count']} requests in {elapsed:.1f}s")
+    results.print_table(summaries)
+    if summaries["all"]["errors"]:
+        print("errors: " + ", ".join(f"{name}={count}" for name, count in sorted(errors.items())))
+    if args.json:
+        config = {
+            **size,
+            **{key: getattr(args, key) for key in ("seed", "concurrency", "requests", "duration", "mix", "no_response_cache")},
+        }
+        config["target"] = "url" if args.url else "in-process"
+        results.write_results(args.json, "load", config, summaries, engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Latency summaries and the JSON result format shared by bench_crud and loadtest,
+read back by benchmarks.compare.
+
+A result file looks like:
+    {"suite": "crud", "created_at": ..., "environment": {...}, "config": {...},
+     "results": {"<benchmark>": {"count": ..., "p50_ms": ..., "p95_ms": ..., "p99_ms": ...,
+                                 "mean_ms": ..., "min_ms": ..., "max_ms": ...,
+                                 "throughput_per_s": ...}}}
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank percentile (q in 0..100) of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_s, elapsed_s=None):
+    """
+    Latency statistics in milliseconds; throughput if the wall-clock time is given.
+    """
+    values = sorted(latencies_s)
+    if not values:
+        return {"count": 0}
+    summary = {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "mean_ms": sum(values) / len(values) * 1000,
+        "min_ms": values[0] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+    if elapsed_s:
+        summary["throughput_per_s"] = len(values) / elapsed_s
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in summary.items()}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment(engine=None):
+    info = {
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    if engine is not None:
+        info["database"] = engine.dialect.name
+    return info
+
+
+def write_results(path, suite, config, results, engine=None):
+    """
+    Writes a result file (or to stdout if path is "-").
+    """
+    document = {
+        "suite": suite,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(engine),
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2, sort_keys=True) + "\n"
+    if path == "-":
+        sys.stdout.write(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_table(results):
+    print(f"{'benchmark':<36} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per s':>9}")
+    for name, summary in results.items():
+        if not summary.get("count"):
+            print(f"{name:<36} {0:>7}")
+            continue
+        throughput = summary.get("throughput_per_s")
+        print(
+            f"{name:<36} {summary['count']:>7} {summary['p50_ms']:>9.3f} {summary['p95_ms']:>9.3f} "
+            f"{summary['p99_ms']:>9.3f} {throughput if throughput is not None else float('nan'):>9.1f}"
+        )
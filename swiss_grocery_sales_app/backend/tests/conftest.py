@@ -0,0 +1,108 @@
+import os
+
+# Keep the geocoding cache in memory during tests (must be set before importing app)
+os.environ.setdefault("GEOCODE_CACHE_PATH", "")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models # Registers the tables on Base.metadata
+from app.database import Base
+
+# In-memory SQLite database shared by all connections of a test.
+# PostGIS-specific columns and indexes degrade to plain types on SQLite.
+SQLALCHEMY_DATABASE_URL_TEST = "sqlite://"
+
+
+@pytest.fixture(scope="function")
+def db_engine():
+    engine_test = create_engine(
+        SQLALCHEMY_DATABASE_URL_TEST,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine_test) # Create tables
+    try:
+        yield engine_test
+    finally:
+        Base.metadata.drop_all(bind=engine_test) # Drop tables after test
+        engine_test.dispose()
+
+
+@pytest.fixture(scope="function")
+def db_session(db_engine):
+    SessionLocal_test = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+    db = SessionLocal_test()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="function")
+def db_client(db_session):
+    """TestClient whose get_db dependency yields the SQLite test session."""
+    from fastapi.testclient import TestClient
+    from app.database import get_db
+    from app.main import app
+
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture(scope="function")
+def make_store(db_session):
+    """
+    Factory adding a committed store to the test session. Everything has a default,
+    so tests only pass what they look at; other Store columns (e.g. promotions) can
+    be given as keyword arguments.
+    """
+    from app import crud
+
+    def make(name="Migros Bern", latitude=46.948, longitude=7.444, chain_name="Migros", address=None, **columns):
+        store = models.Store(
+            name=name,
+            address=address or f"{name} 1",
+            latitude=latitude,
+            longitude=longitude,
+            chain_name=chain_name,
+            geom=crud.point_wkt(latitude, longitude),
+            **columns,
+        )
+        db_session.add(store)
+        db_session.commit()
+        return store
+
+    return make
+
+
+@pytest.fixture(scope="function")
+def count_queries(db_engine):
+    """Collects the SQL statements executed on the test engine."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Responses cached by one test must not be served to the next."""
+    from app.response_cache import response_cache
+
+    response_cache.clear()
+    yield
+    response_cache.clear()
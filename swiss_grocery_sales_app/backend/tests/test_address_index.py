@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import address_index, geocoding, spatial
+from app.address_index import AddressIndex, address_key, build_index, parse_address, read_source
+from app.main import app
+
+SWISSTOPO_EXPORT = """\ufeffADR_EGAID;STN_LABEL;ADR_NUMBER;ZIP_LABEL;COM_CANTON;ADR_EASTING;ADR_NORTHING
+1;Bundesplatz;3;3005 Bern;BE;2600421.0;1199638.0
+2;Bahnhofstrasse;1a;8001 Zürich;ZH;2683249.0;1247036.0
+3;Ohne Nummer;;8001 Zürich;ZH;2683000.0;1247000.0
+4;Bundesplatz;3;3005 Bern;BE;2600000.0;1200000.0
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "addresses.bin")
+    build_index(read_source(SWISSTOPO_EXPORT.splitlines()), path)
+    index = AddressIndex(path)
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def configured_index(index):
+    address_index.set_address_index(index)
+    yield index
+    address_index.set_address_index(None)
+
+
+@pytest.mark.parametrize("address, key", [
+    ("Bundesplatz 3, 3005 Bern", "bundesplatz 3 3005"),
+    ("BAHNHOFSTR. 1 A,  CH-8001 Zürich", "bahnhofstrasse 1a 8001"),
+    ("Rte de Lausanne 12, 1201 Genève", "route de lausanne 12 1201"),
+    ("Bundesplatz, 3005 Bern", None),
+    ("Bundesplatz 3 Bern", None),
+])
+def test_parse_address(address, key):
+    assert parse_address(address) == key
+
+
+def test_lookup_converts_lv95_and_keeps_first_duplicate(index):
+    assert len(index) == 2
+    latitude, longitude = index.lookup("Bundesplatz 3, 3005 Bern")
+    expected = spatial.lv95_to_wgs84(2600421.0, 1199638.0)
+    assert latitude == pytest.approx(expected[0], abs=1e-6)
+    assert longitude == pytest.approx(expected[1], abs=1e-6)
+    assert index.lookup("Bahnhofstr. 1a, 8001 Zürich") is not None
+    assert index.lookup("Bahnhofstrasse 2, 8001 Zürich") is None
+    assert index.stats()["entries"] == 2
+
+
+def test_prefix_search_is_in_key_order(tmp_path):
+    path = str(tmp_path / "addresses.bin")
+    build_index(
+        [(address_key("Bahnhofstrasse", str(number), "8001"), 47.37, 8.54) for number in (10, 2, 1)]
+        + [(address_key("Bahnhofplatz", "1", "8001"), 47.38, 8.54)],
+        path,
+    )
+    index = AddressIndex(path)
+
+    assert [key for key, _, _ in index.search("Bahnhofstr 1")] == ["bahnhofstrasse 1 8001", "bahnhofstrasse 10 8001"]
+    assert [key for key, _, _ in index.search("bahnhof", limit=2)] == ["bahnhofplatz 1 8001", "bahnhofstrasse 1 8001"]
+    assert index.search("zz") == []
+    index.close()
+
+
+def test_read_source_rejects_unknown_layout():
+    with pytest.raises(ValueError):
+        list(read_source(["a;b;c", "1;2;3"]))
+
+
+def test_geocoding_uses_index_before_upstream(mocker, configured_index):
+    upstream = mocker.patch("app.geocoding._query_geo_admin", return_value=(1.0, 2.0))
+
+    local = asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Bundesplatz 3, 3005 Bern"))
+    remote = asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Marktgasse 1, 3011 Bern"))
+
+    assert local == configured_index.lookup("Bundesplatz 3, 3005 Bern")
+    assert remote == (1.0, 2.0)
+    assert upstream.call_count == 1
+
+
+def test_suggest_endpoint(configured_index):
+    client = TestClient(app)
+
+    response = client.get("/api/v1/geocode/suggest", params={"q": "Bundespl"})
+
+    assert response.status_code == 200
+    assert [item["address_key"] for item in response.json()] == ["bundesplatz 3 3005"]
+    assert client.get("/api/v1/geocode/index/stats").json()["entries"] == 2
+
+
+def test_suggest_endpoint_without_index():
+    assert TestClient(app).get("/api/v1/geocode/suggest", params={"q": "Bundespl"}).status_code == 404
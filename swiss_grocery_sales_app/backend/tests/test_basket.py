@@ -0,0 +1,124 @@
+import itertools
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from app import basket, crud, models, schemas
+
+BERN = (46.948, 7.444)
+
+
+def _offer(db, store, product_name, price, valid_until=None):
+    db.add(models.Promotion(store_id=store.id, product_name=product_name, sale_price=price, valid_until=valid_until))
+
+
+def _request(items, **kwargs):
+    return schemas.BasketRequest(items=items, latitude=BERN[0], longitude=BERN[1], **kwargs)
+
+
+def test_single_store_wins_when_travel_is_expensive(db_session, make_store):
+    near = make_store("Near", BERN[0] + 0.002, BERN[1])
+    far = make_store("Far", BERN[0] + 0.02, BERN[1], chain_name="Coop")
+    for store, prices in ((near, (1.60, 2.95, 3.10)), (far, (1.20, 2.50, 3.50))):
+        for product, price in zip(("Vollmilch 1L", "Butter 250g", "Brot"), prices):
+            _offer(db_session, store, product, price)
+    _offer(db_session, far, "Old Cheese", 0.10, valid_until=date.today() - timedelta(days=1))
+    db_session.commit()
+
+    result = basket.optimize_basket(db_session, _request(["vollmilch 1l", "Butter", "brot", "cheese"], cost_per_km=5))
+    assert [store.name for store in result.stores] == ["Near"]
+    assert result.items_total == pytest.approx(7.65)
+    assert result.missing_items == ["cheese"]
+    assert result.exact and result.method == "exact"
+
+    cheap_travel = basket.optimize_basket(db_session, _request(["vollmilch 1l", "Butter", "brot"], cost_per_km=0))
+    assert [store.name for store in cheap_travel.stores] == ["Near", "Far"]
+    assert cheap_travel.items_total == pytest.approx(1.20 + 2.50 + 3.10)
+    assert {item.item: item.store_id for item in cheap_travel.items} == {
+        "vollmilch 1l": far.id, "Butter": far.id, "brot": near.id,
+    }
+
+
+def test_numpy_and_python_paths_agree(db_session, make_store):
+    rng = random.Random(7)
+    products = [f"Product {i}" for i in range(15)]
+    for s in range(25):
+        store = make_store(f"Store {s}", BERN[0] + rng.uniform(-0.03, 0.03), BERN[1] + rng.uniform(-0.04, 0.04))
+        for product in rng.sample(products, 10):
+            _offer(db_session, store, product, round(rng.uniform(0.5, 9.5), 2))
+    db_session.commit()
+
+    for max_stores in (1, 2, 3):
+        request = _request([p.lower() for p in products], max_stores=max_stores, time_budget_ms=5000)
+        with_numpy = basket.optimize_basket(db_session, request, use_numpy=True)
+        without = basket.optimize_basket(db_session, request, use_numpy=False)
+        assert with_numpy.exact and without.exact
+        assert with_numpy.model_dump(exclude={"elapsed_ms"}) == without.model_dump(exclude={"elapsed_ms"})
+
+
+def test_exact_search_matches_brute_force():
+    rng = random.Random(3)
+    prices = [[rng.choice([rng.randint(50, 900), basket.MISSING_ITEM_CENTIMES]) for _ in range(12)] for _ in range(8)]
+    locations = [(BERN[0] + rng.uniform(-0.05, 0.05), BERN[1] + rng.uniform(-0.05, 0.05)) for _ in range(12)]
+    matrix = basket.PriceMatrix(prices, use_numpy=False)
+    travel = basket.TravelCosts(BERN, locations, centimes_per_km=30)
+
+    def cost(stores):
+        items = sum(min(row[s] for s in stores) for row in prices)
+        return items + travel.cost(stores)[0], stores
+
+    expected = min(cost(stores) for size in (1, 2, 3) for stores in itertools.combinations(range(12), size))
+    greedy = basket._greedy(matrix, travel, 3)
+    best, completed = basket._branch_and_bound(matrix, travel, 3, greedy, deadline=float("inf"))
+    assert completed and best == expected
+    assert greedy[0] >= expected[0]
+
+
+def test_greedy_only_for_large_inputs(db_session, make_store, monkeypatch):
+    monkeypatch.setattr(basket, "BASKET_EXACT_MAX_COMBINATIONS", 0)
+    store = make_store("Only", *BERN)
+    _offer(db_session, store, "Milch", 1.5)
+    db_session.commit()
+    result = basket.optimize_basket(db_session, _request(["milch", "eier"]))
+    assert (result.method, result.exact) == ("greedy", False)
+    assert result.total_cost == 1.5 and result.missing_items == ["eier"]
+
+
+def test_truncated_candidates_are_not_reported_exact(db_session, make_store, monkeypatch):
+    for s in range(3):
+        store = make_store(f"Store {s}", BERN[0] + s * 0.001, BERN[1])
+        _offer(db_session, store, "Milch", 1.5 + s)
+    db_session.commit()
+
+    monkeypatch.setattr(basket, "BASKET_MAX_CANDIDATE_STORES", 3)
+    assert basket.optimize_basket(db_session, _request(["milch"])).exact
+    monkeypatch.setattr(basket, "BASKET_MAX_CANDIDATE_STORES", 2)
+    result = basket.optimize_basket(db_session, _request(["milch"]))
+    assert (result.method, result.exact, result.candidate_stores) == ("exact", False, 2)
+
+
+def test_optimize_endpoint(db_client, db_session, make_store):
+    store = make_store("Denner", *BERN)
+    _offer(db_session, store, "Rösti 500g", 3.95)
+    db_session.commit()
+
+    response = db_client.post("/api/v1/basket/optimize", json={
+        "items": ["rösti"], "latitude": BERN[0], "longitude": BERN[1], "max_stores": 1,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["stores"][0]["store_id"] == store.id and body["items_total"] == 3.95
+    assert db_client.post("/api/v1/basket/optimize", json={"items": [], "latitude": 0, "longitude": 0}).status_code == 422
+
+
+def test_get_basket_candidates_filters_radius_and_products(db_session, make_store):
+    inside = make_store("Inside", BERN[0] + 0.01, BERN[1])
+    outside = make_store("Outside", BERN[0] + 0.1, BERN[1])
+    _offer(db_session, inside, "Vollmilch 1L", 1.5)
+    _offer(db_session, inside, "Brot", 2.5)
+    _offer(db_session, outside, "Vollmilch 1L", 1.0)
+    db_session.commit()
+    rows = crud.get_basket_candidates(db_session, ["milch"], BERN[0], BERN[1], 3000)
+    assert [(row.store_name, row.product_key) for row in rows] == [("Inside", "vollmilch 1l")]
+    assert 1100 < rows[0].distance_m < 1150
@@ -0,0 +1,150 @@
+import io
+from datetime import date, timedelta
+
+import pytest
+
+from app import best_price, bulk_import, ingest, models, schemas, spatial
+
+BERN = (46.948, 7.444)
+ZURICH = (47.378, 8.540)
+
+
+def _ingest(db, rows):
+    lines = "\n".join(
+        f'{{"store_id": {store_id}, "product_name": "{product}", "sale_price": {price}'
+        + (f', "valid_until": "{valid_until}"' if valid_until else "") + "}"
+        for store_id, product, price, valid_until in rows
+    )
+    return ingest.ingest_promotions(db, ingest.iter_feed_records(io.StringIO(lines), "ndjson"))
+
+
+def _best(db):
+    rows = db.query(
+        models.BestPrice.product_key, models.BestPrice.cell, models.BestPrice.store_id, models.BestPrice.sale_price
+    )
+    return {(product_key, cell): (store_id, float(price)) for product_key, cell, store_id, price in rows}
+
+
+def test_ingest_keeps_best_prices_up_to_date(db_session, make_store):
+    bern_a = make_store("Bern A", *BERN)
+    bern_b = make_store("Bern B", BERN[0] + 0.001, BERN[1], chain_name="Coop")
+    zurich = make_store("Zurich", *ZURICH)
+    assert bern_a.cell == bern_b.cell == spatial.geohash(*BERN)
+
+    _ingest(db_session, [
+        (bern_a.id, "Vollmilch  1L", 1.60, "2030-01-07"),
+        (bern_b.id, "vollmilch 1l", 1.45, "2030-01-07"),
+        (zurich.id, "Vollmilch 1L", 1.30, "2030-01-07"),
+    ])
+    assert _best(db_session) == {
+        ("vollmilch 1l", bern_a.cell): (bern_b.id, 1.45),
+        ("vollmilch 1l", zurich.cell): (zurich.id, 1.30),
+    }
+
+    # A price increase of the current winner hands the cell to the next cheapest store
+    _ingest(db_session, [(bern_b.id, "vollmilch 1l", 1.95, "2030-01-07")])
+    assert _best(db_session)[("vollmilch 1l", bern_a.cell)] == (bern_a.id, 1.60)
+    assert best_price.check_consistency(db_session) == {"missing": [], "unexpected": [], "wrong_price": []}
+
+
+def test_moved_store_leaves_its_old_cell(db_session):
+    bulk_import.import_stores(db_session, [
+        schemas.StoreCreate(name="Mobile", address="Markt 1", latitude=BERN[0], longitude=BERN[1]),
+    ])
+    store = db_session.query(models.Store).one()
+    _ingest(db_session, [(store.id, "Brot", 2.50, None)])
+    assert _best(db_session) == {("brot", spatial.geohash(*BERN)): (store.id, 2.50)}
+
+    bulk_import.import_stores(db_session, [
+        schemas.StoreCreate(name="Mobile", address="Markt 1", latitude=ZURICH[0], longitude=ZURICH[1]),
+    ])
+    assert _best(db_session) == {("brot", spatial.geohash(*ZURICH)): (store.id, 2.50)}
+
+
+def test_imported_stores_are_committed_with_their_best_prices(db_session, monkeypatch):
+    def fail(db, store_ids):
+        raise RuntimeError("refresh failed")
+
+    monkeypatch.setattr(best_price, "refresh_for_stores", fail)
+    with pytest.raises(RuntimeError):
+        bulk_import.import_stores(db_session, [
+            schemas.StoreCreate(name="Mobile", address="Markt 1", latitude=BERN[0], longitude=BERN[1]),
+        ])
+    db_session.rollback()
+    assert db_session.query(models.Store).count() == 0
+
+
+def test_expired_best_price_is_recomputed_by_expire(db_session, make_store):
+    store = make_store("Bern A", *BERN)
+    yesterday = date.today() - timedelta(days=1)
+    db_session.add_all([
+        models.Promotion(store_id=store.id, product_name="Butter", sale_price=2.00, valid_until=date.today()),
+        models.Promotion(store_id=store.id, product_name="Butter", sale_price=2.80),
+    ])
+    db_session.commit()
+    assert best_price.rebuild(db_session) == 1
+    db_session.commit()
+
+    # Tomorrow the 2.00 offer has expired; expire() recomputes the touched cell
+    later = date.today() + timedelta(days=1)
+    assert best_price.check_consistency(db_session, today=later)["wrong_price"] == [("butter", store.cell)]
+    assert best_price.expire(db_session, today=later, cells=[store.cell]) == 1
+    assert _best(db_session) == {("butter", store.cell): (store.id, 2.80)}
+    assert best_price.expire(db_session, today=yesterday) == 0
+
+
+def test_reads_skip_expired_winners_without_writing(db_session, make_store):
+    store = make_store("Bern A", *BERN)
+    db_session.add_all([
+        models.Promotion(store_id=store.id, product_name="Butter", sale_price=2.00, valid_until=date.today() - timedelta(days=1)),
+        models.Promotion(store_id=store.id, product_name="Butter", sale_price=2.80),
+        models.Promotion(store_id=store.id, product_name="Käse", sale_price=5.00, valid_until=date.today() - timedelta(days=1)),
+    ])
+    db_session.commit()
+    best_price.rebuild(db_session, today=date.today() - timedelta(days=2))
+    db_session.commit()
+
+    rows = best_price.nearby_best_prices(db_session, *BERN, 1000)
+
+    assert [(row.product_key, float(row.sale_price), promotion.id) for row, promotion, _, _ in rows] == [
+        ("butter", 2.80, 2),
+    ]
+    # The stale rows are left for the lifecycle job
+    assert not db_session.new and not db_session.dirty
+    assert _best(db_session)[("butter", store.cell)] == (store.id, 2.00)
+    assert best_price.expire(db_session) == 2
+    assert _best(db_session) == {("butter", store.cell): (store.id, 2.80)}
+
+
+def test_refresh_keys_upserts_existing_rows(db_session, make_store):
+    store = make_store("Bern A", *BERN)
+    _ingest(db_session, [(store.id, "Brot", 2.50, None)])
+    key = ("brot", store.cell)
+    # Refreshing keys that already have a row updates it in place
+    assert best_price.refresh_keys(db_session, [key]) == 1
+    db_session.query(models.Promotion).update({models.Promotion.sale_price: 2.20})
+    assert best_price.refresh_keys(db_session, [key, key]) == 1
+    db_session.commit()
+    assert _best(db_session) == {key: (store.id, 2.20)}
+
+
+def test_best_prices_endpoint(db_client, db_session, make_store):
+    near = make_store("Near", *BERN)
+    other = make_store("Other", BERN[0] + 0.03, BERN[1] + 0.03, chain_name="Coop")
+    far = make_store("Far", *ZURICH)
+    _ingest(db_session, [
+        (near.id, "Vollmilch 1L", 1.60, None),
+        (other.id, "Vollmilch 1L", 1.50, None),
+        (near.id, "Butter 250g", 2.95, None),
+        (far.id, "Brot", 1.00, None),
+    ])
+
+    response = db_client.get("/api/v1/best-prices", params={"lat": BERN[0], "lon": BERN[1], "radius_m": 6000})
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["product_key"] for item in body] == ["butter 250g", "vollmilch 1l"]
+    assert body[1]["store_name"] == "Other" and body[1]["sale_price"] == 1.5
+    assert body[1]["distance_m"] > 3000
+
+    response = db_client.get("/api/v1/best-prices", params={"lat": BERN[0], "lon": BERN[1], "q": "Vollmilch"})
+    assert [item["product_key"] for item in response.json()] == ["vollmilch 1l"]
@@ -0,0 +1,227 @@
+from datetime import date, timedelta
+
+from app import crud, models, schemas
+
+
+def _add_store(db, name, latitude, longitude, chain_name="Migros"):
+    return crud.create_store(db, schemas.StoreCreate(
+        name=name,
+        address=f"{name} Strasse 1",
+        latitude=latitude,
+        longitude=longitude,
+        chain_name=chain_name,
+    ))
+
+
+def _add_promotion(db, store, product_name, sale_price, valid_until=None):
+    promotion = models.Promotion(
+        store_id=store.id,
+        product_name=product_name,
+        sale_price=sale_price,
+        valid_until=valid_until,
+    )
+    db.add(promotion)
+    db.commit()
+    return promotion
+
+
+def test_create_and_get_store(db_session):
+    store = _add_store(db_session, "Bern Bahnhof", 46.9490, 7.4390)
+    assert store.id is not None
+    assert store.geom == "POINT(7.439 46.949)"
+    assert crud.get_store(db_session, store.id).name == "Bern Bahnhof"
+
+
+def test_get_nearby_promotions_orders_by_price_then_distance(db_session):
+    near = _add_store(db_session, "Near", 46.9480, 7.4480)
+    farther = _add_store(db_session, "Farther", 46.9600, 7.4480, chain_name="Coop")
+    outside = _add_store(db_session, "Outside", 47.3780, 8.5400)
+
+    _add_promotion(db_session, near, "Vollmilch 1L", 1.60)
+    _add_promotion(db_session, farther, "Vollmilch 1L", 1.60)
+    _add_promotion(db_session, farther, "Milch Drink", 1.20)
+    _add_promotion(db_session, outside, "Milch", 0.50)
+    _add_promotion(db_session, near, "Milchreis", 0.90, valid_until=date.today() - timedelta(days=1))
+    _add_promotion(db_session, near, "Brot", 2.00)
+
+    rows = crud.get_nearby_promotions(
+        db_session, latitude=46.9480, longitude=7.4470, radius_m=3000, query="milch"
+    )
+
+    assert [(promotion.product_name, store.name) for promotion, store, _ in rows] == [
+        ("Milch Drink", "Farther"),
+        ("Vollmilch 1L", "Near"),
+        ("Vollmilch 1L", "Farther"),
+    ]
+    assert rows[1][2] < rows[2][2]
+    assert all(distance <= 3000 for _, _, distance in rows)
+
+
+def test_get_nearby_promotions_limit_and_empty(db_session):
+    store = _add_store(db_session, "Only", 46.9480, 7.4480)
+    for price in (3.0, 1.0, 2.0):
+        _add_promotion(db_session, store, f"Item {price}", price)
+
+    rows = crud.get_nearby_promotions(db_session, 46.9480, 7.4480, radius_m=100, limit=2)
+    assert [float(promotion.sale_price) for promotion, _, _ in rows] == [1.0, 2.0]
+
+    assert crud.get_nearby_promotions(db_session, 45.0, 6.0, radius_m=100) == []
+
+
+def test_get_nearby_promotions_limit_keeps_the_closest_of_tied_prices(db_session):
+    farther = _add_store(db_session, "Farther", 46.9600, 7.4480)
+    near = _add_store(db_session, "Near", 46.9480, 7.4480)
+    # The farther store's promotion has the lower ID, so SQL alone would keep it
+    _add_promotion(db_session, farther, "Vollmilch 1L", 1.60)
+    _add_promotion(db_session, near, "Vollmilch 1L", 1.60)
+    _add_promotion(db_session, farther, "Butter", 1.20)
+
+    rows = crud.get_nearby_promotions(db_session, 46.9480, 7.4470, radius_m=3000, limit=2)
+
+    assert [(promotion.product_name, store.name) for promotion, store, _ in rows] == [
+        ("Butter", "Farther"),
+        ("Vollmilch 1L", "Near"),
+    ]
+
+
+def test_bulk_upsert_stores_inserts_and_updates(db_session):
+    stores = [
+        schemas.StoreCreate(name=f"Migros {i}", address=f"Hauptstrasse {i}", latitude=47.0 + i / 1000, longitude=8.0, chain_name="Migros")
+        for i in range(25)
+    ]
+    assert len(crud.bulk_upsert_stores(db_session, stores, chunk_size=10)) == 25
+    assert db_session.query(models.Store).count() == 25
+
+    moved = schemas.StoreCreate(name="Migros 3", address="Hauptstrasse 3", latitude=46.5, longitude=7.5, chain_name="Migros MM")
+    duplicate_in_chunk = [moved, moved.model_copy(update={"latitude": 46.6})]
+    assert len(crud.bulk_upsert_stores(db_session, duplicate_in_chunk)) == 1
+
+    db_session.expire_all()
+    assert db_session.query(models.Store).count() == 25
+    updated = db_session.query(models.Store).filter(models.Store.name == "Migros 3").one()
+    assert (updated.latitude, updated.longitude, updated.chain_name) == (46.6, 7.5, "Migros MM")
+    assert updated.geom == "POINT(7.5 46.6)"
+
+
+def _store_with_promotions(db, count=5):
+    store = _add_store(db, "Coop Thun", 46.758, 7.628, chain_name="Coop")
+    for i in range(count):
+        expired = i % 2 == 1
+        valid_until = date.today() - timedelta(days=1) if expired else date.today() + timedelta(days=7)
+        _add_promotion(db, store, f"Item {i}", 1.0 + i, valid_until=valid_until)
+    store_id = store.id
+    db.expunge_all()
+    return store_id
+
+
+def test_get_store_loads_promotions_in_one_query(db_session, count_queries):
+    store_id = _store_with_promotions(db_session)
+    count_queries.clear()
+
+    store = crud.get_store(db_session, store_id)
+    schemas.StoreRead.model_validate(store)  # serialization must not trigger lazy loads
+
+    assert len(store.promotions) == 5
+    assert len(count_queries) == 1
+
+
+def test_get_store_active_only_and_paged(db_session, count_queries):
+    store_id = _store_with_promotions(db_session)
+
+    active = crud.get_store(db_session, store_id, active_only=True)
+    assert [p.product_name for p in active.promotions] == ["Item 0", "Item 2", "Item 4"]
+    db_session.expunge_all()
+
+    count_queries.clear()
+    page = crud.get_store(db_session, store_id, promotions_limit=2, promotions_offset=1)
+    schemas.StoreRead.model_validate(page)
+    assert [p.product_name for p in page.promotions] == ["Item 1", "Item 2"]
+    assert len(count_queries) == 2
+
+    active_page = crud.get_store(db_session, store_id, active_only=True, promotions_limit=2, promotions_offset=2)
+    assert [p.product_name for p in active_page.promotions] == ["Item 4"]
+    assert crud.get_store(db_session, 12345, promotions_limit=10) is None
+
+
+def test_promotions_loader_selectin_for_lists(db_session, count_queries):
+    _store_with_promotions(db_session)
+    _add_store(db_session, "Empty", 46.0, 7.0)
+    db_session.expunge_all()
+    count_queries.clear()
+
+    stores = db_session.query(models.Store).options(crud.promotions_loader("selectin", active_only=True)).all()
+    assert sorted(len(store.promotions) for store in stores) == [0, 3]
+    assert len(count_queries) == 2
+
+
+def test_get_stores_keyset_pages(db_session):
+    for i in range(7):
+        _add_store(db_session, f"Store {i}", 46.9, 7.4, chain_name="Coop" if i % 2 else "Migros")
+
+    first = crud.get_stores(db_session, limit=3)
+    second = crud.get_stores(db_session, after_id=first[-1].id, limit=3)
+    assert [s.name for s in first + second] == [f"Store {i}" for i in range(6)]
+
+    coop = crud.get_stores(db_session, chain_name="Coop", after_id=first[0].id, limit=10)
+    assert [s.name for s in coop] == ["Store 1", "Store 3", "Store 5"]
+
+
+def test_get_promotions_keyset_pages_by_price_then_id(db_session):
+    coop = _add_store(db_session, "Coop", 46.9, 7.4, chain_name="Coop")
+    migros = _add_store(db_session, "Migros", 46.9, 7.4, chain_name="Migros")
+    prices = [10.0, 9.5, 1.2, 9.5, 2.0, 1.2]
+    for i, price in enumerate(prices):
+        _add_promotion(db_session, coop if i % 2 else migros, f"Milch {i}", price)
+    _add_promotion(db_session, coop, "Expired Milch", 0.1, valid_until=date.today() - timedelta(days=1))
+
+    seen = []
+    after = None
+    while True:
+        page = crud.get_promotions(db_session, product="milch", after=after, limit=4)
+        seen.extend(page)
+        if len(page) < 4:
+            break
+        after = (page[-1].sale_price, page[-1].id)
+
+    assert [float(p.sale_price) for p in seen] == sorted(prices)
+    assert len({p.id for p in seen}) == len(prices)
+    ties = [p.id for p in seen if float(p.sale_price) == 9.5]
+    assert ties == sorted(ties)
+
+    coop_only = crud.get_promotions(db_session, chain_name="Coop")
+    assert {p.store_id for p in coop_only} == {coop.id}
+
+
+def test_search_promotions_ranks_by_similarity_then_price(db_session):
+    store = _add_store(db_session, "Coop", 46.9, 7.4)
+    _add_promotion(db_session, store, "Vollmilch 1L", 1.80)
+    _add_promotion(db_session, store, "Milch Drink", 1.20)
+    _add_promotion(db_session, store, "Milch UHT", 1.50)
+    _add_promotion(db_session, store, "Milch abgelaufen", 0.10, valid_until=date.today() - timedelta(days=1))
+    _add_promotion(db_session, store, "Brot", 2.00)
+
+    results = crud.search_promotions(db_session, "milch")
+
+    assert [(promotion.product_name, round(score, 2)) for promotion, score in results] == [
+        ("Milch Drink", 1.0),
+        ("Milch UHT", 1.0),
+        ("Vollmilch 1L", 0.67),
+    ]
+    assert crud.search_promotions(db_session, "milch", limit=1)[0][0].product_name == "Milch Drink"
+    assert crud.search_promotions(db_session, "Käse") == []
+
+
+def test_search_index_is_reused_until_promotions_change(db_session):
+    from app import ingest, search
+
+    store = _add_store(db_session, "Coop", 46.9, 7.4)
+    _add_promotion(db_session, store, "Milch UHT", 1.50)
+    assert len(crud.search_promotions(db_session, "milch")) == 1
+    loads = search.promotion_index.stats()["loads"]
+    assert len(crud.search_promotions(db_session, "milch")) == 1
+    assert search.promotion_index.stats()["loads"] == loads
+
+    # Core upserts of the feed ingestion invalidate it too
+    ingest.ingest_promotions(db_session, [(1, {"store_id": store.id, "product_name": "Bio Milch", "sale_price": "1.9"})])
+    assert [p.product_name for p, _ in crud.search_promotions(db_session, "milch")] == ["Milch UHT", "Bio Milch"]
+    assert search.promotion_index.stats()["loads"] == loads + 1
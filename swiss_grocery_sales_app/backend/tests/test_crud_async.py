@@ -0,0 +1,87 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.pool import StaticPool
+
+pytest.importorskip("aiosqlite")
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import crud_async, database, models, schemas
+from app.database import Base, async_database_url, engine_options
+
+
+def run_with_session(work):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with async_sessionmaker(bind=engine, expire_on_commit=False)() as db:
+                return await work(db)
+        finally:
+            await engine.dispose()
+    return asyncio.run(run())
+
+
+def test_async_database_url():
+    assert async_database_url("postgresql://u:p@db:5432/grocery") == "postgresql+asyncpg://u:p@db:5432/grocery"
+    assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+    assert engine_options("sqlite://") == {}
+    assert engine_options("postgresql://u@db/grocery")["pool_size"] == database.DB_POOL_SIZE
+
+
+def test_async_create_and_get_store():
+    async def work(db):
+        store = await crud_async.create_store(db, schemas.StoreCreate(
+            name="Migros Bern", address="Marktgasse 46", latitude=46.948, longitude=7.444, chain_name="Migros"
+        ))
+        assert store.promotions == []
+        for i in range(4):
+            valid_until = date.today() - timedelta(days=1) if i == 3 else None
+            db.add(models.Promotion(store_id=store.id, product_name=f"Item {i}", sale_price=4 - i, valid_until=valid_until))
+        await db.commit()
+        db.expunge_all()
+
+        full = await crud_async.get_store(db, store.id)
+        assert len(full.promotions) == 4
+        db.expunge_all()
+        page = await crud_async.get_store(db, store.id, active_only=True, promotions_limit=2, promotions_offset=1)
+        assert [p.product_name for p in page.promotions] == ["Item 1", "Item 2"]
+        assert schemas.StoreRead.model_validate(page).name == "Migros Bern"
+        assert await crud_async.get_store(db, 999) is None
+        store_row, promotion_rows = await crud_async.get_store_rows(db, store.id, active_only=True, promotions_limit=2)
+        assert store_row.name == "Migros Bern" and [row.product_name for row in promotion_rows] == ["Item 0", "Item 1"]
+        db.expunge_all()
+
+        stores = await crud_async.get_stores(db, chain_name="Migros", include_promotions=True)
+        assert [len(s.promotions) for s in stores] == [3]
+        cheapest = await crud_async.get_promotions(db, product="item", limit=2)
+        assert [float(p.sale_price) for p in cheapest] == [2.0, 3.0]
+        after = await crud_async.get_promotions(db, after=(cheapest[-1].sale_price, cheapest[-1].id))
+        assert [p.product_name for p in after] == ["Item 0"]
+
+    run_with_session(work)
+
+
+def test_read_store_endpoint_in_async_mode(monkeypatch, mocker):
+    from fastapi.testclient import TestClient
+    from app import main
+
+    monkeypatch.setattr(database, "DB_ASYNC", True)
+    get_store_rows = mocker.patch("app.crud_async.get_store_rows", return_value=(("Coop", "Weg 1", 46.9, 7.4, None, 5), []))
+
+    async def fake_session():
+        yield "async-session"
+
+    main.app.dependency_overrides[main.get_session] = fake_session
+    try:
+        response = TestClient(main.app).get("/api/v1/stores/5")
+    finally:
+        main.app.dependency_overrides.pop(main.get_session, None)
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "Coop"
+    get_store_rows.assert_called_once_with(
+        db="async-session", store_id=5, active_only=False, promotions_limit=100, promotions_offset=0
+    )
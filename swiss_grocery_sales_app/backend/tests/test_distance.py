@@ -0,0 +1,120 @@
+import random
+
+import numpy as np
+import pytest
+
+from app import basket, crud, distance, models, schemas, spatial
+from app.distance import DistanceService, KDTree, RoadDistances, StoreLocations, build_road_distances
+
+BERN = (46.948, 7.444)
+
+
+def _random_stores(count, seed=5):
+    rng = random.Random(seed)
+    return [(i + 1, rng.uniform(45.82, 47.81), rng.uniform(5.96, 10.49)) for i in range(count)]
+
+
+def _brute_force(stores, latitude, longitude):
+    return sorted(
+        ((spatial.haversine_m(latitude, longitude, lat, lon), store_id) for store_id, lat, lon in stores)
+    )
+
+
+@pytest.mark.parametrize("tree_min_stores", [0, 10 ** 9])
+def test_nearest_and_within_match_brute_force(tree_min_stores):
+    stores = _random_stores(3000)
+    locations = StoreLocations(stores, tree_min_stores=tree_min_stores)
+    assert (locations.tree is not None) == (tree_min_stores == 0)
+
+    for latitude, longitude in ((46.5, 7.2), BERN, (47.8, 10.4)):
+        expected = _brute_force(stores, latitude, longitude)
+        nearest = locations.nearest(latitude, longitude, 7)
+        assert [store_id for store_id, _ in nearest] == [store_id for _, store_id in expected[:7]]
+        assert [d for _, d in nearest] == pytest.approx([d for d, _ in expected[:7]])
+
+        within = locations.within(latitude, longitude, 15000)
+        assert [store_id for store_id, _ in within] == [store_id for d, store_id in expected if d <= 15000]
+        assert locations.nearest(latitude, longitude, 500, radius_m=15000) == within[:500]
+
+
+def test_kd_tree_handles_duplicates_and_empty_input():
+    points = distance.unit_vectors([46.9] * 100, [7.4] * 100)
+    tree = KDTree(points, leaf_size=4)
+    assert len(tree.nearest(points[0], 10)) == 10
+    assert len(tree.within(points[0], 1e-9)) == 100
+
+    empty = StoreLocations([], tree_min_stores=0)
+    assert empty.nearest(*BERN, 3) == [] and empty.within(*BERN, 1000) == []
+
+
+def test_locations_reload_after_store_writes(db_session):
+    service = distance.distance_service
+    store = crud.create_store(db_session, schemas.StoreCreate(name="A", address="A 1", latitude=BERN[0], longitude=BERN[1]))
+    assert [store_id for store_id, _ in service.locations(db_session).within(*BERN, 100)] == [store.id]
+
+    # Both committed ORM writes and bulk upserts invalidate the process-wide service
+    crud.bulk_upsert_stores(db_session, [schemas.StoreCreate(name="B", address="B 1", latitude=BERN[0] + 0.0001, longitude=BERN[1])])
+    db_session.commit()
+    assert len(service.locations(db_session)) == 2
+    store.latitude = 47.0
+    db_session.commit()
+    assert len(service.locations(db_session).within(*BERN, 100)) == 1
+
+
+def test_locations_are_invalidated_on_commit_not_flush(db_session):
+    service = distance.distance_service
+    invalidations = service.stats()["invalidations"]
+
+    db_session.add(models.Store(name="A", address="A 1", latitude=BERN[0], longitude=BERN[1]))
+    db_session.flush()
+    # A reload between the flush and the commit would otherwise be kept
+    assert service.stats()["invalidations"] == invalidations
+    db_session.commit()
+    assert service.stats()["invalidations"] == invalidations + 1
+    assert len(service.locations(db_session)) == 1
+
+    db_session.add(models.Store(name="B", address="B 1", latitude=BERN[0], longitude=BERN[1]))
+    db_session.flush()
+    db_session.rollback()
+    db_session.commit()
+    assert service.stats()["invalidations"] == invalidations + 1
+
+
+def test_locations_expire_after_ttl(db_session):
+    now = [0.0]
+    service = DistanceService(ttl_s=10, clock=lambda: now[0])
+    first = service.locations(db_session)
+    assert service.locations(db_session) is first
+    now[0] = 11.0
+    assert service.locations(db_session) is not first
+    assert service.stats()["loads"] == 2
+
+
+def test_road_distances_override_straight_lines(tmp_path):
+    stores = [(1, 46.95, 7.45), (2, 46.96, 7.46), (3, 46.97, 7.47)]
+    cell = spatial.geohash(*BERN, precision=6)
+    path = str(tmp_path / "roads.npz")
+    stats = build_road_distances(
+        [("store:1", 2, 2500.0), ("store:2", 1, 2700.0), (f"cell:{cell}", 1, 900.0)], path
+    )
+    assert stats["known_store_pairs"] == 4 and stats["cells"] == 1
+    with pytest.raises(ValueError):
+        build_road_distances([("town:Bern", 1, 100.0)], path)
+
+    service = DistanceService(detour_factor=1.5)
+    straight = np.array(service.travel_matrix(BERN, stores))
+    service.set_road_distances(RoadDistances(path))
+    matrix = np.array(service.travel_matrix(BERN, stores))
+
+    assert matrix[1, 2] == 2500.0 and matrix[2, 1] == 2700.0
+    assert matrix[0, 1] == matrix[1, 0] == 900.0
+    assert matrix[0, 3] == pytest.approx(straight[0, 3] * 1.5)
+    assert matrix[2, 3] == pytest.approx(straight[2, 3] * 1.5)
+    assert np.diag(matrix).tolist() == [0.0] * 4
+
+
+def test_travel_matrix_matches_python_haversine():
+    stores = _random_stores(12)
+    matrix = DistanceService().travel_matrix(BERN, stores)
+    travel = basket.TravelCosts(BERN, [(lat, lon) for _, lat, lon in stores], centimes_per_km=30)
+    assert np.allclose(matrix, travel._distance, rtol=1e-12, atol=1e-6)
@@ -0,0 +1,247 @@
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+from app import geocoding
+from app.geocode_cache import MISS, GeocodeCache, normalize_address
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalize_address():
+    assert normalize_address("Bundesplatz 1,  3011 Bern") == "bundesplatz 1 3011 bern"
+    assert normalize_address(" BUNDESPLATZ 1 3011 BERN ") == "bundesplatz 1 3011 bern"
+    assert normalize_address("Zürichstrasse 5") == "zürichstrasse 5"
+
+
+def test_cache_hit_and_ttl_expiry():
+    clock = FakeClock()
+    cache = GeocodeCache(ttl_s=60, negative_ttl_s=10, clock=clock)
+
+    assert cache.get("Bundesplatz 1, 3011 Bern") is MISS
+    cache.set("Bundesplatz 1, 3011 Bern", (46.94, 7.44))
+    assert cache.get("bundesplatz 1 3011 bern") == (46.94, 7.44)
+
+    clock.now += 61
+    assert cache.get("Bundesplatz 1, 3011 Bern") is MISS
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_cache_negative_entries_use_shorter_ttl():
+    clock = FakeClock()
+    cache = GeocodeCache(ttl_s=60, negative_ttl_s=10, clock=clock)
+    cache.set("Nowhere 1", None)
+
+    assert cache.get("Nowhere 1") is None
+    assert cache.stats()["negative_hits"] == 1
+    clock.now += 11
+    assert cache.get("Nowhere 1") is MISS
+
+
+def test_cache_lru_eviction():
+    cache = GeocodeCache(max_entries=2)
+    cache.set("a", (1.0, 1.0))
+    cache.set("b", (2.0, 2.0))
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", (3.0, 3.0))
+
+    assert cache.get("b") is MISS
+    assert cache.get("a") == (1.0, 1.0)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "geocode_cache.sqlite3")
+    clock = FakeClock()
+    GeocodeCache(path=path, clock=clock).set("Bundesplatz 1, 3011 Bern", (46.94, 7.44))
+
+    fresh = GeocodeCache(path=path, clock=clock)
+    assert fresh.get("Bundesplatz 1, 3011 Bern") == (46.94, 7.44)
+    assert fresh.stats()["persistent_hits"] == 1
+    # Promoted into the in-process tier
+    assert fresh.get("Bundesplatz 1, 3011 Bern") == (46.94, 7.44)
+    assert fresh.stats()["hits"] == 1
+
+    clock.now += 365 * 24 * 3600
+    assert fresh.purge_expired() == 1
+
+
+def test_cache_uses_wal_and_treats_lock_errors_as_misses(tmp_path):
+    path = str(tmp_path / "geocode_cache.sqlite3")
+    cache = GeocodeCache(path=path, busy_timeout_s=0.05)
+    cache.open()
+    assert cache._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # Another worker holds the write lock for longer than the busy timeout
+    other = sqlite3.connect(path)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        cache.set("Bundesplatz 1, 3011 Bern", (46.94, 7.44))
+        assert cache.get("Bundesplatz 1, 3011 Bern") == (46.94, 7.44)  # Still in the in-process tier
+        # With WAL, reads are not blocked by the writer
+        assert cache.get("Nowhere 1") is MISS
+    finally:
+        other.rollback()
+        other.close()
+    assert cache.stats()["errors"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_async_cache_reads_persistent_tier(tmp_path):
+    path = str(tmp_path / "geocode_cache.sqlite3")
+
+    async def run():
+        await GeocodeCache(path=path).set_async("Bundesplatz 1, 3011 Bern", (46.94, 7.44))
+        fresh = GeocodeCache(path=path)
+        return await fresh.get_async("bundesplatz 1 3011 bern"), await fresh.get_async("Nowhere 1"), fresh.stats()
+
+    value, missing, stats = asyncio.run(run())
+    assert value == (46.94, 7.44)
+    assert missing is MISS
+    assert stats["persistent_hits"] == 1 and stats["misses"] == 1
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = GeocodeCache()
+    monkeypatch.setattr(geocoding, "geocode_cache", cache)
+    return cache
+
+
+def test_fetch_coordinates_uses_cache(mocker, fresh_cache):
+    upstream = mocker.patch("app.geocoding._query_geo_admin", return_value=(46.94, 7.44))
+
+    first = asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Bundesplatz 1, 3011 Bern"))
+    second = asyncio.run(geocoding.fetch_coordinates_from_geo_admin("bundesplatz 1, 3011 bern"))
+
+    assert first == second == (46.94, 7.44)
+    upstream.assert_called_once()
+
+
+def test_fetch_coordinates_caches_not_found_but_not_errors(mocker, fresh_cache):
+    upstream = mocker.patch("app.geocoding._query_geo_admin", return_value=None)
+    assert asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Nowhere 1")) is None
+    assert asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Nowhere 1")) is None
+    assert upstream.call_count == 1
+
+    failing = mocker.patch(
+        "app.geocoding._query_geo_admin", side_effect=httpx.ConnectError("connection refused")
+    )
+    assert asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Somewhere 2")) is None
+    assert asyncio.run(geocoding.fetch_coordinates_from_geo_admin("Somewhere 2")) is None
+    assert failing.call_count == 2
+
+
+def _geo_admin_handler(calls, delay=0.0):
+    async def handler(request):
+        calls.append(request.url.params["searchText"])
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json={
+            "features": [{"geometry": {"type": "Point", "coordinates": [7.44, 46.94]}}]
+        })
+    return handler
+
+
+def test_concurrent_lookups_are_coalesced(fresh_cache):
+    calls = []
+
+    async def run():
+        await geocoding.start_http_client(httpx.MockTransport(_geo_admin_handler(calls, delay=0.05)))
+        try:
+            return await asyncio.gather(*[
+                geocoding.fetch_coordinates_from_geo_admin("Bundesplatz 1, 3011 Bern") for _ in range(20)
+            ])
+        finally:
+            await geocoding.close_http_client()
+
+    results = asyncio.run(run())
+
+    assert results == [(46.94, 7.44)] * 20
+    assert calls == ["Bundesplatz 1, 3011 Bern"]
+    assert geocoding._inflight == {}
+
+
+def test_shared_client_is_reused_across_requests(fresh_cache):
+    calls = []
+
+    async def run():
+        client = await geocoding.start_http_client(httpx.MockTransport(_geo_admin_handler(calls)))
+        try:
+            for street_number in range(3):
+                await geocoding.fetch_coordinates_from_geo_admin(f"Bundesplatz {street_number}, 3011 Bern")
+                assert geocoding.get_http_client() is client
+        finally:
+            await geocoding.close_http_client()
+        return client
+
+    client = asyncio.run(run())
+
+    assert len(calls) == 3
+    assert client.is_closed
+    assert geocoding._client is None
+
+
+def test_cancelled_caller_does_not_cancel_shared_lookup(fresh_cache):
+    calls = []
+
+    async def run():
+        await geocoding.start_http_client(httpx.MockTransport(_geo_admin_handler(calls, delay=0.05)))
+        try:
+            first = asyncio.ensure_future(geocoding.fetch_coordinates_from_geo_admin("Bahnhofplatz 1, Bern"))
+            second = asyncio.ensure_future(geocoding.fetch_coordinates_from_geo_admin("Bahnhofplatz 1, Bern"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+        finally:
+            await geocoding.close_http_client()
+
+    assert asyncio.run(run()) == (46.94, 7.44)
+    assert len(calls) == 1
+
+
+def test_geocode_many_dedupes_and_bounds_concurrency(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+    looked_up = []
+
+    async def fake_lookup(address):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        looked_up.append(address)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if address.startswith("Broken"):
+            raise geocoding.GeocodingError("upstream down")
+        if address.startswith("Garbled"):
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return None if address.startswith("Nowhere") else (46.9, 7.4)
+
+    monkeypatch.setattr(geocoding, "lookup_coordinates", fake_lookup)
+    addresses = [f"Street {i}, 3000 Bern" for i in range(12)] + [
+        "street 0 3000 bern", "Nowhere 1", "Broken 1", "Garbled 1",
+    ]
+
+    async def collect():
+        return [item async for item in geocoding.geocode_many(addresses, concurrency=3)]
+
+    results = asyncio.run(collect())
+
+    assert max_in_flight == 3
+    assert len(looked_up) == 15  # "street 0 3000 bern" is a duplicate of "Street 0, 3000 Bern"
+    by_index = {index: (coordinates, error) for indexes, coordinates, error in results for index in indexes}
+    assert sorted(by_index) == list(range(len(addresses)))
+    assert by_index[12] == by_index[0] == ((46.9, 7.4), None)
+    assert by_index[13] == (None, None)
+    assert by_index[14] == (None, "upstream down")
+    assert by_index[15] == (None, "Geocoding failed: ValueError")
@@ -0,0 +1,124 @@
+import io
+from datetime import date, datetime
+
+from app import crud, ingest, models, schemas
+
+FEED_CSV = """store_id,product_name,sale_price,original_price,valid_until,description,image_url
+{store},Vollmilch 1L,1.45,1.80,2030-01-07,,
+{store},Butter 250g,2.95,,2030-01-07,Vorzugsbutter,
+{store},Brot,not-a-price,,2030-01-07,,
+999,Käse,4.50,,2030-01-07,,
+"""
+
+
+def _ingest(db, text, fmt="csv", batch_size=2):
+    return ingest.ingest_promotions(db, ingest.iter_feed_records(io.StringIO(text), fmt), batch_size=batch_size)
+
+
+def test_iter_feed_records_csv_and_ndjson():
+    csv_records = list(ingest.iter_feed_records(io.StringIO(FEED_CSV.format(store=1))))
+    assert csv_records[0] == (2, {
+        "store_id": "1", "product_name": "Vollmilch 1L", "sale_price": "1.45",
+        "original_price": "1.80", "valid_until": "2030-01-07",
+    })
+    assert len(csv_records) == 4
+
+    ndjson = '{"store_id": 1, "product_name": "Milch", "sale_price": 1.2}\n\nnot json\n'
+    records = list(ingest.iter_feed_records(io.StringIO(ndjson), "ndjson"))
+    assert records[0] == (1, {"store_id": 1, "product_name": "Milch", "sale_price": 1.2})
+    assert records[1][0] == 3 and "_error" in records[1][1]
+
+
+def test_ndjson_values_that_are_not_objects_are_reported_per_line(db_session, make_store):
+    store = make_store()
+    feed = f'{{"store_id": {store.id}, "product_name": "Milch", "sale_price": 1.2}}\n5\nnull\ntrue\n[1]\n'
+
+    result = _ingest(db_session, feed, "ndjson", batch_size=10)
+
+    assert (result.written, result.invalid) == (1, 4)
+    assert [(error.line, error.error) for error in result.errors] == [
+        (line, "Expected a JSON object") for line in (2, 3, 4, 5)
+    ]
+
+
+def test_ingest_reports_invalid_rows_without_failing(db_session, make_store):
+    store = make_store()
+    result = _ingest(db_session, FEED_CSV.format(store=store.id))
+
+    assert (result.received, result.written, result.unchanged, result.invalid) == (4, 2, 0, 2)
+    assert result.store_ids == [store.id]
+    assert [(error.line, error.field) for error in result.errors] == [(4, "sale_price"), (5, "store_id")]
+    assert db_session.query(models.Promotion).count() == 2
+
+
+def test_reingest_only_touches_changed_rows(db_session, make_store):
+    store = make_store()
+    feed = FEED_CSV.format(store=store.id)
+    _ingest(db_session, feed)
+
+    # Backdate LastUpdated so any rewrite becomes visible
+    long_ago = datetime(2000, 1, 1)
+    db_session.query(models.Promotion).update({models.Promotion.last_updated: long_ago})
+    db_session.commit()
+
+    unchanged = _ingest(db_session, feed)
+    assert (unchanged.written, unchanged.unchanged) == (0, 2)
+    assert unchanged.store_ids == []
+
+    changed = _ingest(db_session, feed.replace("1.45,1.80", "1.25,1.80"))
+    assert (changed.written, changed.unchanged) == (1, 1)
+
+    db_session.expire_all()
+    promotions = {p.product_name: p for p in db_session.query(models.Promotion)}
+    assert len(promotions) == 2
+    assert float(promotions["Vollmilch 1L"].sale_price) == 1.25
+    assert promotions["Vollmilch 1L"].last_updated.replace(tzinfo=None) > long_ago
+    assert promotions["Butter 250g"].last_updated.replace(tzinfo=None) == long_ago
+
+
+def test_upsert_promotions_dedupes_keys_within_a_batch(db_session, make_store):
+    store = make_store()
+    rows = [
+        schemas.PromotionCreate(store_id=store.id, product_name="Milch", sale_price=price, valid_until=date(2030, 1, 1))
+        for price in (1.50, 1.40)
+    ]
+    changed = crud.upsert_promotions(db_session, rows)
+    db_session.commit()
+
+    assert len(changed) == 1
+    assert float(db_session.query(models.Promotion).one().sale_price) == 1.40
+
+
+def test_open_ended_promotions_upsert_instead_of_duplicating(db_client, db_session, make_store):
+    store = make_store()
+    body = f'{{"store_id": {store.id}, "product_name": "Milch", "sale_price": 1.2}}'
+    headers = {"content-type": "application/x-ndjson"}
+
+    first = db_client.post("/api/v1/promotions/ingest", content=body.encode(), headers=headers)
+    again = db_client.post("/api/v1/promotions/ingest", content=body.encode(), headers=headers)
+    cheaper = db_client.post("/api/v1/promotions/ingest", content=body.replace("1.2", "1.1").encode(), headers=headers)
+
+    assert (first.json()["written"], again.json()["written"], cheaper.json()["written"]) == (1, 0, 1)
+    promotion = db_session.query(models.Promotion).one()
+    assert promotion.valid_until is None
+    assert float(promotion.sale_price) == 1.1
+
+
+def test_ingest_endpoint_accepts_ndjson(db_client, db_session, make_store):
+    store = make_store()
+    body = "\n".join([
+        f'{{"store_id": {store.id}, "product_name": "Milch", "sale_price": 1.2, "valid_until": "2030-01-01"}}',
+        f'{{"store_id": {store.id}, "product_name": "Brot", "sale_price": 2.5}}',
+    ])
+    response = db_client.post(
+        "/api/v1/promotions/ingest", content=body.encode(), headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.json()["written"] == 2
+
+    response = db_client.post(
+        "/api/v1/promotions/ingest", content=FEED_CSV.format(store=store.id).encode(), headers={"content-type": "text/csv"}
+    )
+    assert response.status_code == 200
+    assert response.json()["written"] == 2
+    assert response.json()["invalid"] == 2
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import best_price, lifecycle, models
+from app.response_cache import cell_tag, response_cache, store_tag
+
+TODAY = date(2030, 3, 13)  # a Wednesday
+
+
+def _seed(db):
+    store = models.Store(name="Coop Basel", address="Marktplatz 1", latitude=47.558, longitude=7.588, cell="u0mpx")
+    db.add(store)
+    db.flush()
+    db.add_all([
+        models.Promotion(store_id=store.id, product_name="Milch", sale_price=1.10, valid_until=TODAY - timedelta(days=20)),
+        models.Promotion(store_id=store.id, product_name="Milch", sale_price=1.20, valid_until=TODAY - timedelta(days=9)),
+        models.Promotion(store_id=store.id, product_name="Butter", sale_price=2.80, valid_until=TODAY - timedelta(days=2)),
+        models.Promotion(store_id=store.id, product_name="Milch", sale_price=1.45, valid_until=TODAY + timedelta(days=4)),
+        models.Promotion(store_id=store.id, product_name="Brot", sale_price=2.50),
+    ])
+    db.commit()
+    return store
+
+
+def test_week_start_and_archive_path():
+    assert lifecycle.week_start(TODAY) == date(2030, 3, 11)
+    assert lifecycle.archive_path("arch", date(2030, 1, 1)).endswith("promotions-2030-W01.ndjson.gz")
+
+
+def test_archive_moves_expired_promotions_to_weekly_files(db_session, tmp_path):
+    _seed(db_session)
+
+    result = lifecycle.archive_expired_promotions(db_session, TODAY - timedelta(days=7), str(tmp_path), batch_size=1)
+
+    assert result["archived"] == 2
+    assert len(result["files"]) == 2
+    archived = [record for path in result["files"] for record in lifecycle.read_archive(path)]
+    assert sorted(record["sale_price"] for record in archived) == ["1.10", "1.20"]
+    assert archived[0]["product_key"] == "milch"
+    remaining = db_session.query(models.Promotion.product_name).order_by(models.Promotion.id).all()
+    assert [name for (name,) in remaining] == ["Butter", "Milch", "Brot"]
+
+    # Appending to an existing week file keeps earlier records readable
+    db_session.add(models.Promotion(store_id=1, product_name="Käse", sale_price=4, valid_until=TODAY - timedelta(days=20)))
+    db_session.commit()
+    again = lifecycle.archive_expired_promotions(db_session, TODAY - timedelta(days=7), str(tmp_path))
+    assert again["archived"] == 1
+    assert [record["product_name"] for record in lifecycle.read_archive(again["files"][0])] == ["Milch", "Käse"]
+
+
+def test_archive_invalidates_cached_responses_of_the_stores(db_session, tmp_path):
+    store = _seed(db_session)
+    response_cache.set("/api/v1/stores/1", b"{}", [store_tag(store.id)])
+    response_cache.set("/api/v1/promotions/nearby", b"[]", [cell_tag(store.cell)])
+    response_cache.set("/api/v1/stores/2", b"{}", [store_tag(store.id + 1)])
+
+    lifecycle.archive_expired_promotions(db_session, TODAY - timedelta(days=7), str(tmp_path))
+
+    assert response_cache.get("/api/v1/stores/1") is None
+    assert response_cache.get("/api/v1/promotions/nearby") is None
+    assert response_cache.get("/api/v1/stores/2") is not None
+
+
+def test_run_lifecycle_keeps_best_prices_consistent(db_session, tmp_path):
+    store = _seed(db_session)
+    best_price.rebuild(db_session, today=TODAY - timedelta(days=30))
+    db_session.commit()
+
+    result = lifecycle.run_lifecycle(db_session, today=TODAY, directory=str(tmp_path), retention_days=7)
+
+    assert result["archived"] == 2 and result["expired_best_prices"] >= 1
+    assert result["active_index"] is None  # PostgreSQL only
+    assert best_price.check_consistency(db_session, today=TODAY) == {"missing": [], "unexpected": [], "wrong_price": []}
+    prices = dict(db_session.query(models.BestPrice.product_key, models.BestPrice.sale_price))
+    assert {key: float(price) for key, price in prices.items()} == {"milch": 1.45, "brot": 2.50}
+    assert db_session.query(models.Promotion).filter(models.Promotion.store_id == store.id).count() == 3
+
+
+def test_run_lifecycle_reraises_failures_with_the_session_usable(db_session, tmp_path, monkeypatch):
+    _seed(db_session)
+
+    def fail(db, before, directory):
+        db.add(models.Promotion(store_id=None, product_name="Broken", sale_price=1))
+        db.flush()
+
+    monkeypatch.setattr(lifecycle, "archive_expired_promotions", fail)
+    with pytest.raises(IntegrityError):
+        lifecycle.run_lifecycle(db_session, today=TODAY, directory=str(tmp_path))
+    assert db_session.query(models.Promotion).count() == 5
+
+
+def test_lifecycle_loop_purges_the_geocode_cache(monkeypatch):
+    purged = []
+    monkeypatch.setattr(lifecycle.geocode_cache, "purge_expired", lambda: purged.append(True) or 0)
+
+    def session_factory():
+        raise RuntimeError("database down")
+
+    async def run():
+        task = asyncio.create_task(lifecycle.lifecycle_loop(session_factory, interval_s=3600))
+        while not purged:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert purged
@@ -2,7 +2,11 @@ from fastapi.testclient import TestClient
 from app.main import app # Main FastAPI application
 from app import schemas # To help construct expected Pydantic models
 from app import models # To help construct mock return values from crud
-from datetime import datetime # For potential date comparisons
+from app import pagination
+from app.geocoding import GeocodingError
+from datetime import date, datetime # For potential date comparisons
+from decimal import Decimal
+import json
 
 # If crud functions are directly in app.crud
 # from app import crud # This might be needed for mocker.patch path
@@ -97,40 +101,216 @@ def test_create_new_store_invalid_payload():
 
 def test_read_store_success(mocker):
     store_id = 1
-    # Mocked return value from crud.get_store (models.Store instance)
-    mock_db_store = models.Store(
-        id=store_id,
-        name="Test Store Coop",
-        address="456 Example Ave, Bern",
-        latitude=46.9480, # Corrected: no quote before latitude
-        longitude=7.4474, # Corrected: no quote before longitude
-        chain_name="Coop",
-        geom="POINT(7.4474 46.9480)"
-        # promotions list would be empty or populated depending on what crud.get_store returns
+    # Mocked return value from crud.get_store_rows (store row in serialization.STORE_READ_FIELDS order)
+    mock_store_row = ("Test Store Coop", "456 Example Ave, Bern", 46.9480, 7.4474, "Coop", store_id)
+    mock_promotion_row = (
+        "Test Promo", Decimal("10.00"), None, date(2030, 1, 7), None, None, 5, store_id, datetime(2024, 5, 1, 12, 0, 0)
     )
-    # Example of adding a promotion to the mock store if needed for testing StoreRead with promotions
-    # mock_db_store.promotions = [models.Promotion(id=1, store_id=store_id, product_name="Test Promo", sale_price=10.0, last_updated=datetime.utcnow())]
 
-    mock_crud_get_store = mocker.patch('app.crud.get_store', return_value=mock_db_store)
+    mock_crud_get_store_rows = mocker.patch(
+        'app.crud.get_store_rows', return_value=(mock_store_row, [mock_promotion_row])
+    )
 
     response = client.get(f"/api/v1/stores/{store_id}")
 
     assert response.status_code == 200
     data = response.json()
-    assert data["id"] == mock_db_store.id
-    assert data["name"] == mock_db_store.name
-    assert data["address"] == mock_db_store.address
-    # assert len(data["promotions"]) == len(mock_db_store.promotions) # If promotions are mocked
+    assert data["id"] == store_id
+    assert data["name"] == "Test Store Coop"
+    assert data["address"] == "456 Example Ave, Bern"
+    assert data["promotions"] == [{
+        "product_name": "Test Promo", "sale_price": 10.0, "original_price": None, "valid_until": "2030-01-07",
+        "description": None, "image_url": None, "id": 5, "store_id": store_id, "last_updated": "2024-05-01T12:00:00",
+    }]
 
-    mock_crud_get_store.assert_called_once_with(db=mocker.ANY, store_id=store_id)
+    mock_crud_get_store_rows.assert_called_once_with(
+        db=mocker.ANY, store_id=store_id, active_only=False, promotions_limit=100, promotions_offset=0
+    )
 
 
 def test_read_store_not_found(mocker):
     store_id = 999 # An ID that presumably doesn't exist
-    mocker.patch('app.crud.get_store', return_value=None) # Simulate store not found
+    mocker.patch('app.crud.get_store_rows', return_value=None) # Simulate store not found
 
     response = client.get(f"/api/v1/stores/{store_id}")
 
     assert response.status_code == 404
     data = response.json()
     assert data["detail"] == f"Store with ID {store_id} not found"
+
+# --- Promotion Endpoint Tests ---
+
+def test_read_nearby_promotions(mocker):
+    store = models.Store(id=3, name="Coop Bern", address="Bahnhofplatz 1", latitude=46.948, longitude=7.44, chain_name="Coop")
+    promotion = models.Promotion(
+        id=7, store_id=3, product_name="Vollmilch 1L", sale_price=1.45,
+        last_updated=datetime(2024, 5, 1, 12, 0, 0),
+    )
+    mock_nearby = mocker.patch('app.crud.get_nearby_promotions', return_value=[(promotion, store, 812.5)])
+
+    response = client.get("/api/v1/promotions/nearby", params={"lat": 46.95, "lon": 7.44, "radius_m": 3000, "q": "milch"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["product_name"] == "Vollmilch 1L"
+    assert data[0]["store_name"] == "Coop Bern"
+    assert data[0]["distance_m"] == 812.5
+    mock_nearby.assert_called_once_with(
+        db=mocker.ANY, latitude=46.95, longitude=7.44, radius_m=3000, query="milch", limit=50
+    )
+
+
+def test_read_nearby_promotions_rejects_invalid_radius():
+    response = client.get("/api/v1/promotions/nearby", params={"lat": 46.95, "lon": 7.44, "radius_m": 0})
+    assert response.status_code == 422
+
+
+def test_read_geocode_cache_stats():
+    response = client.get("/api/v1/geocode/cache/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert {"hits", "misses", "evictions", "errors", "hit_ratio"} <= set(data)
+
+
+def test_geocode_address_batch_streams_ndjson(mocker):
+    async def fake_lookup(address):
+        if address == "Broken 1":
+            raise GeocodingError("upstream down")
+        return None if address == "Nowhere 1" else (46.94, 7.44)
+
+    mocker.patch('app.geocoding.lookup_coordinates', side_effect=fake_lookup)
+    addresses = ["Bundesplatz 1, 3011 Bern", "Nowhere 1", "Broken 1", "bundesplatz 1 3011 bern"]
+
+    response = client.post("/api/v1/geocode/batch", json={"addresses": addresses, "concurrency": 2})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[0]["status"] == by_index[3]["status"] == "ok"
+    assert by_index[0]["latitude"] == 46.94
+    assert by_index[1]["status"] == "not_found"
+    assert by_index[2] == {
+        "index": 2, "address": "Broken 1", "status": "error",
+        "latitude": None, "longitude": None, "error": "upstream down",
+    }
+
+
+def test_geocode_address_batch_rejects_empty_list():
+    response = client.post("/api/v1/geocode/batch", json={"addresses": []})
+    assert response.status_code == 422
+
+
+def test_bulk_import_stores_json_and_csv(db_client, db_session):
+    payload = [
+        {"name": "Coop Bern", "address": "Bahnhofplatz 1", "latitude": 46.948, "longitude": 7.44, "chain_name": "Coop"},
+        {"name": "Denner Thun", "address": "Bälliz 2", "latitude": 46.758, "longitude": 7.628},
+    ]
+    response = db_client.post("/api/v1/stores/bulk", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["received"], data["written"]) == (2, 2)
+    assert data["rows_per_second"] > 0
+
+    csv_body = "name,address,latitude,longitude,chain_name\nCoop Bern,Bahnhofplatz 1,46.95,7.44,Coop\nLidl Biel,Zentralstrasse 3,47.14,7.25,\n"
+    response = db_client.post("/api/v1/stores/bulk?chunk_size=1", content=csv_body.encode(), headers={"content-type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json()["written"] == 2
+
+    stores = {store.name: store for store in db_session.query(models.Store)}
+    assert sorted(stores) == ["Coop Bern", "Denner Thun", "Lidl Biel"]
+    assert stores["Coop Bern"].latitude == 46.95
+    assert stores["Lidl Biel"].chain_name is None
+
+    response = db_client.post("/api/v1/stores/bulk", json=[{"name": "Missing coordinates"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == [0, "address"]
+
+
+def test_read_store_pages_promotions(db_client, db_session):
+    store = models.Store(name="Denner Biel", address="Bahnhofplatz 5", latitude=47.13, longitude=7.24)
+    store.promotions = [
+        models.Promotion(product_name=f"Item {i}", sale_price=1.0 + i) for i in range(5)
+    ]
+    db_session.add(store)
+    db_session.commit()
+
+    response = db_client.get(f"/api/v1/stores/{store.id}", params={"promotions_limit": 2, "promotions_offset": 2})
+
+    assert response.status_code == 200
+    assert [p["product_name"] for p in response.json()["promotions"]] == ["Item 2", "Item 3"]
+    assert db_client.get(f"/api/v1/stores/{store.id}", params={"promotions_limit": 5000}).status_code == 422
+
+
+def test_list_stores_and_promotions_with_cursors(db_client, db_session):
+    for i in range(5):
+        store = models.Store(name=f"Store {i}", address=f"Weg {i}", latitude=46.9, longitude=7.4, chain_name="Coop")
+        store.promotions = [models.Promotion(product_name=f"Brot {i}", sale_price=5.0 - i)]
+        db_session.add(store)
+    db_session.commit()
+
+    names, cursor = [], None
+    while True:
+        params = {"limit": 2, "chain_name": "Coop", "include_promotions": True}
+        if cursor:
+            params["cursor"] = cursor
+        page = db_client.get("/api/v1/stores", params=params).json()
+        names += [item["name"] for item in page["items"]]
+        assert all(len(item["promotions"]) == 1 for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert names == [f"Store {i}" for i in range(5)]
+
+    first = db_client.get("/api/v1/promotions", params={"q": "brot", "limit": 3}).json()
+    assert [p["sale_price"] for p in first["items"]] == [1.0, 2.0, 3.0]
+    second = db_client.get("/api/v1/promotions", params={"q": "brot", "limit": 3, "cursor": first["next_cursor"]}).json()
+    assert [p["sale_price"] for p in second["items"]] == [4.0, 5.0]
+    assert second["next_cursor"] is None
+
+    # A stores cursor cannot be replayed against the promotions listing
+    stores_cursor = db_client.get("/api/v1/stores", params={"limit": 1}).json()["next_cursor"]
+    assert db_client.get("/api/v1/promotions", params={"cursor": stores_cursor}).status_code == 400
+    assert db_client.get("/api/v1/stores", params={"cursor": "garbage!"}).status_code == 400
+    # Well-formed but forged cursors are rejected too
+    for forged in (["x"], [None], [{"a": 1}], [1e400]):
+        forged_cursor = pagination.encode_cursor("stores", forged)
+        assert db_client.get("/api/v1/stores", params={"cursor": forged_cursor}).status_code == 400
+    response = db_client.get("/api/v1/promotions", params={"cursor": stores_cursor})
+    assert response.json()["detail"] == "Cursor does not belong to this listing"
+    for forged in (["NaN", 1], ["Infinity", 1], ["-inf", 1], ["1.5", "x"]):
+        forged_cursor = pagination.encode_cursor("promotions", forged)
+        assert db_client.get("/api/v1/promotions", params={"cursor": forged_cursor}).status_code == 400
+
+    # Wildcards in the search text match literally
+    assert db_client.get("/api/v1/promotions", params={"q": "%"}).json()["items"] == []
+    assert db_client.get("/api/v1/promotions", params={"q": "Brot_"}).json()["items"] == []
+
+
+def test_read_store_is_cached_with_etag_until_ingest(db_client, db_session):
+    store = models.Store(name="Coop Thun", address="Bälliz 1", latitude=46.758, longitude=7.628)
+    db_session.add(store)
+    db_session.commit()
+    url = f"/api/v1/stores/{store.id}"
+
+    first = db_client.get(url)
+    assert first.headers["X-Cache"] == "MISS"
+    second = db_client.get(url)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.content == first.content and second.json()["name"] == "Coop Thun"
+
+    not_modified = db_client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+
+    feed = json.dumps({"store_id": store.id, "product_name": "Rösti", "sale_price": 3.2})
+    assert db_client.post("/api/v1/promotions/ingest", content=feed).json()["written"] == 1
+
+    fresh = db_client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert fresh.status_code == 200 and fresh.headers["X-Cache"] == "MISS"
+    assert [p["product_name"] for p in fresh.json()["promotions"]] == ["Rösti"]
+
+    stats = db_client.get("/api/v1/cache/stats").json()
+    assert (stats["hits"], stats["misses"], stats["not_modified"], stats["invalidations"]) == (2, 2, 1, 1)
+    assert stats["bytes_saved"] == 2 * len(first.content)
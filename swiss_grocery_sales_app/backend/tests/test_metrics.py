@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app import geocoding, metrics, models
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, route="/a")
+
+    lines = histogram.samples()
+
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.65' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+
+
+def test_counter_escapes_label_values():
+    counter = metrics.Counter("errors_total", "Errors.", ("error",))
+    counter.inc(error='say "hi"\n')
+    counter.inc(2, error='say "hi"\n')
+
+    assert counter.samples() == ['errors_total{error="say \\"hi\\"\\n"} 3']
+
+
+def test_engine_events_count_queries_of_current_request(db_engine, db_session):
+    metrics.instrument_engine(db_engine)
+    stats = metrics.RequestStats()
+    token = metrics.current_request.set(stats)
+    try:
+        db_session.query(models.Store).all()
+        db_session.query(models.Promotion).count()
+    finally:
+        metrics.current_request.reset(token)
+    db_session.query(models.Store).all()  # Outside the request: global histogram only
+
+    assert stats.queries == 2
+    assert stats.query_seconds > 0
+    assert metrics.DB_QUERY_DURATION.count() == 3
+
+
+def test_metrics_endpoint_reports_route_templates(db_client, db_engine):
+    metrics.instrument_engine(db_engine)
+
+    response = db_client.get("/api/v1/stores/123")
+    assert response.status_code == 404
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    db_client.get("/no/such/path")
+
+    body = db_client.get("/metrics").text
+
+    # Each worker's series is labelled with its pid
+    pid = f'pid="{os.getpid()}"'
+    assert f'http_requests_total{{{pid},method="GET",route="/api/v1/stores/{{store_id}}",status="404"}} 1' in body
+    assert f'http_requests_total{{{pid},method="GET",route="unmatched",status="404"}} 1' in body
+    assert f'http_request_duration_seconds_count{{{pid},method="GET",route="/api/v1/stores/{{store_id}}"}} 1' in body
+    assert f'db_queries_per_request_bucket{{{pid},route="/api/v1/stores/{{store_id}}",le="0"}} 0' in body
+    assert "# TYPE db_pool_checkout_wait_seconds histogram" in body
+
+
+def test_profiling_header_writes_collapsed_stacks(db_client, monkeypatch, tmp_path):
+    db_client.get("/api/v1/cache/stats", headers={"X-Profile": "1"})
+    assert not tmp_path.exists() or not os.listdir(tmp_path)  # Disabled by default
+
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+    response = db_client.get("/api/v1/cache/stats", headers={"X-Profile": "1"})
+
+    path = response.headers["X-Profile-Path"]
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.exists(path)
+
+
+def test_geoadmin_latency_and_errors_are_recorded(mocker):
+    mocker.patch("app.geocoding.geocode_cache.get_async", return_value=geocoding.MISS)
+    mocker.patch("app.geocoding.geocode_cache.set_async")
+
+    async def run():
+        await geocoding.start_http_client(httpx.MockTransport(lambda request: httpx.Response(503)))
+        try:
+            return await geocoding.fetch_coordinates_from_geo_admin("Bundesplatz 1, 3011 Bern")
+        finally:
+            await geocoding.close_http_client()
+
+    assert asyncio.run(run()) is None
+    assert metrics.GEOADMIN_ERRORS.value(error="HTTPStatusError") == 1
+    assert metrics.GEOADMIN_REQUEST_DURATION.count(outcome="error") == 1
+
+
+def test_startup_gauges_report_this_worker(db_client):
+    metrics.mark_ready()
+    db_client.get("/api/v1/cache/stats")
+
+    body = db_client.get("/metrics").text
+
+    pid = str(os.getpid())
+    assert f'app_startup_seconds{{pid="{pid}",phase="ready"}}' in body
+    assert f'app_startup_seconds{{pid="{pid}",phase="first_request"}}' in body
+    assert f'process_resident_memory_bytes{{pid="{pid}"}}' in body
+    assert metrics.PROCESS_STARTED_AT <= metrics._IMPORTED_AT
@@ -0,0 +1,9 @@
+from decimal import Decimal
+
+from app.money import to_centimes
+
+
+def test_to_centimes_is_exact_for_decimals_and_floats():
+    assert to_centimes(Decimal("1.45")) == 145
+    assert to_centimes(0.1 + 0.2) == 30
+    assert to_centimes(2) == 200
@@ -0,0 +1,20 @@
+import pytest
+
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip_is_url_safe():
+    token = encode_cursor("promotions", ["1.45", 12345])
+    assert "=" not in token and "+" not in token and "/" not in token
+    assert decode_cursor("promotions", token, 2) == ["1.45", 12345]
+
+
+@pytest.mark.parametrize("token", ["", "not base64 !", encode_cursor("promotions", [1])])
+def test_decode_cursor_rejects_malformed_tokens(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor("promotions", token, 2)
+
+
+def test_decode_cursor_rejects_other_listing():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("stores", encode_cursor("promotions", ["1.45", 1]), 2)
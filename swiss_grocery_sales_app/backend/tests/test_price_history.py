@@ -0,0 +1,63 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+from app import ingest, models, price_history
+
+NOW = datetime(2030, 6, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def test_price_stats_over_window(db_session, make_store):
+    store = make_store()
+    other = make_store("Coop Bern")
+    observations = [
+        ("vollmilch 1l", store.id, price, NOW - timedelta(days=days))
+        for days, price in ((400, "0.50"), (200, "1.60"), (100, "1.45"), (10, "1.20"), (1, "1.90"))
+    ] + [("vollmilch 1l", other.id, "1.30", NOW - timedelta(days=5))]
+    assert price_history.record_observations(db_session, observations) == 6
+    # Repeating an observation does not add a row
+    assert price_history.record_observations(db_session, observations[:1]) == 0
+    db_session.commit()
+
+    stats = price_history.price_stats(db_session, "Vollmilch  1L", days=365, now=NOW)
+    assert (stats["observations"], stats["min_price"], stats["median_price"], stats["max_price"]) == (5, 1.2, 1.45, 1.9)
+    at_store = price_history.price_stats(db_session, "vollmilch 1l", days=365, store_id=store.id, now=NOW)
+    assert (at_store["observations"], at_store["median_price"]) == (4, 1.525)
+    assert price_history.price_stats(db_session, "unknown", now=NOW) is None
+
+
+def test_ingest_appends_observations_for_changed_prices(db_session, make_store):
+    store = make_store()
+    feed = '{{"store_id": {}, "product_name": "Butter 250g", "sale_price": {}, "valid_until": "2030-01-07"}}'
+
+    def run(price):
+        return ingest.ingest_promotions(
+            db_session, ingest.iter_feed_records(io.StringIO(feed.format(store.id, price)), "ndjson")
+        )
+
+    run(2.95)
+    run(2.95)  # unchanged: no new observation
+    run(2.50)
+    prices = [cents for (cents,) in db_session.query(models.PriceObservation.price_cents).order_by(models.PriceObservation.observed_at)]
+    assert prices == [295, 250]
+    assert db_session.query(models.PriceHistoryProduct.product_key).scalar() == "butter 250g"
+
+
+def test_price_stats_endpoint(db_client, db_session, make_store):
+    store = make_store()
+    price_history.record_observations(db_session, [("brot", store.id, 2.5, datetime.now(timezone.utc) - timedelta(days=1))])
+    db_session.commit()
+
+    response = db_client.get("/api/v1/price-history/stats", params={"product": "Brot", "days": 30})
+    assert response.status_code == 200
+    assert response.json()["median_price"] == 2.5
+    assert db_client.get("/api/v1/price-history/stats", params={"product": "Käse"}).status_code == 404
+
+
+def test_record_promotions_defaults_to_the_current_utc_time(db_session, make_store):
+    store = make_store()
+    before = datetime.now(timezone.utc)
+    promotion = models.Promotion(store_id=store.id, product_name="Brot", product_key="brot", sale_price=2.5)
+    assert price_history.record_promotions(db_session, [promotion]) == 1
+    (observed_at,) = db_session.query(models.PriceObservation.observed_at).one()
+    # SQLite returns the stored UTC time without its offset
+    assert abs(observed_at.replace(tzinfo=timezone.utc) - before) < timedelta(minutes=1)
@@ -0,0 +1,101 @@
+import pytest
+
+from app import subscriptions
+from app.response_cache import RESPONSE_CACHE_UNSHARED_TTL_S, LRUBackend, ResponseCache, cache_key, cell_tag, etag_matches, store_tag
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_key_ignores_parameter_order():
+    assert cache_key("/a", [("lon", "7"), ("lat", "46")]) == cache_key("/a", [("lat", "46"), ("lon", "7")])
+    assert cache_key("/a", [("lat", "46")]) != cache_key("/b", [("lat", "46")])
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+
+
+def test_invalidation_by_store_and_cell():
+    cache = ResponseCache()
+    cache.set("store-1", b"{}", [store_tag(1)])
+    cache.set("nearby", b"[]", [cell_tag("u0m71"), store_tag(2)])
+    cache.set("other", b"[]", [cell_tag("u0m4b")])
+
+    assert cache.invalidate_stores([1], ["u0m71"]) == 2
+    assert cache.get("store-1") is None and cache.get("nearby") is None
+    assert cache.get("other") is not None
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    cache = ResponseCache(backend=LRUBackend(max_entries=3, max_bytes=10))
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    cache.get("a")
+    cache.set("c", b"1234")  # 12 bytes > 10: evicts b, the least recently used
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 8 and cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl_s=60, clock=clock)
+    entry = cache.set("a", b"{}")
+    clock.now = 59
+    assert cache.get("a") == entry
+    clock.now = 60
+    assert cache.get("a") is None
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(enabled=False)
+    assert cache.set("a", b"{}").etag.startswith('"')
+    assert cache.get("a") is None and cache.stats()["size"] == 0
+
+
+def test_invalidations_reach_the_other_workers():
+    sent = []
+    writer, reader = ResponseCache(), ResponseCache()
+    writer.share_with_workers(2, sent.append)
+    reader.share_with_workers(2, lambda tags: None)
+    reader.set("store-1", b"{}", [store_tag(1)])
+    reader.set("other", b"{}", [store_tag(3)])
+
+    writer.invalidate_stores([1], ["u0m71"])
+    # What the listener of the other worker does with the NOTIFY payloads
+    for payload in subscriptions.json_array_payloads(sent[0]):
+        reader.apply_notification(payload)
+
+    assert reader.get("store-1") is None and reader.get("other") is not None
+    with pytest.raises(ValueError):
+        reader.apply_notification('{"tags": 1}')
+
+
+def test_failed_publish_does_not_fail_the_write():
+    def publish(tags):
+        raise ConnectionError("gone")
+
+    cache = ResponseCache()
+    cache.share_with_workers(2, publish)
+    cache.set("store-1", b"{}", [store_tag(1)])
+    assert cache.invalidate_stores([1]) == 1
+
+
+def test_unshared_workers_get_a_short_ttl():
+    single, several = ResponseCache(ttl_s=300), ResponseCache(ttl_s=300)
+    single.share_with_workers(1)
+    several.share_with_workers(4)
+    assert single.ttl_s == 300 and several.ttl_s == RESPONSE_CACHE_UNSHARED_TTL_S
@@ -0,0 +1,56 @@
+from app.search import CachedSearchIndex, ProductSearchIndex, containment, trigrams
+
+
+def test_trigrams_match_pg_trgm_padding():
+    assert trigrams("Milch") == {"  m", " mi", "mil", "ilc", "lch", "ch "}
+    assert trigrams("a-b") == {"  a", " a ", "  b", " b "}
+    assert trigrams(None) == frozenset()
+
+
+def test_containment():
+    assert containment(trigrams("milch"), trigrams("Vollmilch 1L")) == 4 / 6
+    assert containment(trigrams("milk"), trigrams("Milch")) == 3 / 5
+    assert containment(frozenset(), trigrams("Milch")) == 0.0
+
+
+def test_search_index_ranks_name_over_description():
+    index = ProductSearchIndex()
+    index.extend([
+        (1, "Milch", None),
+        (2, "Vollmilch 1L", "Schweizer Milch"),
+        (3, "Kaffee", "mit Milch"),
+        (4, "Brot", "Ruchbrot"),
+    ])
+    assert len(index) == 4
+
+    results = index.search("Milch")
+    assert [key for key, _ in results] == [1, 2, 3]
+    assert results[0][1] == 1.0
+    assert results[1][1] == 4 / 6  # name match beats the weighted description match (0.5)
+    assert results[2][1] == 0.5  # description-only matches are weighted down
+
+    assert [key for key, _ in index.search("milk")] == [1]
+    assert index.search("Käse") == []
+    assert index.search("   ") == []
+
+
+def test_cached_search_index_reloads_on_invalidate_ttl_and_source():
+    now = [0.0]
+    loads = []
+
+    def load():
+        loads.append(now[0])
+        return [(1, "Milch", None)]
+
+    cache = CachedSearchIndex(ttl_s=10, clock=lambda: now[0])
+    first = cache.get("db1", load)
+    assert cache.get("db1", load) is first and len(loads) == 1
+    assert [key for key, _ in first.search("milch")] == [1]
+
+    cache.invalidate()
+    assert cache.get("db1", load) is not first
+    now[0] = 11.0
+    cache.get("db1", load)
+    cache.get("db2", load)
+    assert len(loads) == 4
+    assert cache.stats() == {"documents": 1, "last_load_ms": cache.stats()["last_load_ms"], "loads": 4, "invalidations": 1}
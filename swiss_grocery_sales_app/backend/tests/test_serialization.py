@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+import pytest
+
+from app import crud, models, schemas, serialization
+
+
+def _promotions():
+    return [
+        models.Promotion(product_name="Vollmilch 1L", sale_price=Decimal("1.45"), original_price=Decimal("1.80"),
+                         valid_until=date(2030, 1, 7), description="Bio", image_url="https://example.ch/m.png",
+                         last_updated=datetime(2024, 5, 1, 12, 0, 0, 123456)),
+        models.Promotion(product_name="Käse \"Gruyère\"", sale_price=3, last_updated=datetime(2024, 5, 2)),
+        models.Promotion(product_name="Expired", sale_price=2.5, valid_until=date.today() - timedelta(days=1),
+                         last_updated=datetime(2024, 5, 3, 8, 30)),
+    ]
+
+
+@pytest.mark.parametrize("active_only", [False, True])
+def test_store_read_json_matches_pydantic_bytes(db_session, make_store, active_only):
+    store = make_store("Migros Zürich «HB»", 47.378, 8.54, chain_name=None, address="Bahnhofplatz 15", promotions=_promotions())
+
+    expected = schemas.StoreRead.model_validate(
+        crud.get_store(db_session, store.id, active_only=active_only, promotions_limit=100)
+    ).model_dump_json().encode()
+    db_session.expunge_all()
+    fast = serialization.store_read_json(
+        *crud.get_store_rows(db_session, store.id, active_only=active_only, promotions_limit=100)
+    )
+    assert fast == expected
+
+
+def test_store_read_json_formats_like_pydantic():
+    row = ("A", "B", 46.9, 7, None, 1)
+    promotion = ("Brot", Decimal("2"), None, None, None, None, 1, 1, datetime(2024, 1, 1, tzinfo=timezone.utc))
+    body = serialization.store_read_json(row, [promotion])
+    assert b'"longitude":7.0' in body and b'"last_updated":"2024-01-01T00:00:00Z"' in body
+
+
+def test_get_store_rows_unknown_store(db_session):
+    assert crud.get_store_rows(db_session, 12345) is None
+
+
+def test_float_fields_are_detected_in_optional_annotations():
+    assert serialization._is_float_field(float)
+    assert serialization._is_float_field(Optional[float])
+    assert not serialization._is_float_field(Optional[int])
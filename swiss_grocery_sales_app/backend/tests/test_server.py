@@ -0,0 +1,48 @@
+import uvicorn
+
+from app import server
+
+
+def test_cgroup_v2_cpu_limit(tmp_path):
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) == 1.5
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_cgroup_v1_cpu_limit(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("200000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) == 2.0
+
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    assert server.cgroup_cpu_limit(str(tmp_path)) is None
+
+
+def test_default_workers_follow_cpu_quota(monkeypatch):
+    monkeypatch.setattr(server, "WEB_CONCURRENCY", 0)
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    monkeypatch.setattr(server, "cgroup_cpu_limit", lambda: 2.5)
+    assert server.default_workers() == 3
+
+    monkeypatch.setattr(server, "SERVER_MAX_WORKERS", 2)
+    assert server.default_workers() == 2
+
+    monkeypatch.setattr(server, "WEB_CONCURRENCY", 5)
+    assert server.default_workers() == 5
+
+
+def test_log_config_includes_app_loggers():
+    config = server.log_config("debug")
+    assert config["loggers"]["app"]["level"] == "DEBUG"
+
+
+def test_main_exports_the_worker_count(monkeypatch):
+    runs = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **options: runs.append(options))
+    monkeypatch.setenv("WEB_CONCURRENCY", "0")
+    monkeypatch.setattr(server, "default_workers", lambda: 3)
+    server.main([])
+    assert runs[0]["workers"] == 3 and server.worker_count() == 3
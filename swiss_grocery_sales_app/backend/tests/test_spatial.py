@@ -0,0 +1,61 @@
+import math
+
+import pytest
+
+from app.spatial import EARTH_RADIUS_M, bounding_box, geohash, geohash_cells_for_radius, haversine_m, lv95_to_wgs84
+
+BERN = (46.947975, 7.447447)
+ZURICH_HB = (47.378177, 8.540192)
+
+
+def test_haversine_known_distance():
+    """Bern to Zurich HB is roughly 95 km as the crow flies."""
+    distance = haversine_m(*BERN, *ZURICH_HB)
+    assert 94000 < distance < 96000
+    assert haversine_m(*BERN, *BERN) == 0
+
+
+def test_bounding_box_contains_radius():
+    min_lat, min_lon, max_lat, max_lon = bounding_box(*BERN, 1000)
+    assert haversine_m(BERN[0], BERN[1], max_lat, BERN[1]) == pytest.approx(1000, rel=0.01)
+    assert haversine_m(BERN[0], BERN[1], BERN[0], max_lon) == pytest.approx(1000, rel=0.01)
+    assert min_lat < BERN[0] < max_lat and min_lon < BERN[1] < max_lon
+
+
+def test_bounding_box_contains_points_on_circle():
+    """Every point exactly radius_m away, whatever the bearing, lies inside the box."""
+    radius = 5000
+    angle = radius / EARTH_RADIUS_M
+    lat1, lon1 = math.radians(BERN[0]), math.radians(BERN[1])
+    min_lat, min_lon, max_lat, max_lon = bounding_box(*BERN, radius)
+    for step in range(3600):
+        bearing = math.radians(step / 10)
+        lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+        lon2 = lon1 + math.atan2(
+            math.sin(bearing) * math.sin(angle) * math.cos(lat1), math.cos(angle) - math.sin(lat1) * math.sin(lat2)
+        )
+        point = (math.degrees(lat2), math.degrees(lon2))
+        assert haversine_m(*BERN, *point) == pytest.approx(radius)
+        assert min_lat <= point[0] <= max_lat and min_lon <= point[1] <= max_lon
+
+
+def test_geohash_known_value():
+    assert geohash(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    assert geohash(*BERN) == geohash(*BERN, precision=7)[:5]
+
+
+def test_geohash_cells_for_radius_cover_every_point_in_radius():
+    cells = geohash_cells_for_radius(*BERN, 6000)
+    assert geohash(*BERN) in cells
+    for i in range(200):
+        lat = BERN[0] + (i % 20 - 10) * 0.005
+        lon = BERN[1] + (i // 20 - 5) * 0.015
+        if haversine_m(*BERN, lat, lon) <= 6000:
+            assert geohash(lat, lon) in cells
+
+
+def test_lv95_to_wgs84_matches_swisstopo_reference():
+    # Worked example from swisstopo's approximate formulas: 46° 2' 38.87", 8° 43' 49.79"
+    latitude, longitude = lv95_to_wgs84(2700000, 1100000)
+    assert latitude == pytest.approx(46 + 2 / 60 + 38.87 / 3600, abs=1e-5)
+    assert longitude == pytest.approx(8 + 43 / 60 + 49.79 / 3600, abs=1e-5)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import random
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, models, schemas, spatial, subscriptions
+from app.main import app
+from app.subscriptions import Broker, PriceEvent, SubscriptionIndex
+
+BERN = (46.948, 7.444)
+ZURICH = (47.378, 8.540)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = Broker()
+    monkeypatch.setattr(subscriptions, "broker", broker)
+    return broker
+
+
+def _request(q="Vollmilch", location=BERN, radius_m=3000, max_price=2.0):
+    return schemas.PriceAlertSubscription(q=q, latitude=location[0], longitude=location[1], radius_m=radius_m, max_price=max_price)
+
+
+def _event(product_name="Vollmilch 1L", price=1.5, location=BERN, promotion_id=1):
+    return PriceEvent(
+        promotion_id, 7, "Coop Bern", "Coop", product_name, product_name.lower(), price, *location,
+        spatial.geohash(*location, precision=models.STORE_CELL_PRECISION),
+    )
+
+
+def _subscribe(index, request, subscription_id):
+    subscription = subscriptions.Subscription(subscription_id, request, connection=None)
+    index.add(subscription)
+    return subscription
+
+
+def test_index_matches_product_price_and_radius():
+    index = SubscriptionIndex()
+    milk = _subscribe(index, _request("milch"), 1)
+    cheap = _subscribe(index, _request("vollmilch", max_price=1.0), 2)
+    _subscribe(index, _request("milch", location=ZURICH), 3)
+    _subscribe(index, _request("butter"), 4)
+
+    matches = index.match(_event())
+
+    assert [(subscription.id, round(distance)) for subscription, distance in matches] == [(milk.id, 0)]
+    assert [subscription.id for subscription, _ in index.match(_event(price=0.9))] == [milk.id, cheap.id]
+    assert index.match(_event(location=(BERN[0] + 0.04, BERN[1]))) == []  # About 4.5 km away
+
+    index.remove(milk.id)
+    index.remove(cheap.id)
+    assert index.match(_event(price=0.9)) == []
+    assert len(index) == 2
+
+
+def test_matching_only_checks_candidates_of_the_cell_and_product():
+    index = SubscriptionIndex()
+    rng = random.Random(3)
+    products = ["butter", "emmentaler", "rösti", "kaffee", "tomaten", "bananen", "joghurt", "eier"]
+    for i in range(5000):
+        location = (rng.uniform(45.9, 47.7), rng.uniform(6.0, 10.4))
+        _subscribe(index, _request(rng.choice(products), location=location), i + 1)
+    _subscribe(index, _request("milch"), 10 ** 6)
+
+    matches = index.match(_event())
+
+    assert [subscription.id for subscription, _ in matches] == [10 ** 6]
+    assert index.candidates_checked < 20
+
+
+def test_sse_stream_sends_alerts_and_unsubscribes_on_close(broker):
+    async def run():
+        connection = broker.connect()
+        subscription = broker.subscribe(connection, _request())
+        stream = subscriptions.sse_stream(connection, subscription, heartbeat_s=0.01)
+        first = await stream.__anext__()
+        heartbeat = await stream.__anext__()
+        assert broker.dispatch([_event(), _event(product_name="Butter")]) == 1
+        alert = await stream.__anext__()
+        await stream.aclose()
+        return first, heartbeat, alert
+
+    first, heartbeat, alert = asyncio.run(run())
+
+    assert first.startswith(b"event: subscribed\n")
+    assert heartbeat == b": keep-alive\n\n"
+    event, data = alert.decode().strip().split("\n")
+    assert event == "event: price_alert"
+    assert schemas.PriceAlert.model_validate_json(data[len("data: "):]).product_name == "Vollmilch 1L"
+    assert broker.stats()["subscriptions"] == 0 and broker.stats()["connections"] == 0
+
+
+def test_slow_clients_lose_oldest_alerts(broker):
+    async def run():
+        connection = broker.connect(queue_size=2)
+        broker.subscribe(connection, _request())
+        broker.dispatch([_event(promotion_id=i) for i in range(1, 6)])
+        await asyncio.sleep(0)
+        return [orjson.loads(await connection.next_alert())["promotion_id"] for _ in range(2)], connection.dropped
+
+    assert asyncio.run(run()) == ([4, 5], 3)
+
+
+def test_notify_payloads_round_trip_to_subscribers(monkeypatch, broker):
+    monkeypatch.setattr(subscriptions, "_MAX_NOTIFY_BYTES", 500)
+    events = [_event(promotion_id=i) for i in range(20)]
+
+    payloads = subscriptions.notify_payloads(events)
+
+    assert len(payloads) > 1 and all(len(payload.encode()) <= 500 for payload in payloads)
+    parsed = [subscriptions.parse_notification(payload) for payload in payloads]
+    assert [event for events in parsed for event in events] == events
+
+    # What the listener of another worker does with them
+    async def run():
+        connection = broker.connect(queue_size=len(events))
+        broker.subscribe(connection, _request())
+        for events_of_payload in parsed:
+            broker.dispatch(events_of_payload)
+        await asyncio.sleep(0)
+        return [orjson.loads(await connection.next_alert()) for _ in events]
+
+    alerts = asyncio.run(run())
+    assert [alert["promotion_id"] for alert in alerts] == list(range(20))
+    assert all(schemas.PriceAlert.model_validate(alert).type == "price_alert" for alert in alerts)
+
+
+def test_parse_notification_rejects_malformed_payloads():
+    with pytest.raises(ValueError):
+        subscriptions.parse_notification("[[1, 2]]")
+    with pytest.raises(ValueError):
+        subscriptions.parse_notification("not json")
+
+
+def test_bus_defaults_to_postgres_on_postgresql():
+    assert subscriptions.bus_for("postgresql", "auto") == "postgres"
+    assert subscriptions.bus_for("postgresql", "local") == "local"
+    assert subscriptions.bus_for("sqlite", "auto") == "local"
+    assert subscriptions.bus_for("sqlite", "postgres") == "local"
+
+
+def test_local_bus_with_several_workers_warns(db_engine, broker, caplog):
+    with caplog.at_level(logging.WARNING, logger="app.subscriptions"):
+        assert subscriptions.start(db_engine, workers=1) is None
+        assert not caplog.records
+        assert subscriptions.start(db_engine, workers=4) is None
+    assert "local bus with 4 workers" in caplog.text
+    assert broker.stats()["bus"] == "local"
+
+
+def test_ingest_pushes_alerts_over_websocket(db_client, db_session, broker):
+    store = crud.create_store(db_session, schemas.StoreCreate(name="Coop Bern", address="Bahnhofplatz 1", latitude=BERN[0], longitude=BERN[1]))
+    feed = "\n".join(orjson.dumps(row).decode() for row in (
+        {"store_id": store.id, "product_name": "Vollmilch 1L", "sale_price": 1.45},
+        {"store_id": store.id, "product_name": "Vollmilch 1L", "sale_price": 1.45, "valid_until": "2030-01-01"},
+        {"store_id": store.id, "product_name": "Butter 250g", "sale_price": 1.95},
+        {"store_id": store.id, "product_name": "Milchschokolade", "sale_price": 3.20},
+    ))
+
+    with db_client.websocket_connect("/api/v1/price-alerts/ws") as websocket:
+        websocket.send_json({"action": "subscribe", "q": "milch", "latitude": BERN[0], "longitude": BERN[1], "max_price": 2})
+        subscribed = websocket.receive_json()
+        assert subscribed["type"] == "subscribed"
+
+        assert db_client.post("/api/v1/promotions/ingest", content=feed).json()["written"] == 4
+
+        alerts = [websocket.receive_json() for _ in range(2)]
+        assert {alert["type"] for alert in alerts} == {"price_alert"}
+        assert [alert["product_name"] for alert in alerts] == ["Vollmilch 1L", "Vollmilch 1L"]
+        assert alerts[0]["subscription_id"] == subscribed["subscription_id"]
+
+        websocket.send_json({"action": "subscribe", "q": "!!!", "latitude": 0, "longitude": 0, "max_price": 1})
+        assert websocket.receive_json()["type"] == "error"
+        websocket.send_text("not json")
+        assert websocket.receive_json()["type"] == "error"
+        assert db_client.get("/api/v1/price-alerts/stats").json()["subscriptions"] == 1
+
+    assert broker.stats()["connections"] == 0
+
+
+def test_stream_endpoint_rejects_unusable_queries(broker):
+    client = TestClient(app)
+    params = {"lat": BERN[0], "lon": BERN[1], "max_price": 2}
+    assert client.get("/api/v1/price-alerts/stream", params={**params, "q": "!!!"}).status_code == 422
+    assert client.get("/api/v1/price-alerts/stream", params={**params, "q": "milch", "radius_m": 50000}).status_code == 422
+    assert broker.stats()["connections"] == 0
@@ -0,0 +1,28 @@
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas, warmup
+
+
+def test_warm_up_compiles_hot_queries(db_engine):
+    session_factory = sessionmaker(bind=db_engine)
+
+    timings = warmup.warm_up(db_engine, session_factory)
+
+    assert set(timings) == {"pool", "queries", "caches"}
+    assert warmup.compile_hot_queries(session_factory) == len(warmup.HOT_QUERIES)
+    # The warmed statements are served from the compiled cache afterwards
+    db = session_factory()
+    crud.create_store(db, schemas.StoreCreate(name="A", address="B", latitude=46.9, longitude=7.4))
+    cache_size = len(db_engine._compiled_cache)
+    crud.get_store_rows(db, 1, promotions_limit=100)
+    assert len(db_engine._compiled_cache) == cache_size
+    db.close()
+
+
+def test_failing_query_does_not_stop_warm_up(db_engine, monkeypatch):
+    def broken(db):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setitem(warmup.HOT_QUERIES, "broken", broken)
+
+    assert warmup.compile_hot_queries(sessionmaker(bind=db_engine)) == len(warmup.HOT_QUERIES) - 1